@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+بنچمارک مراحل پردازش پروکسی با داده‌های مصنوعی
+"""
+
+import os
+import io
+import sys
+import json
+import math
+import time
+import base64
+import random
+import contextlib
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import List, Dict, Any, Tuple, Optional
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+import yaml
+
+from render import render_outputs, write_outputs, YAML_DUMPER
+
+PROXY_TYPES = ['vmess', 'vless', 'ss', 'http', 'socks5']
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# ماژول‌هایی که فقط مراحل شبکه‌ای به آن‌ها نیاز دارند
+HEAVY_MODULES = ['requests', 'bs4', 'dns']
+# مراحل بنچمارک مقیاس به ترتیب اجرا
+SCALE_STAGES = ['parse', 'scan', 'fetch', 'merge', 'evict', 'save', 'render']
+CORPUS_TYPES = ['vmess', 'vless', 'ss', 'http']
+# شیب لگاریتمی بیشتر از این مقدار نشانه رفتار بدتر از خطی است
+SLOPE_WARNING = 1.3
+
+
+def synthetic_proxies(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """ساخت رکوردهای مصنوعی config.yaml با ترکیب پروتکل‌ها"""
+    rng = random.Random(seed)
+    proxies = []
+    for i in range(count):
+        ptype = PROXY_TYPES[i % len(PROXY_TYPES)]
+        server = f"5.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        port = rng.choice([443, 8080, 1080, 2053, 8388])
+        ping = rng.randint(50, 900)
+        proxy = {
+            'name': f"{server}:{port} ({ping}ms)",
+            'type': ptype,
+            'server': server,
+            'port': port,
+            'added_date': '2026-01-01',
+            'last_checked': '2026-01-01',
+            'is_active': rng.random() < 0.3,
+            'country': 'IR',
+            'ping': ping,
+            'udp': True,
+        }
+        if ptype in ['vmess', 'vless']:
+            proxy['uuid'] = f"{rng.getrandbits(128):032x}"
+            proxy['tls'] = port == 443
+            proxy['network'] = 'ws'
+            proxy['ws-opts'] = {'path': '/ws', 'headers': {'Host': f"h{i}.example.com"}}
+            if ptype == 'vmess':
+                proxy['alterId'] = 4
+                proxy['cipher'] = 'auto'
+        elif ptype == 'ss':
+            proxy['cipher'] = 'aes-256-gcm'
+            proxy['password'] = f"pw{i}"
+        proxies.append(proxy)
+    return proxies
+
+
+def synthetic_line(ptype: str, i: int, rng: random.Random) -> str:
+    """یک خط مصنوعی منبع متنی از نوع داده شده"""
+    server = f"5.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+    port = rng.choice([443, 8080, 2053, 8443])
+    if ptype == 'vmess':
+        conf = {'v': '2', 'ps': f"bench-{i}", 'add': server, 'port': str(port), 'id': f"{rng.getrandbits(128):032x}",
+                'aid': '0', 'net': 'ws', 'path': '/ws', 'host': f"h{i}.example.com", 'tls': 'tls' if port == 443 else ''}
+        return "vmess://" + base64.b64encode(json.dumps(conf).encode()).decode()
+    if ptype == 'vless':
+        return (f"vless://{rng.getrandbits(128):032x}@{server}:{port}"
+                f"?encryption=none&security=tls&type=ws&host=h{i}.example.com&path=%2Fws#bench-{i}")
+    if ptype == 'ss':
+        userinfo = base64.b64encode(f"aes-256-gcm:pw{i}".encode()).decode().rstrip('=')
+        return f"ss://{userinfo}@{server}:{port}#bench-{i}"
+    return f"{server}:{port}"
+
+
+def synthetic_corpus(size: int, seed: int = 42, duplicate_rate: float = 0.1) -> Dict[str, List[str]]:
+    """خطوط مصنوعی هر نوع منبع (درصدی از خطوط تکراری برای سنجش حذف تکراری‌ها)"""
+    rng = random.Random(seed)
+    corpus = {ptype: [] for ptype in CORPUS_TYPES}
+    for i in range(size):
+        ptype = CORPUS_TYPES[i % len(CORPUS_TYPES)]
+        lines = corpus[ptype]
+        if lines and rng.random() < duplicate_rate:
+            lines.append(rng.choice(lines))
+        else:
+            lines.append(synthetic_line(ptype, i, rng))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    """بیشترین حافظه مصرفی پروسه تا این لحظه (مگابایت)"""
+    if not HAS_RESOURCE:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # لینوکس کیلوبایت و macOS بایت گزارش می‌کند
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def scale_worker(size: int) -> Dict[str, Any]:
+    """اجرای مراحل CPU پردازش روی یک corpus مصنوعی با شبکه stub شده"""
+    import update
+    
+    corpus = synthetic_corpus(size)
+    sources = [{'name': f"bench-{ptype}", 'url': f"https://bench.invalid/{ptype}", 'type': ptype,
+                'timeout': 35, 'retries': 1, 'skip_after_failures': 3, 'sample_rate': 0.25,
+                'refresh_minutes': 120, 'emergency': False, 'enabled': True} for ptype in CORPUS_TYPES]
+    results = {'size': size, 'stages': {}}
+    
+    def timed(stage, func):
+        start = time.perf_counter()
+        value = func()
+        results['stages'][stage] = {'seconds': time.perf_counter() - start, 'rss_mb': peak_rss_mb()}
+        return value
+    
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull:
+        os.chdir(tmp_dir)
+        with contextlib.redirect_stdout(devnull):
+            manager = update.IranProxyManager()
+            
+            # stub شبکه: دانلود از corpus، همه IPها ایرانی و سلامت قطعی بر اساس hash
+            update.time.sleep = lambda seconds: None
+            bodies = {ptype: "\n".join(lines) for ptype, lines in corpus.items()}
+            manager.download_source = lambda source, raw=False: \
+                bodies[source['type']].encode('utf-8') if raw else bodies[source['type']]
+            manager.ip_is_ir = lambda ip: True
+            # پروب UDP به آدرس‌های مصنوعی (که فضای آدرس واقعی‌اند) نرود
+            manager.udp_check = False
+            manager.alive_many = lambda items, timeout=15, max_age=None: \
+                [((hash((ip, port)) % 3 != 0), 50 + hash((ip, port)) % 500) for ip, port, _, _ in items]
+            
+            # مخزن موجود: نیمی از اندازه با تاریخ‌های قدیمی تا حذف و ادغام کار واقعی انجام دهند
+            existing = synthetic_proxies(size // 2, seed=7)
+            for i, proxy in enumerate(existing):
+                proxy['added_date'] = proxy['last_checked'] = f"2026-01-{1 + i % 28:02d}"
+            manager.config = {'proxies': existing, 'metadata': {}}
+            
+            def parse_all():
+                parsed = 0
+                for ptype, lines in corpus.items():
+                    for line in lines:
+                        if manager.parse_proxy_line(line, ptype):
+                            parsed += 1
+                return parsed
+            
+            results['parsed'] = timed('parse', parse_all)
+            # مسیر سریع بایتی برای همان خطوط ip:port
+            from formats import scan_ip_ports
+            plain = bodies['http'].encode('utf-8')
+            timed('scan', lambda: scan_ip_ports(plain))
+            fetched = timed('fetch', lambda: manager.fetch_all_proxies(sources))
+            results['fetched'] = len(fetched)
+            timed('merge', lambda: manager.add_new_proxies(fetched))
+            timed('evict', manager.remove_old_proxies_with_conditions)
+            timed('save', manager.save_config)
+            timed('render', manager.create_clash_config)
+            results['pool'] = len(manager.config['proxies'])
+            manager.logger.close()
+        os.chdir(SCRIPTS_DIR)
+    return results
+
+
+def loglog_slope(points: List[Tuple[int, float]]) -> Optional[float]:
+    """شیب رگرسیون log(زمان) بر حسب log(اندازه) (۱ = خطی، ۲ = درجه دو)"""
+    points = [(n, t) for n, t in points if n > 0 and t > 0]
+    if len(points) < 2:
+        return None
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(t) for _, t in points]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def bench_scale(sizes: List[int]):
+    """زمان، حافظه و روند پیچیدگی مراحل پردازش بر حسب اندازه corpus"""
+    runs = []
+    for size in sizes:
+        # هر اندازه در پروسه جدا اجرا می‌شود تا peak RSS مستقل باشد
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), 'scale-worker', '--size', str(size)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"❌ اندازه {size:,} شکست خورد:\n{result.stderr[-2000:]}")
+            continue
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        runs.append(run)
+        
+        stages = run['stages']
+        print(f"\n📏 size={size:,} | parsed={run['parsed']:,} | fetched={run['fetched']:,} | pool={run['pool']:,}")
+        print(f"   {'stage':<8} {'seconds':>10} {'us/item':>10} {'peak_rss_mb':>12}")
+        for stage in SCALE_STAGES:
+            info = stages[stage]
+            print(f"   {stage:<8} {info['seconds']:>10.3f} {info['seconds'] * 1e6 / size:>10.1f} {info['rss_mb']:>12.1f}")
+    
+    if len(runs) < 2:
+        return
+    print(f"\n📈 شیب log-log زمان بر حسب اندازه (۱ ≈ خطی، ۲ ≈ درجه دو):")
+    for stage in SCALE_STAGES:
+        slope = loglog_slope([(run['size'], run['stages'][stage]['seconds']) for run in runs])
+        if slope is None:
+            continue
+        flag = " ⚠️ بدتر از خطی" if slope > SLOPE_WARNING else ""
+        print(f"   {stage:<8} {slope:>6.2f}{flag}")
+
+
+def bench_render(sizes: List[int]):
+    """زمان رندر همه فرمت‌ها بر حسب اندازه لیست"""
+    print(f"{'size':>10} {'render_ms':>12} {'write_ms':>12} {'us/proxy':>10}")
+    for size in sizes:
+        proxies = synthetic_proxies(size)
+        
+        start = time.perf_counter()
+        rendered = render_outputs(proxies)
+        render_ms = (time.perf_counter() - start) * 1000
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            start = time.perf_counter()
+            write_outputs(rendered, tmp_dir)
+            write_ms = (time.perf_counter() - start) * 1000
+        
+        per_proxy = (render_ms + write_ms) * 1000 / size
+        print(f"{size:>10,} {render_ms:>12.1f} {write_ms:>12.1f} {per_proxy:>10.1f}")
+
+
+def bench_startup(commands: List[str], repeat: int, size: int):
+    """زمان شروع زیردستورهای update.py در یک پوشه موقت با config.yaml مصنوعی"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, 'output'))
+        os.makedirs(os.path.join(tmp_dir, 'config'))
+        with open(os.path.join(tmp_dir, 'output', 'config.yaml'), 'w', encoding='utf-8') as f:
+            yaml.dump({'proxies': synthetic_proxies(size), 'metadata': {}}, f,
+                      Dumper=YAML_DUMPER, allow_unicode=True, sort_keys=False)
+        sources_path = os.path.join(SCRIPTS_DIR, '..', 'config', 'sources.yaml')
+        if os.path.exists(sources_path):
+            shutil.copy(sources_path, os.path.join(tmp_dir, 'config', 'sources.yaml'))
+        
+        probe = (f"import sys, time; start = time.perf_counter(); sys.path.insert(0, {SCRIPTS_DIR!r}); import update; "
+                 f"print((time.perf_counter() - start) * 1000, *[m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+        result = subprocess.run([sys.executable, '-c', probe], cwd=tmp_dir, capture_output=True, text=True)
+        fields = result.stdout.split()
+        if fields:
+            loaded = ', '.join(fields[1:]) or '-'
+            print(f"import update: {float(fields[0]):.1f}ms (ماژول‌های سنگین بارگذاری شده: {loaded})")
+        
+        print(f"{'command':<12} {'median_ms':>10} {'min_ms':>10}")
+        for command in commands:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, 'update.py'), *command.split()],
+                               cwd=tmp_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{command:<12} {statistics.median(timings):>10.1f} {min(timings):>10.1f}")
+
+
+def main():
+    """تابع اصلی"""
+    parser = argparse.ArgumentParser(description="بنچمارک مراحل پردازش پروکسی")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    render_parser = subparsers.add_parser('render', help="زمان رندر بر حسب اندازه لیست")
+    render_parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    startup_parser = subparsers.add_parser('startup', help="زمان شروع زیردستورهای update.py")
+    startup_parser.add_argument('--commands', nargs='+', default=['--help', 'stats', 'render'])
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--size', type=int, default=500, help="تعداد پروکسی در config.yaml مصنوعی")
+    
+    scale_parser = subparsers.add_parser('scale', help="زمان، حافظه و شیب پیچیدگی مراحل پردازش")
+    scale_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 30000, 100000],
+                              help="اندازه‌های corpus (تا 1000000؛ هر اندازه در پروسه جدا)")
+    worker_parser = subparsers.add_parser('scale-worker', help=argparse.SUPPRESS)
+    worker_parser.add_argument('--size', type=int, required=True)
+    
+    args = parser.parse_args()
+    if args.command == 'scale':
+        bench_scale(args.sizes)
+    elif args.command == 'scale-worker':
+        print(json.dumps(scale_worker(args.size)))
+    elif args.command == 'render':
+        bench_render(args.sizes)
+    elif args.command == 'startup':
+        bench_startup(args.commands, args.repeat, args.size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+تشخیص فرمت کل محتوای منبع و رمزگشایی یک‌باره آن
+ساب‌اسکریپشن base64، کانفیگ JSON sing-box، کانفیگ YAML کلش یا لیست ساده خطی
+لیست‌های ساده ip:port مستقیم روی بایت‌ها پیمایش می‌شوند (بدون رمزگشایی به str)
+"""
+
+import re
+import json
+import base64
+import socket
+import binascii
+from array import array
+from typing import List, Dict, Any, Optional, Tuple
+
+import yaml
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+FORMAT_BASE64 = 'base64'
+FORMAT_SINGBOX = 'singbox'
+FORMAT_CLASH = 'clash'
+FORMAT_PLAIN = 'plain'
+
+BASE64_BODY_RE = re.compile(r'[A-Za-z0-9+/=_\-\s]+')
+CLASH_PROXIES_RE = re.compile(r'^proxies:', re.MULTILINE)
+# یک خط ip:port کامل با فیلد سوم اختیاری (نشانه socks5 در منابع mixed)
+IP_PORT_LINE_RE = re.compile(
+    rb'^[ \t]*(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})[ \t]*:[ \t]*(\d{1,5})[ \t]*(:[^\r\n]*)?\r?$', re.MULTILINE)
+BLANK_LINE_RE = re.compile(rb'^[ \t]*\r?$', re.MULTILINE)
+LINK_SCHEMES = ('vmess://', 'vless://', 'ss://', 'trojan://', 'ssr://', 'hysteria2://', 'tuic://')
+
+# نوع outbound در sing-box ← نوع پروکسی در کانفیگ
+SINGBOX_TYPES = {'vmess': 'vmess', 'vless': 'vless', 'shadowsocks': 'ss', 'http': 'http', 'socks': 'socks5'}
+CLASH_TYPES = {'vmess': 'vmess', 'vless': 'vless', 'ss': 'ss', 'http': 'http', 'socks5': 'socks5'}
+
+
+class IPPortBatch:
+    """دسته آرایه‌ای پروکسی‌های ip:port (IP به صورت uint32، پورت uint16)"""
+    def __init__(self):
+        self.ips = array('I')
+        self.ports = array('H')
+        self.extra = array('B')  # ۱ = خط فیلد سوم داشت
+        self.lines = 0
+        self.rejected = 0
+        self.duplicates = 0
+    
+    def __len__(self) -> int:
+        return len(self.ips)
+    
+    def drop(self, predicate) -> int:
+        """حذف دسته‌ای رکوردهایی که predicate(ip_int) برایشان True است"""
+        keep = [i for i, ip in enumerate(self.ips) if not predicate(ip)]
+        dropped = len(self.ips) - len(keep)
+        if dropped:
+            self.ips = array('I', (self.ips[i] for i in keep))
+            self.ports = array('H', (self.ports[i] for i in keep))
+            self.extra = array('B', (self.extra[i] for i in keep))
+        return dropped
+    
+    def to_candidates(self, ptype: str) -> List[Dict[str, Any]]:
+        """تبدیل به کاندیدهای پروکسی (mixed: بدون فیلد سوم http و با آن socks5)"""
+        candidates = []
+        for ip, port, extra in zip(self.ips, self.ports, self.extra):
+            server = socket.inet_ntoa(ip.to_bytes(4, 'big'))
+            proto = ptype if ptype != 'mixed' else ('socks5' if extra else 'http')
+            candidates.append({'name': f"{server}:{port}", 'type': proto, 'server': server, 'port': port})
+        return candidates
+
+
+def scan_ip_ports(data: bytes) -> IPPortBatch:
+    """پیمایش بایت‌های لیست ip:port با regex کامپایل شده؛ خطوط نامعتبر هیچ شیء میانی نمی‌سازند"""
+    batch = IPPortBatch()
+    view = memoryview(data)
+    batch.lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+    seen = set()
+    matches = IP_PORT_LINE_RE.findall(view)
+    matched = len(matches)
+    
+    for address, port, extra in matches:
+        port = int(port)
+        # inet_pton اکتت‌های بزرگ‌تر از 255 و صفرهای ابتدایی را رد می‌کند
+        try:
+            ip = int.from_bytes(socket.inet_pton(socket.AF_INET, address.decode('ascii')), 'big')
+        except OSError:
+            batch.rejected += 1
+            continue
+        if not 0 < port < 65536:
+            batch.rejected += 1
+            continue
+        key = (ip << 16) | port
+        if key in seen:
+            batch.duplicates += 1
+            continue
+        seen.add(key)
+        batch.ips.append(ip)
+        batch.ports.append(port)
+        batch.extra.append(1 if extra else 0)
+    
+    # خطوط خالی نامعتبر شمرده نمی‌شوند (خط خالی بعد از آخرین \n خط حساب نمی‌شود)
+    if matched < batch.lines:
+        blank = len(BLANK_LINE_RE.findall(view)) - (1 if data.endswith(b'\n') else 0)
+        batch.rejected += max(batch.lines - matched - blank, 0)
+    return batch
+
+
+def decode_base64_body(text: str) -> Optional[str]:
+    """رمزگشایی کل محتوای base64 (استاندارد یا URL-safe، با یا بدون padding)"""
+    compact = ''.join(text.split())
+    if len(compact) < 16:
+        return None
+    compact += '=' * (-len(compact) % 4)
+    try:
+        if '-' in compact or '_' in compact:
+            decoded = base64.urlsafe_b64decode(compact)
+        else:
+            decoded = base64.b64decode(compact, validate=True)
+        return decoded.decode('utf-8')
+    except (binascii.Error, ValueError):
+        return None
+
+
+def sniff_format(text: str) -> Tuple[str, Any]:
+    """تشخیص فرمت محتوا؛ (فرمت، داده رمزگشایی شده) برای پرهیز از پارس دوباره"""
+    head = text.lstrip()[:1]
+    
+    if head in '{[':
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get('outbounds'), list):
+            return FORMAT_SINGBOX, data['outbounds']
+        if isinstance(data, list) and data and all(isinstance(item, dict) and 'type' in item for item in data):
+            return FORMAT_SINGBOX, data
+    
+    if CLASH_PROXIES_RE.search(text):
+        try:
+            data = yaml.load(text, Loader=YAML_LOADER)
+        except yaml.YAMLError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get('proxies'), list):
+            return FORMAT_CLASH, data['proxies']
+    
+    # لیست‌های ip:port یا لینک‌ها در اولین ':' یا '.' از این بررسی خارج می‌شوند
+    if BASE64_BODY_RE.fullmatch(text):
+        decoded = decode_base64_body(text)
+        if decoded is not None and (any(scheme in decoded for scheme in LINK_SCHEMES)
+                                    or decoded.lstrip()[:1] == '{' or CLASH_PROXIES_RE.search(decoded)):
+            return FORMAT_BASE64, decoded
+    
+    return FORMAT_PLAIN, text
+
+
+def decode_body(text: str) -> Tuple[str, List[Any]]:
+    """فرمت و رکوردهای محتوا: خطوط (base64/plain) یا دیکشنری‌ها (sing-box/کلش)"""
+    fmt, data = sniff_format(text)
+    if fmt == FORMAT_BASE64:
+        # ساب‌اسکریپشن base64 ممکن است خودش JSON یا YAML باشد
+        inner, inner_data = sniff_format(data)
+        if inner in (FORMAT_SINGBOX, FORMAT_CLASH):
+            return inner, inner_data
+        return fmt, data.splitlines()
+    if fmt == FORMAT_PLAIN:
+        return fmt, data.splitlines()
+    return fmt, data
+
+
+def ws_options(path: Any, host: Any) -> Dict[str, Any]:
+    """ws-opts به فرمت کانفیگ"""
+    return {'path': str(path or '/'), 'headers': {'Host': str(host or '')}}
+
+
+def singbox_to_proxy(outbound: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """تبدیل یک outbound sing-box به کاندید پروکسی (None = نوع پشتیبانی نشده یا ناقص)"""
+    if not isinstance(outbound, dict):
+        return None
+    ptype = SINGBOX_TYPES.get(outbound.get('type'))
+    server, port = outbound.get('server'), outbound.get('server_port')
+    if not ptype or not server or not port:
+        return None
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    
+    proxy = {'name': f"{server}:{port}", 'type': ptype, 'server': str(server), 'port': port}
+    tls = outbound.get('tls') or {}
+    
+    if ptype in ['vmess', 'vless']:
+        if not outbound.get('uuid'):
+            return None
+        proxy['uuid'] = outbound['uuid']
+        proxy['tls'] = bool(tls.get('enabled'))
+        if tls.get('server_name'):
+            proxy['sni'] = tls['server_name']
+        transport = outbound.get('transport') or {}
+        proxy['network'] = transport.get('type') or 'tcp'
+        if proxy['network'] == 'ws':
+            host = (transport.get('headers') or {}).get('Host') or server
+            proxy['ws-opts'] = ws_options(transport.get('path'), host)
+        if ptype == 'vmess':
+            proxy['alterId'] = int(outbound.get('alter_id') or 0) or 4
+            proxy['cipher'] = outbound.get('security') or 'auto'
+    
+    elif ptype == 'ss':
+        if not outbound.get('method') or 'password' not in outbound:
+            return None
+        proxy['cipher'] = outbound['method']
+        proxy['password'] = str(outbound['password'])
+    
+    return proxy
+
+
+def clash_to_proxy(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """تبدیل یک پروکسی کانفیگ کلش به کاندید پروکسی (None = نوع پشتیبانی نشده یا ناقص)"""
+    if not isinstance(entry, dict):
+        return None
+    ptype = CLASH_TYPES.get(str(entry.get('type', '')).lower())
+    server, port = entry.get('server'), entry.get('port')
+    if not ptype or not server or not port:
+        return None
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    
+    proxy = {'name': f"{server}:{port}", 'type': ptype, 'server': str(server), 'port': port}
+    
+    if ptype in ['vmess', 'vless']:
+        if not entry.get('uuid'):
+            return None
+        proxy['uuid'] = entry['uuid']
+        proxy['tls'] = bool(entry.get('tls'))
+        sni = entry.get('servername') or entry.get('sni')
+        if sni:
+            proxy['sni'] = sni
+        proxy['network'] = entry.get('network') or 'tcp'
+        if proxy['network'] == 'ws':
+            opts = entry.get('ws-opts') or {}
+            host = (opts.get('headers') or {}).get('Host') or server
+            proxy['ws-opts'] = ws_options(opts.get('path'), host)
+        if ptype == 'vmess':
+            proxy['alterId'] = int(entry.get('alterId') or 0) or 4
+            proxy['cipher'] = entry.get('cipher') or 'auto'
+    
+    elif ptype == 'ss':
+        if not entry.get('cipher') or 'password' not in entry:
+            return None
+        proxy['cipher'] = entry['cipher']
+        proxy['password'] = str(entry['password'])
+    
+    return proxy
+
+
+def structured_proxies(fmt: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """تبدیل رکوردهای sing-box یا کلش به کاندیدهای پروکسی"""
+    convert = singbox_to_proxy if fmt == FORMAT_SINGBOX else clash_to_proxy
+    proxies = []
+    for record in records:
+        try:
+            proxy = convert(record)
+        except (TypeError, ValueError):
+            continue
+        if proxy:
+            proxies.append(proxy)
+    return proxies
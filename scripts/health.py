@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+امتیاز سلامت پروکسی‌ها بر اساس تاریخچه بررسی‌ها
+EWMA دسترس‌پذیری و تاخیر با کاهش اعتبار در طول زمان
+سرعت دانلود اندازه‌گیری شده (speed_kbps) فقط در ترتیب خروجی‌ها اثر دارد
+"""
+
+import heapq
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+HEALTH_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# وزن بررسی جدید در EWMA
+HEALTH_ALPHA = 0.3
+# پیش‌فرض دسترس‌پذیری پروکسی بدون تاریخچه
+UPTIME_PRIOR = 0.5
+# نیمه‌عمر اعتبار تاریخچه (ساعت)؛ پس از آن امتیاز به سمت پیش‌فرض برمی‌گردد
+HALF_LIFE_HOURS = 24
+# تاخیری که امتیاز تاخیر را نصف می‌کند (میلی‌ثانیه)
+LATENCY_SCALE_MS = 1000
+# امتیاز کمتر از این مقدار یعنی پروکسی عملا مرده است
+DEAD_SCORE = 0.3
+# حداقل امتیاز پروکسی فعال سالم
+HEALTHY_SCORE = 0.5
+# سرعتی که ضریب سرعت را در میانه قرار می‌دهد (KB/s)؛ پروکسی بدون اندازه‌گیری همین ضریب را می‌گیرد
+THROUGHPUT_SCALE_KBPS = 256
+
+
+def parse_time(value: Any) -> Optional[datetime]:
+    """پارس زمان ذخیره شده (تاریخ تنها هم پذیرفته می‌شود)"""
+    for fmt in [HEALTH_TIME_FORMAT, '%Y-%m-%d']:
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def seed_health(proxy: Dict[str, Any]) -> Dict[str, Any]:
+    """تاریخچه اولیه برای رکوردهای قدیمی بدون health (یک بررسی بر اساس is_active)"""
+    alive = bool(proxy.get('is_active'))
+    return {
+        'uptime': 1.0 if alive else 0.0,
+        'latency': float(proxy.get('ping') or 0) if alive else 0.0,
+        'checks': 1,
+        'updated': str(proxy.get('last_checked') or proxy.get('added_date') or ''),
+    }
+
+
+def update_health(proxy: Dict[str, Any], alive: bool, ping: int, now: Optional[datetime] = None,
+                  alpha: float = HEALTH_ALPHA) -> Dict[str, Any]:
+    """افزودن نتیجه یک بررسی به تاریخچه سلامت پروکسی"""
+    now = now or datetime.now()
+    health = proxy.get('health')
+    if not health:
+        health = {'uptime': 1.0 if alive else 0.0, 'latency': float(ping) if alive else 0.0, 'checks': 0}
+    else:
+        health = dict(health)
+        health['uptime'] = alpha * (1.0 if alive else 0.0) + (1 - alpha) * health.get('uptime', UPTIME_PRIOR)
+        if alive and ping:
+            previous = health.get('latency') or float(ping)
+            health['latency'] = alpha * ping + (1 - alpha) * previous
+    
+    health['uptime'] = round(health['uptime'], 4)
+    health['latency'] = round(health['latency'], 1)
+    health['checks'] = health.get('checks', 0) + 1
+    health['updated'] = now.strftime(HEALTH_TIME_FORMAT)
+    proxy['health'] = health
+    return health
+
+
+def stable_health(health: Dict[str, Any]) -> Dict[str, Any]:
+    """نمای پایدار تاریخچه سلامت برای هش محتوا: دسترس‌پذیری گرد شده و روز آخرین بررسی"""
+    return {
+        'uptime': round(float(health.get('uptime', UPTIME_PRIOR)), 1),
+        'updated': str(health.get('updated', ''))[:10],
+    }
+
+
+def health_score(proxy: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """امتیاز سلامت بین ۰ و ۱ (دسترس‌پذیری هموار شده با کاهش زمانی، با جریمه تاخیر)"""
+    health = proxy.get('health') or seed_health(proxy)
+    checks = health.get('checks', 0)
+    uptime = health.get('uptime', UPTIME_PRIOR)
+    
+    # تاریخچه کوتاه به سمت پیش‌فرض هموار می‌شود
+    uptime = (uptime * checks + UPTIME_PRIOR) / (checks + 1)
+    
+    # تاریخچه قدیمی اعتبار کمتری دارد
+    updated = parse_time(health.get('updated'))
+    if updated:
+        hours = max(((now or datetime.now()) - updated).total_seconds(), 0) / 3600
+        decay = 0.5 ** (hours / HALF_LIFE_HOURS)
+        uptime = UPTIME_PRIOR + (uptime - UPTIME_PRIOR) * decay
+    
+    latency = health.get('latency') or 0
+    latency_factor = LATENCY_SCALE_MS / (LATENCY_SCALE_MS + latency) if latency > 0 else 1.0
+    return uptime * (0.75 + 0.25 * latency_factor)
+
+
+def throughput_factor(proxy: Dict[str, Any]) -> float:
+    """ضریب سرعت دانلود بین ۰.۷ و ۱"""
+    speed = proxy.get('speed_kbps')
+    if speed is None:
+        speed = THROUGHPUT_SCALE_KBPS
+    return 0.7 + 0.3 * speed / (speed + THROUGHPUT_SCALE_KBPS) if speed > 0 else 0.7
+
+
+def rank_score(proxy: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """امتیاز ترتیب خروجی: امتیاز سلامت با ضریب سرعت دانلود"""
+    return health_score(proxy, now) * throughput_factor(proxy)
+
+
+def top_k(proxies: List[Dict[str, Any]], k: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """k پروکسی با بیشترین امتیاز (O(n log k))"""
+    now = now or datetime.now()
+    return heapq.nlargest(k, proxies, key=lambda p: health_score(p, now))
+
+
+def bottom_k(proxies: List[Dict[str, Any]], k: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """k پروکسی با کمترین امتیاز (O(n log k))"""
+    now = now or datetime.now()
+    return heapq.nsmallest(k, proxies, key=lambda p: health_score(p, now))
+
+
+def rank_proxies(proxies: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """مرتب‌سازی کامل بر اساس امتیاز سلامت و سرعت (بهترین اول) برای ترتیب خروجی‌ها"""
+    now = now or datetime.now()
+    return sorted(proxies, key=lambda p: rank_score(p, now), reverse=True)
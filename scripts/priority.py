@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+ترتیب بررسی کاندیدها بر اساس احتمال تخمینی فعال بودن
+ترکیب log-odds اعتبار منبع، الگوی پورت، تاریخچه IP و پیشوند /24 و پروتکل
+"""
+
+import math
+import heapq
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+# احتمال پیش‌فرض فعال بودن کاندید بدون هیچ اطلاعات
+BASE_RATE = 0.2
+# وزن پیش‌فرض در هموارسازی نرخ‌ها (تعداد مشاهده مجازی)
+PRIOR_WEIGHT = 4
+# پورت‌های رایج هر پروتکل ← احتمال فعال بودن نسبت به پایه
+PORT_PRIORS = {
+    'http': {8080: 0.3, 3128: 0.3, 80: 0.25, 8888: 0.25, 8000: 0.2, 443: 0.2},
+    'socks5': {1080: 0.3, 10808: 0.3, 1081: 0.25, 9050: 0.2},
+    'vmess': {443: 0.3, 8443: 0.25, 2053: 0.25, 2083: 0.25, 2087: 0.25, 2096: 0.25, 80: 0.2, 8080: 0.2},
+    'vless': {443: 0.3, 8443: 0.25, 2053: 0.25, 2083: 0.25, 2087: 0.25, 2096: 0.25, 80: 0.2, 8080: 0.2},
+    'ss': {8388: 0.25, 443: 0.25},
+}
+
+
+def logit(p: float) -> float:
+    """log-odds احتمال (محدود به بازه باز ۰ و ۱)"""
+    p = min(max(p, 1e-4), 1 - 1e-4)
+    return math.log(p / (1 - p))
+
+
+def smoothed(hits: float, total: float, prior: float = BASE_RATE, weight: float = PRIOR_WEIGHT) -> float:
+    """نرخ هموار شده به سمت prior (تاریخچه کوتاه اثر کمی دارد)"""
+    return (hits + prior * weight) / (total + weight)
+
+
+def ipv4_prefix(server: str) -> Optional[str]:
+    """پیشوند /24 برای IPv4 (None برای نام دامنه)"""
+    parts = server.split('.')
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        return None
+    return '.'.join(parts[:3])
+
+
+class AliveEstimator:
+    """تخمین احتمال فعال بودن از روی مخزن فعلی پروکسی‌ها و آمار منابع"""
+    def __init__(self, pool: List[Dict[str, Any]], base_rate: float = BASE_RATE):
+        self.base_rate = base_rate
+        self.by_server = {}
+        self.by_prefix = {}
+        self.by_type = {}
+        for proxy in pool:
+            # دسترس‌پذیری هموار شده تاریخچه سلامت بهتر از آخرین وضعیت است
+            health = proxy.get('health') or {}
+            alive = health.get('uptime', 1.0 if proxy.get('is_active') else 0.0)
+            server = str(proxy.get('server', ''))
+            self.add(self.by_server, server, alive)
+            prefix = ipv4_prefix(server)
+            if prefix:
+                self.add(self.by_prefix, prefix, alive)
+            self.add(self.by_type, str(proxy.get('type', '')), alive)
+    
+    @staticmethod
+    def add(table: Dict[str, List[float]], key: str, alive: float):
+        """افزودن یک مشاهده به جدول (مجموع فعال، تعداد)"""
+        entry = table.setdefault(key, [0.0, 0])
+        entry[0] += alive
+        entry[1] += 1
+    
+    def rate(self, table: Dict[str, List[float]], key: Optional[str]) -> Optional[float]:
+        """نرخ هموار شده یک کلید (None = بدون مشاهده)"""
+        entry = table.get(key) if key else None
+        return smoothed(entry[0], entry[1], self.base_rate) if entry else None
+    
+    def probability(self, candidate: Dict[str, Any], source_rate: Optional[float] = None,
+                    ip: Optional[str] = None) -> float:
+        """احتمال فعال بودن کاندید (هر ویژگی موجود log-odds پایه را جابجا می‌کند)"""
+        ptype = str(candidate.get('type', ''))
+        server = str(candidate.get('server', ''))
+        base = logit(self.base_rate)
+        score = base
+        
+        features = [
+            source_rate,
+            PORT_PRIORS.get(ptype, {}).get(int(candidate.get('port', 0) or 0)),
+            self.rate(self.by_type, ptype),
+            self.rate(self.by_server, server) or (self.rate(self.by_server, ip) if ip else None),
+            self.rate(self.by_prefix, ipv4_prefix(ip or server)),
+        ]
+        for value in features:
+            if value is not None:
+                score += logit(value) - base
+        return 1 / (1 + math.exp(-score))
+
+
+def priority_order(candidates: List[Dict[str, Any]], estimator: AliveEstimator,
+                   source_rate: Optional[float] = None,
+                   resolved: Optional[Dict[str, str]] = None) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """کاندیدها از صف اولویت به ترتیب احتمال نزولی (ترتیب منبع برای احتمال‌های برابر حفظ می‌شود)"""
+    resolved = resolved or {}
+    heap = [(-estimator.probability(c, source_rate, resolved.get(c['server'])), idx, c)
+            for idx, c in enumerate(candidates)]
+    heapq.heapify(heap)
+    while heap:
+        negative, _, candidate = heapq.heappop(heap)
+        yield -negative, candidate
@@ -0,0 +1,619 @@
+#!/usr/bin/env python3
+"""
+بررسی سبک سلامت پروکسی‌ها با سوکت خام (asyncio)
+HTTP CONNECT، دست‌دهی SOCKS5 و TLS ClientHello بدون requests
+زمان اتصال، دست‌دهی و اولین بایت جداگانه اندازه‌گیری می‌شوند
+آزمون سرعت: دانلود محتوای با اندازه ثابت از طریق پروکسی HTTP/SOCKS5
+آزمون UDP: رفت و برگشت یک پرسش DNS از طریق SOCKS5 UDP ASSOCIATE یا رله UDP شدوساکس
+"""
+
+import os
+import sys
+import time
+import random
+import struct
+import hashlib
+import asyncio
+import argparse
+import ipaddress
+from urllib.parse import urlsplit
+from typing import Dict, Any, Optional, Tuple, List
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+DEFAULT_TARGET = ("www.google.com", 443)
+# مقصد رفت و برگشت UDP: سرور DNS یا سرور echo (پاسخ echo همان شناسه پرسش را دارد)
+DEFAULT_UDP_TARGET = ("8.8.8.8", 53)
+DNS_QUERY_NAME = "www.google.com"
+MAX_HEADER_BYTES = 8192
+THROUGHPUT_CHUNK = 16384
+
+# الگوریتم‌ها و رمزهای رایج تا ClientHello شبیه کلاینت‌های واقعی باشد
+TLS_CIPHERS = [0x1301, 0x1302, 0x1303, 0xc02b, 0xc02f, 0xc02c, 0xc030, 0xcca9, 0xcca8, 0x009c, 0x009d]
+TLS_GROUPS = [0x001d, 0x0017, 0x0018]
+TLS_SIGNATURE_ALGORITHMS = [0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601]
+
+
+def parse_target(value: str) -> Tuple[str, int]:
+    """پارس host:port مقصد بررسی"""
+    host, _, port = value.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"مقصد نامعتبر: {value} (فرمت host:port)")
+    return host.strip('[]'), int(port)
+
+
+def is_ip(host: str) -> bool:
+    """بررسی IP بودن مقدار"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def elapsed_ms(start: float) -> int:
+    """میلی‌ثانیه گذشته از start"""
+    return int((time.perf_counter() - start) * 1000)
+
+
+def tls_extension(ext_type: int, data: bytes) -> bytes:
+    """یک extension در ClientHello"""
+    return struct.pack('!HH', ext_type, len(data)) + data
+
+
+def build_client_hello(sni: Optional[str] = None) -> bytes:
+    """ساخت رکورد TLS ClientHello (TLS 1.3 با پشتیبانی از 1.2)"""
+    extensions = b''
+    if sni and not is_ip(sni):
+        name = sni.encode('idna')
+        server_name = struct.pack('!HBH', len(name) + 3, 0, len(name)) + name
+        extensions += tls_extension(0x0000, server_name)
+    extensions += tls_extension(0x000a, struct.pack('!H', 2 * len(TLS_GROUPS)) +
+                                b''.join(struct.pack('!H', g) for g in TLS_GROUPS))
+    extensions += tls_extension(0x000b, b'\x01\x00')
+    extensions += tls_extension(0x000d, struct.pack('!H', 2 * len(TLS_SIGNATURE_ALGORITHMS)) +
+                                b''.join(struct.pack('!H', a) for a in TLS_SIGNATURE_ALGORITHMS))
+    alpn = b''.join(bytes([len(p)]) + p for p in [b'h2', b'http/1.1'])
+    extensions += tls_extension(0x0010, struct.pack('!H', len(alpn)) + alpn)
+    extensions += tls_extension(0x002b, b'\x04' + struct.pack('!HH', 0x0304, 0x0303))
+    extensions += tls_extension(0x002d, b'\x01\x01')
+    # کلید x25519 تصادفی؛ سرور فقط تا ServerHello پیش می‌رود
+    key_share = struct.pack('!HH', 0x001d, 32) + os.urandom(32)
+    extensions += tls_extension(0x0033, struct.pack('!H', len(key_share)) + key_share)
+    
+    body = struct.pack('!H', 0x0303) + os.urandom(32)
+    body += b'\x20' + os.urandom(32)
+    body += struct.pack('!H', 2 * len(TLS_CIPHERS)) + b''.join(struct.pack('!H', c) for c in TLS_CIPHERS)
+    body += b'\x01\x00'
+    body += struct.pack('!H', len(extensions)) + extensions
+    
+    handshake = b'\x01' + len(body).to_bytes(3, 'big') + body
+    return b'\x16\x03\x01' + struct.pack('!H', len(handshake)) + handshake
+
+
+def socks5_address(host: str, port: int) -> bytes:
+    """آدرس مقصد در درخواست SOCKS5"""
+    if is_ip(host):
+        address = ipaddress.ip_address(host)
+        atyp = b'\x01' if address.version == 4 else b'\x04'
+        return atyp + address.packed + struct.pack('!H', port)
+    name = host.encode('idna')
+    return b'\x03' + bytes([len(name)]) + name + struct.pack('!H', port)
+
+
+async def read_socks5_bound(reader: asyncio.StreamReader) -> Tuple[int, str, int]:
+    """خواندن کامل پاسخ SOCKS5: (کد REP، آدرس BND، پورت BND)"""
+    header = await reader.readexactly(4)
+    if header[0] != 5:
+        raise ValueError("پاسخ SOCKS5 نامعتبر")
+    atyp = header[3]
+    if atyp == 1:
+        data = await reader.readexactly(4 + 2)
+        host = str(ipaddress.IPv4Address(data[:4]))
+    elif atyp == 4:
+        data = await reader.readexactly(16 + 2)
+        host = str(ipaddress.IPv6Address(data[:16]))
+    elif atyp == 3:
+        length = (await reader.readexactly(1))[0]
+        data = await reader.readexactly(length + 2)
+        host = data[:length].decode('idna', 'replace')
+    else:
+        raise ValueError(f"نوع آدرس SOCKS5 نامعتبر: {atyp}")
+    return header[1], host, struct.unpack('!H', data[-2:])[0]
+
+
+async def read_socks5_reply(reader: asyncio.StreamReader) -> int:
+    """خواندن کامل پاسخ CONNECT در SOCKS5 و برگرداندن کد REP"""
+    return (await read_socks5_bound(reader))[0]
+
+
+def split_socks5_address(data: bytes) -> Tuple[bytes, bytes]:
+    """جدا کردن آدرس SOCKS5 ابتدای بسته از داده بعد از آن"""
+    atyp = data[0] if data else 0
+    if atyp == 1:
+        end = 1 + 4 + 2
+    elif atyp == 4:
+        end = 1 + 16 + 2
+    elif atyp == 3 and len(data) > 1:
+        end = 2 + data[1] + 2
+    else:
+        raise ValueError("آدرس بسته UDP نامعتبر")
+    if len(data) < end:
+        raise ValueError("بسته UDP کوتاه است")
+    return data[:end], data[end:]
+
+
+async def handshake_http(reader, writer, target: Tuple[str, int], result: Dict[str, Any], start: float) -> bool:
+    """درخواست CONNECT و خواندن هدر پاسخ"""
+    host, port = target
+    authority = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+    writer.write(f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n\r\n".encode('ascii'))
+    await writer.drain()
+    
+    data = await reader.read(1)
+    if not data:
+        raise ConnectionError("اتصال بسته شد")
+    result['first_byte_ms'] = elapsed_ms(start)
+    while b'\r\n\r\n' not in data:
+        chunk = await reader.read(1024)
+        if not chunk or len(data) > MAX_HEADER_BYTES:
+            break
+        data += chunk
+    
+    status_line = data.split(b'\r\n', 1)[0].decode('latin-1')
+    parts = status_line.split()
+    if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+        raise ValueError(f"پاسخ HTTP نامعتبر: {status_line[:40]!r}")
+    if parts[1] != '200':
+        raise ValueError(f"CONNECT رد شد: {parts[1]}")
+    return True
+
+
+async def handshake_socks5(reader, writer, target: Tuple[str, int], result: Dict[str, Any], start: float) -> bool:
+    """greeting بدون احراز هویت و سپس CONNECT به مقصد"""
+    writer.write(b'\x05\x01\x00')
+    await writer.drain()
+    greeting = await reader.readexactly(2)
+    result['first_byte_ms'] = elapsed_ms(start)
+    if greeting[0] != 5:
+        raise ValueError("سرور SOCKS5 نیست")
+    if greeting[1] != 0:
+        raise ValueError("احراز هویت لازم است")
+    
+    writer.write(b'\x05\x01\x00' + socks5_address(*target))
+    await writer.drain()
+    rep = await read_socks5_reply(reader)
+    if rep != 0:
+        raise ValueError(f"CONNECT رد شد: کد {rep}")
+    return True
+
+
+async def handshake_tls(reader, writer, sni: Optional[str], result: Dict[str, Any], start: float) -> bool:
+    """ارسال ClientHello و انتظار برای ServerHello"""
+    writer.write(build_client_hello(sni))
+    await writer.drain()
+    header = await reader.readexactly(5)
+    result['first_byte_ms'] = elapsed_ms(start)
+    if header[0] == 0x15:
+        raise ValueError("TLS alert")
+    if header[0] != 0x16 or header[1] != 0x03:
+        raise ValueError("پاسخ TLS نیست")
+    if (await reader.readexactly(1))[0] != 0x02:
+        raise ValueError("ServerHello دریافت نشد")
+    return True
+
+
+async def probe(kind: str, ip: str, port: int, timeout: float = 10,
+                target: Tuple[str, int] = DEFAULT_TARGET, sni: Optional[str] = None) -> Dict[str, Any]:
+    """بررسی یک پروکسی: kind یکی از tcp، http، socks5 یا tls"""
+    result = {'alive': False, 'connect_ms': None, 'handshake_ms': None, 'first_byte_ms': None, 'error': None}
+    writer = None
+    
+    async def run():
+        nonlocal writer
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(ip, port)
+        result['connect_ms'] = elapsed_ms(start)
+        
+        start = time.perf_counter()
+        if kind == 'http':
+            await handshake_http(reader, writer, target, result, start)
+        elif kind == 'socks5':
+            await handshake_socks5(reader, writer, target, result, start)
+        elif kind == 'tls':
+            await handshake_tls(reader, writer, sni, result, start)
+        result['handshake_ms'] = elapsed_ms(start) if kind != 'tcp' else 0
+        result['alive'] = True
+    
+    try:
+        await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        result['error'] = "timeout"
+    except asyncio.IncompleteReadError:
+        result['error'] = "اتصال در میانه دست‌دهی بسته شد"
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)[:80] or type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, asyncio.CancelledError):
+                pass
+    
+    result['ping'] = (result['connect_ms'] or 0) + (result['handshake_ms'] or 0) if result['alive'] else 0
+    return result
+
+
+async def probe_many(items: List[Dict[str, Any]], concurrency: int = 50) -> List[Dict[str, Any]]:
+    """بررسی هم‌زمان چند پروکسی (هر آیتم: kind، ip، port و اختیاری timeout/target/sni)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def limited(item):
+        async with semaphore:
+            return await probe(**item)
+    
+    return await asyncio.gather(*(limited(item) for item in items))
+
+
+class BandwidthLimiter:
+    """سقف پهنای باند کل آزمون‌های سرعت (سطل توکن؛ 0 = بدون سقف)"""
+    def __init__(self, rate_kbps: float = 0):
+        self.rate = rate_kbps * 1024
+        self.available = self.rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def reserve(self, nbytes: int):
+        """انتظار تا وقتی سهم nbytes از پهنای باند آزاد شود"""
+        # حجم کامل دانلود پیش از شروع رزرو می‌شود تا سرعت اندازه‌گیری شده تحت تاثیر سقف نباشد
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            self.available = min(self.available + (now - self.updated) * self.rate, self.rate)
+            self.updated = now
+            self.available -= nbytes
+            if self.available < 0:
+                await asyncio.sleep(-self.available / self.rate)
+
+
+def parse_http_url(url: str) -> Tuple[str, int, str]:
+    """پارس آدرس http:// محتوای آزمون سرعت به (host، port، path)"""
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise ValueError(f"آدرس آزمون سرعت باید http:// باشد: {url}")
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return parts.hostname, parts.port or 80, path
+
+
+async def read_http_headers(reader: asyncio.StreamReader) -> Tuple[str, bytes]:
+    """خواندن هدر پاسخ HTTP؛ خط وضعیت و بایت‌های اضافه بدنه برگردانده می‌شوند"""
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = await reader.read(1024)
+        if not chunk or len(data) > MAX_HEADER_BYTES:
+            raise ValueError("هدر HTTP ناقص")
+        data += chunk
+    head, _, rest = data.partition(b'\r\n\r\n')
+    return head.split(b'\r\n', 1)[0].decode('latin-1'), rest
+
+
+async def throughput(kind: str, ip: str, port: int, url: str, max_bytes: int = 256 * 1024,
+                     timeout: float = 20, limiter: Optional[BandwidthLimiter] = None) -> Dict[str, Any]:
+    """دانلود حداکثر max_bytes از url از طریق پروکسی http یا socks5 و محاسبه KB/s"""
+    result = {'speed_kbps': 0, 'bytes': 0, 'error': None}
+    host, target_port, path = parse_http_url(url)
+    authority = host if target_port == 80 else f"{host}:{target_port}"
+    writer = None
+    
+    async def run():
+        nonlocal writer
+        reader, writer = await asyncio.open_connection(ip, port)
+        if kind == 'socks5':
+            await handshake_socks5(reader, writer, (host, target_port), {}, time.perf_counter())
+            request_target = path
+        elif kind == 'http':
+            # پروکسی HTTP درخواست با آدرس کامل را مستقیم ارسال می‌کند
+            request_target = f"http://{authority}{path}"
+        else:
+            raise ValueError(f"آزمون سرعت برای {kind} پشتیبانی نمی‌شود")
+        
+        writer.write(f"GET {request_target} HTTP/1.1\r\nHost: {authority}\r\n"
+                     f"Connection: close\r\nAccept-Encoding: identity\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        status_line, body = await read_http_headers(reader)
+        parts = status_line.split()
+        if len(parts) < 2 or parts[1] != '200':
+            raise ValueError(f"پاسخ نامعتبر: {status_line[:40]!r}")
+        
+        # زمان از اولین بایت بدنه شمرده می‌شود تا تاخیر اتصال در سرعت اثر نکند
+        start = time.perf_counter()
+        received = len(body)
+        while received < max_bytes:
+            chunk = await reader.read(THROUGHPUT_CHUNK)
+            if not chunk:
+                break
+            received += len(chunk)
+        elapsed = max(time.perf_counter() - start, 0.001)
+        result['bytes'] = min(received, max_bytes)
+        result['speed_kbps'] = int(result['bytes'] / 1024 / elapsed)
+    
+    if limiter is not None:
+        await limiter.reserve(max_bytes)
+    try:
+        await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        result['error'] = "timeout"
+    except asyncio.IncompleteReadError:
+        result['error'] = "اتصال در میانه دست‌دهی بسته شد"
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)[:80] or type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, asyncio.CancelledError):
+                pass
+    
+    if result['error']:
+        result['speed_kbps'] = 0
+    return result
+
+
+async def throughput_many(items: List[Dict[str, Any]], url: str, max_bytes: int = 256 * 1024,
+                          concurrency: int = 4, bandwidth_kbps: float = 0,
+                          timeout: float = 20) -> List[Dict[str, Any]]:
+    """آزمون سرعت هم‌زمان چند پروکسی (هر آیتم: kind، ip، port) با سقف هم‌زمانی و پهنای باند کل"""
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = BandwidthLimiter(bandwidth_kbps)
+    
+    async def limited(item):
+        async with semaphore:
+            return await throughput(item['kind'], item['ip'], item['port'], url, max_bytes, timeout, limiter)
+    
+    return await asyncio.gather(*(limited(item) for item in items))
+
+
+def run_throughput_many(items: List[Dict[str, Any]], url: str, max_bytes: int = 256 * 1024,
+                        concurrency: int = 4, bandwidth_kbps: float = 0,
+                        timeout: float = 20) -> List[Dict[str, Any]]:
+    """نسخه همگام throughput_many"""
+    return asyncio.run(throughput_many(items, url, max_bytes, concurrency, bandwidth_kbps, timeout))
+
+
+# پروتکل‌هایی که رله UDP آن‌ها سمت سرور اختیاری است و فقط با آزمون تایید می‌شود
+UDP_RELAY_TYPES = ['socks5', 'ss']
+
+
+def udp_value(proxy: Dict[str, Any]) -> bool:
+    """مقدار udp خروجی: HTTP رله UDP ندارد، SOCKS5/SS فقط با رفت و برگشت موفق (udp_ping)، vmess/vless داخل اتصال TCP"""
+    ptype = str(proxy.get('type', '')).lower()
+    if ptype == 'http':
+        return False
+    if ptype in UDP_RELAY_TYPES:
+        return 'udp_ping' in proxy
+    return bool(proxy.get('udp', True))
+
+
+def build_dns_query(txid: bytes, name: str = DNS_QUERY_NAME) -> bytes:
+    """پرسش DNS نوع A با شناسه داده شده"""
+    labels = b''.join(bytes([len(part)]) + part.encode('idna') for part in name.strip('.').split('.'))
+    return txid + b'\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00' + labels + b'\x00\x00\x01\x00\x01'
+
+
+class DatagramWaiter(asyncio.DatagramProtocol):
+    """انتظار برای اولین datagram دریافتی"""
+    def __init__(self):
+        self.reply = asyncio.get_running_loop().create_future()
+    
+    def datagram_received(self, data: bytes, addr):
+        if not self.reply.done():
+            self.reply.set_result(data)
+    
+    def error_received(self, exc: Exception):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
+async def udp_roundtrip(host: str, port: int, packet: bytes) -> Tuple[bytes, int]:
+    """ارسال یک datagram و انتظار برای پاسخ: (پاسخ، زمان رفت و برگشت به میلی‌ثانیه)"""
+    loop = asyncio.get_running_loop()
+    transport, waiter = await loop.create_datagram_endpoint(DatagramWaiter, remote_addr=(host, port))
+    try:
+        start = time.perf_counter()
+        transport.sendto(packet)
+        reply = await waiter.reply
+        return reply, elapsed_ms(start)
+    finally:
+        transport.close()
+
+
+async def udp_socks5(ip: str, port: int, target: Tuple[str, int], result: Dict[str, Any]):
+    """UDP ASSOCIATE روی اتصال کنترلی و رفت و برگشت پرسش DNS از طریق آدرس رله"""
+    reader, writer = await asyncio.open_connection(ip, port)
+    try:
+        writer.write(b'\x05\x01\x00')
+        await writer.drain()
+        greeting = await reader.readexactly(2)
+        if greeting[0] != 5 or greeting[1] != 0:
+            raise ValueError("دست‌دهی SOCKS5 ناموفق")
+        
+        # بعد از این نقطه پروکسی در دسترس است و هر شکستی یعنی UDP پشتیبانی نمی‌شود
+        result['udp'] = False
+        writer.write(b'\x05\x03\x00\x01' + bytes(6))
+        await writer.drain()
+        rep, relay_host, relay_port = await read_socks5_bound(reader)
+        if rep != 0:
+            raise ValueError(f"UDP ASSOCIATE رد شد: کد {rep}")
+        # آدرس نامشخص یعنی رله روی همان IP پروکسی است
+        if relay_host in ['0.0.0.0', '::'] or not relay_port:
+            relay_host = ip
+        relay_port = relay_port or port
+        
+        txid = random.getrandbits(16).to_bytes(2, 'big')
+        reply, rtt = await udp_roundtrip(relay_host, relay_port,
+                                         b'\x00\x00\x00' + socks5_address(*target) + build_dns_query(txid))
+        if len(reply) < 4 or reply[2] != 0:
+            raise ValueError("پاسخ رله UDP نامعتبر")
+        _, payload = split_socks5_address(reply[3:])
+        if payload[:2] != txid:
+            raise ValueError("پاسخ UDP با پرسش نمی‌خواند")
+        result['udp'] = True
+        result['udp_ping'] = rtt
+    finally:
+        # رله UDP فقط تا زمان باز بودن اتصال کنترلی معتبر است
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, asyncio.CancelledError):
+            pass
+
+
+# رمزهای AEAD شدوساکس: نام ← (طول کلید، سازنده AEAD)
+SS_AEAD_CIPHERS = {
+    'aes-128-gcm': (16, 'aesgcm'),
+    'aes-192-gcm': (24, 'aesgcm'),
+    'aes-256-gcm': (32, 'aesgcm'),
+    'chacha20-ietf-poly1305': (32, 'chacha20'),
+    'chacha20-poly1305': (32, 'chacha20'),
+}
+
+
+def ss_master_key(password: str, key_len: int) -> bytes:
+    """کلید اصلی شدوساکس از رمز عبور (EVP_BytesToKey با MD5)"""
+    key, block = b'', b''
+    while len(key) < key_len:
+        block = hashlib.md5(block + password.encode('utf-8')).digest()
+        key += block
+    return key[:key_len]
+
+
+def ss_aead(cipher: str, master_key: bytes, salt: bytes):
+    """شیء AEAD با زیرکلید HKDF-SHA1 مخصوص این salt"""
+    key_len, kind = SS_AEAD_CIPHERS[cipher]
+    subkey = HKDF(algorithm=hashes.SHA1(), length=key_len, salt=salt, info=b'ss-subkey').derive(master_key)
+    return AESGCM(subkey) if kind == 'aesgcm' else ChaCha20Poly1305(subkey)
+
+
+async def udp_shadowsocks(ip: str, port: int, cipher: str, password: str,
+                          target: Tuple[str, int], result: Dict[str, Any]):
+    """رفت و برگشت پرسش DNS از طریق رله UDP شدوساکس (AEAD، nonce صفر در هر بسته)"""
+    key_len = SS_AEAD_CIPHERS[cipher][0]
+    master_key = ss_master_key(password, key_len)
+    nonce = bytes(12)
+    salt = os.urandom(key_len)
+    txid = random.getrandbits(16).to_bytes(2, 'big')
+    sealed = ss_aead(cipher, master_key, salt).encrypt(nonce, socks5_address(*target) + build_dns_query(txid), None)
+    
+    # UDP بدون اتصال است: بی‌پاسخ ماندن یعنی رله UDP خاموش یا مسدود است
+    result['udp'] = False
+    reply, rtt = await udp_roundtrip(ip, port, salt + sealed)
+    if len(reply) <= key_len:
+        raise ValueError("پاسخ رله UDP کوتاه است")
+    try:
+        plain = ss_aead(cipher, master_key, reply[:key_len]).decrypt(nonce, reply[key_len:], None)
+    except Exception:
+        raise ValueError("رمزگشایی پاسخ UDP ناموفق")
+    _, payload = split_socks5_address(plain)
+    if payload[:2] != txid:
+        raise ValueError("پاسخ UDP با پرسش نمی‌خواند")
+    result['udp'] = True
+    result['udp_ping'] = rtt
+
+
+async def udp_probe(kind: str, ip: str, port: int, timeout: float = 5,
+                    target: Tuple[str, int] = DEFAULT_UDP_TARGET,
+                    cipher: Optional[str] = None, password: Optional[str] = None) -> Dict[str, Any]:
+    """بررسی پشتیبانی UDP؛ udp=None یعنی قابل اندازه‌گیری نبود (پروتکل، نبود cryptography یا پروکسی در دسترس نیست)"""
+    result = {'udp': None, 'udp_ping': None, 'error': None}
+    kind = kind.lower()
+    if kind == 'http':
+        result['udp'] = False
+        return result
+    if kind == 'socks5':
+        check = udp_socks5(ip, port, target, result)
+    elif kind == 'ss' and HAS_CRYPTOGRAPHY and str(cipher).lower() in SS_AEAD_CIPHERS and password is not None:
+        check = udp_shadowsocks(ip, port, str(cipher).lower(), str(password), target, result)
+    else:
+        result['error'] = "بدون آزمون UDP برای این پروتکل/رمز"
+        return result
+    
+    try:
+        await asyncio.wait_for(check, timeout)
+    except asyncio.TimeoutError:
+        result['error'] = "timeout"
+    except asyncio.IncompleteReadError:
+        result['error'] = "اتصال در میانه دست‌دهی بسته شد"
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)[:80] or type(e).__name__
+    if not result['udp']:
+        result['udp_ping'] = None
+    return result
+
+
+def run_udp_probe(kind: str, ip: str, port: int, timeout: float = 5,
+                  target: Tuple[str, int] = DEFAULT_UDP_TARGET,
+                  cipher: Optional[str] = None, password: Optional[str] = None) -> Dict[str, Any]:
+    """نسخه همگام udp_probe برای فراخوانی از کد threadها"""
+    return asyncio.run(udp_probe(kind, ip, port, timeout, target, cipher, password))
+
+
+def run_probe_many(items: List[Dict[str, Any]], concurrency: int = 50) -> List[Dict[str, Any]]:
+    """نسخه همگام probe_many: یک event loop برای کل دسته"""
+    return asyncio.run(probe_many(items, concurrency))
+
+
+def run_probe(kind: str, ip: str, port: int, timeout: float = 10,
+              target: Tuple[str, int] = DEFAULT_TARGET, sni: Optional[str] = None) -> Dict[str, Any]:
+    """نسخه همگام probe برای فراخوانی از کد threadها"""
+    return asyncio.run(probe(kind, ip, port, timeout, target, sni))
+
+
+def main():
+    """تابع اصلی"""
+    parser = argparse.ArgumentParser(description="بررسی سبک سلامت یک پروکسی")
+    parser.add_argument('kind', choices=['tcp', 'http', 'socks5', 'tls'])
+    parser.add_argument('ip')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--target', default=f"{DEFAULT_TARGET[0]}:{DEFAULT_TARGET[1]}",
+                        help="مقصد CONNECT برای http/socks5 (host:port)")
+    parser.add_argument('--sni', help="SNI برای tls")
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--speed-url', help="آدرس http:// برای آزمون سرعت (فقط http/socks5)")
+    parser.add_argument('--speed-kb', type=int, default=256, help="حجم دانلود آزمون سرعت (KB)")
+    parser.add_argument('--udp', action='store_true', help="آزمون رله UDP (فقط socks5)")
+    parser.add_argument('--udp-target', default=f"{DEFAULT_UDP_TARGET[0]}:{DEFAULT_UDP_TARGET[1]}",
+                        help="سرور DNS یا echo برای رفت و برگشت UDP (host:port)")
+    args = parser.parse_args()
+    
+    if args.udp:
+        result = run_udp_probe(args.kind, args.ip, args.port, args.timeout, parse_target(args.udp_target))
+        for key in ['udp', 'udp_ping', 'error']:
+            print(f"{key:>14}: {result[key]}")
+        return 0 if result['udp'] else 1
+    
+    if args.speed_url:
+        result = asyncio.run(throughput(args.kind, args.ip, args.port, args.speed_url,
+                                        args.speed_kb * 1024, args.timeout))
+        for key in ['speed_kbps', 'bytes', 'error']:
+            print(f"{key:>14}: {result[key]}")
+        return 0 if not result['error'] else 1
+    
+    result = run_probe(args.kind, args.ip, args.port, args.timeout, parse_target(args.target), args.sni)
+    for key in ['alive', 'connect_ms', 'first_byte_ms', 'handshake_ms', 'ping', 'error']:
+        print(f"{key:>14}: {result[key]}")
+    return 0 if result['alive'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
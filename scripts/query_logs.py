@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+جستجو در لاگ‌های ساختاریافته JSONL (فشرده یا خام)
+"""
+
+import os
+import sys
+import gzip
+import json
+import argparse
+from typing import Iterator, Dict, Any, List
+
+LEVELS = ['DEBUG', 'INFO', 'STATS', 'WARNING', 'ERROR']
+
+
+def log_files(log_dir: str, run: str = None) -> List[str]:
+    """فهرست فایل‌های لاگ رویداد به ترتیب زمان"""
+    if not os.path.isdir(log_dir):
+        return []
+    files = []
+    for filename in sorted(os.listdir(log_dir)):
+        if not filename.startswith('run_') or not filename.endswith(('.jsonl', '.jsonl.gz')):
+            continue
+        if run and run not in filename:
+            continue
+        files.append(os.path.join(log_dir, filename))
+    return files
+
+
+def read_events(path: str) -> Iterator[Dict[str, Any]]:
+    """خواندن رویدادهای یک فایل"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def matches(event: Dict[str, Any], args) -> bool:
+    """بررسی تطابق رویداد با فیلترها"""
+    if args.source and event.get('source') != args.source:
+        return False
+    if args.stage and event.get('stage') != args.stage:
+        return False
+    if args.level:
+        level = event.get('level', 'INFO')
+        if level not in LEVELS or LEVELS.index(level) < LEVELS.index(args.level):
+            return False
+    if args.since and event.get('ts', '') < args.since:
+        return False
+    if args.contains and args.contains not in event.get('msg', ''):
+        return False
+    return True
+
+
+def main():
+    """تابع اصلی"""
+    parser = argparse.ArgumentParser(description="جستجو در لاگ‌های ساختاریافته")
+    parser.add_argument('--dir', default=".state/logs", help="پوشه لاگ‌ها")
+    parser.add_argument('--run', help="فقط اجراهایی که نام فایلشان شامل این مقدار است (مثلا 20260822)")
+    parser.add_argument('--source', help="نام منبع")
+    parser.add_argument('--stage', help="مرحله (fetch, check, merge, evict, emergency, render, save, ...)")
+    parser.add_argument('--level', choices=LEVELS, help="حداقل سطح")
+    parser.add_argument('--since', help="از این زمان (ISO، مثلا 2026-08-22T21:00)")
+    parser.add_argument('--contains', help="متن موجود در پیام")
+    parser.add_argument('--json', action='store_true', help="خروجی JSONL خام")
+    parser.add_argument('--count', action='store_true', help="فقط تعداد رویدادها")
+    args = parser.parse_args()
+    
+    total = 0
+    for path in log_files(args.dir, args.run):
+        for event in read_events(path):
+            if not matches(event, args):
+                continue
+            total += 1
+            if args.count:
+                continue
+            if args.json:
+                print(json.dumps(event, ensure_ascii=False))
+            else:
+                context = " ".join(f"{key}={event[key]}" for key in ['stage', 'source'] if key in event)
+                print(f"[{event.get('ts', '')}] [{event.get('level', '')}] {context} {event.get('msg', '')}")
+    
+    if args.count:
+        print(total)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
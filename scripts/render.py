@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+رندر یک‌مرحله‌ای خروجی‌ها
+پروکسی‌ها یک بار نرمال‌سازی می‌شوند و کانفیگ کلش، ساب‌اسکریپشن base64،
+کانفیگ sing-box و لیست لینک‌های اشتراک در همان گذر ساخته می‌شوند
+تغییرات کانفیگ کلش نسبت به نسخه قبل به صورت فایل delta با شماره نسخه صعودی منتشر می‌شود
+"""
+
+import os
+import sys
+import json
+import re
+import base64
+import heapq
+import hashlib
+import tempfile
+from datetime import datetime
+from urllib.parse import quote, urlencode
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import yaml
+
+from probes import udp_value
+
+# در صورت وجود libyaml از dumper و loader سریع C استفاده می‌شود
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+OUTPUT_FILES = {
+    'clash': 'clash_config.yaml',
+    'subscription': 'subscription.txt',
+    'singbox': 'singbox.json',
+    'links': 'links.txt',
+}
+
+TEST_URL = 'http://www.gstatic.com/generate_204'
+
+VARIANTS_DIR = 'variants'
+
+# تعداد پروکسی در نسخه «سریع‌ترین‌ها»
+FAST_VARIANT_SIZE = 20
+
+# گروه پهنای باند بالا: پروکسی‌های با سرعت دانلود اندازه‌گیری شده حداقل این مقدار (KB/s)
+BANDWIDTH_GROUP = '⚡ High Bandwidth'
+BANDWIDTH_MIN_KBPS = 100
+BANDWIDTH_GROUP_SIZE = 20
+
+# نسخه‌های فیلتر شده: نام ← (توضیح، شرط روی رکورد اصلی و پروکسی نرمال‌شده)
+VARIANT_FILTERS = {
+    'v2ray': ("فقط vmess/vless", lambda proxy, clash_proxy: clash_proxy['type'] in ['vmess', 'vless']),
+    'active': ("فقط پروکسی‌های فعال", lambda proxy, clash_proxy: bool(proxy.get('is_active', False))),
+    'udp': ("فقط پروکسی‌های با پشتیبانی UDP", lambda proxy, clash_proxy: bool(clash_proxy.get('udp'))),
+}
+
+PAYLOAD_HASH_PREFIX = "# payload-sha256: "
+
+DELTA_DIR = 'delta'
+# تعداد deltaهای نگه‌داشته شده؛ کلاینت عقب‌تر از این باید فایل کامل را بگیرد
+DELTA_HISTORY = 20
+
+
+def payload_hash(payload: Any) -> str:
+    """هش محتوای پایدار (سریال‌سازی قطعی JSON با کلیدهای مرتب)"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def read_payload_hash(path: str) -> Optional[str]:
+    """خواندن هش محتوا از خط اول فایل خروجی"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            first_line = f.readline().strip()
+    except OSError:
+        return None
+    if first_line.startswith(PAYLOAD_HASH_PREFIX):
+        return first_line[len(PAYLOAD_HASH_PREFIX):]
+    return None
+
+
+def atomic_write(path: str, content: str):
+    """نوشتن اتمیک: فایل موقت در همان پوشه و سپس rename"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp فایل را با دسترسی 0600 می‌سازد
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_if_changed(path: str, payload: Any, render) -> bool:
+    """نوشتن فایل فقط در صورت تغییر محتوای پروکسی‌ها (متادیتای متغیر خارج از هش)"""
+    digest = payload_hash(payload)
+    if read_payload_hash(path) == digest:
+        return False
+    atomic_write(path, f"{PAYLOAD_HASH_PREFIX}{digest}\n" + render(digest))
+    return True
+
+
+def write_content_if_changed(path: str, content: str) -> bool:
+    """نوشتن فایل‌های بدون متادیتا (base64، JSON، متن) فقط در صورت تغییر محتوا"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    atomic_write(path, content)
+    return True
+
+
+def normalize_proxy(proxy: Dict[str, Any], used_names: Set[str]) -> Optional[Dict[str, Any]]:
+    """تبدیل یک رکورد config.yaml به پروکسی آماده کلش (فقط یک بار برای همه فرمت‌ها)"""
+    if not all(key in proxy for key in ['server', 'port', 'type']):
+        return None
+    
+    # نام‌ها در کلش باید یکتا باشند
+    base_name = str(proxy.get('name') or f"{proxy['server']}:{proxy['port']}")
+    name = base_name
+    counter = 2
+    while name in used_names:
+        name = f"{base_name} #{counter}"
+        counter += 1
+    used_names.add(name)
+    
+    clash_proxy = {
+        'name': name,
+        'type': str(proxy['type']),
+        'server': str(proxy['server']),
+        'port': int(proxy['port']),
+        # udp از آزمون رله UDP؛ بدون اندازه‌گیری مقدار محافظه‌کارانه
+        'udp': udp_value(proxy)
+    }
+    
+    if proxy['type'] in ['vmess', 'vless']:
+        clash_proxy['uuid'] = proxy.get('uuid', '')
+        clash_proxy['tls'] = bool(proxy.get('tls', False))
+        
+        if proxy['type'] == 'vmess':
+            clash_proxy['alterId'] = max(proxy.get('alterId', 0), 4)
+            clash_proxy['cipher'] = proxy.get('cipher', 'auto')
+        
+        if proxy.get('network') == 'ws':
+            clash_proxy['network'] = 'ws'
+            if proxy.get('ws-opts'):
+                clash_proxy['ws-opts'] = proxy['ws-opts']
+        
+        if clash_proxy['tls']:
+            host = clash_proxy.get('ws-opts', {}).get('headers', {}).get('Host', '')
+            sni = proxy.get('sni') or host or proxy['server']
+            if proxy['type'] == 'vmess':
+                clash_proxy['sni'] = sni
+            else:
+                clash_proxy['servername'] = sni
+    
+    elif proxy['type'] == 'ss':
+        if 'cipher' in proxy:
+            clash_proxy['cipher'] = proxy['cipher']
+        if 'password' in proxy:
+            clash_proxy['password'] = proxy['password']
+    
+    return clash_proxy
+
+
+def share_link(proxy: Dict[str, Any]) -> Optional[str]:
+    """ساخت لینک اشتراک استاندارد از پروکسی نرمال‌شده"""
+    name = quote(proxy['name'], safe='')
+    ws_opts = proxy.get('ws-opts', {})
+    host = ws_opts.get('headers', {}).get('Host', '')
+    
+    if proxy['type'] == 'vmess':
+        conf = {
+            'v': '2',
+            'ps': proxy['name'],
+            'add': proxy['server'],
+            'port': str(proxy['port']),
+            'id': proxy.get('uuid', ''),
+            'aid': str(proxy.get('alterId', 0)),
+            'scy': proxy.get('cipher', 'auto'),
+            'net': proxy.get('network', 'tcp'),
+            'type': 'none',
+            'host': host,
+            'path': ws_opts.get('path', ''),
+            'tls': 'tls' if proxy.get('tls') else '',
+            'sni': proxy.get('sni', ''),
+        }
+        encoded = base64.b64encode(json.dumps(conf, ensure_ascii=False).encode('utf-8')).decode()
+        return f"vmess://{encoded}"
+    
+    if proxy['type'] == 'vless':
+        params = {
+            'encryption': 'none',
+            'security': 'tls' if proxy.get('tls') else 'none',
+            'type': proxy.get('network', 'tcp'),
+        }
+        if host:
+            params['host'] = host
+        if ws_opts.get('path'):
+            params['path'] = ws_opts['path']
+        if proxy.get('servername'):
+            params['sni'] = proxy['servername']
+        return f"vless://{proxy.get('uuid', '')}@{proxy['server']}:{proxy['port']}?{urlencode(params)}#{name}"
+    
+    if proxy['type'] == 'ss':
+        if 'cipher' not in proxy or 'password' not in proxy:
+            return None
+        userinfo = base64.urlsafe_b64encode(f"{proxy['cipher']}:{proxy['password']}".encode('utf-8')).decode().rstrip('=')
+        return f"ss://{userinfo}@{proxy['server']}:{proxy['port']}#{name}"
+    
+    if proxy['type'] in ['http', 'socks5']:
+        return f"{proxy['type']}://{proxy['server']}:{proxy['port']}#{name}"
+    
+    return None
+
+
+def singbox_outbound(proxy: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ساخت outbound سینگ‌باکس از پروکسی نرمال‌شده"""
+    outbound = {
+        'tag': proxy['name'],
+        'server': proxy['server'],
+        'server_port': proxy['port'],
+    }
+    
+    if proxy['type'] in ['vmess', 'vless']:
+        outbound['type'] = proxy['type']
+        outbound['uuid'] = proxy.get('uuid', '')
+        if proxy['type'] == 'vmess':
+            outbound['security'] = proxy.get('cipher', 'auto')
+            outbound['alter_id'] = proxy.get('alterId', 0)
+        if proxy.get('tls'):
+            outbound['tls'] = {
+                'enabled': True,
+                'server_name': proxy.get('sni') or proxy.get('servername') or proxy['server'],
+            }
+        if proxy.get('network') == 'ws':
+            ws_opts = proxy.get('ws-opts', {})
+            outbound['transport'] = {
+                'type': 'ws',
+                'path': ws_opts.get('path', '/'),
+                'headers': ws_opts.get('headers', {}),
+            }
+    elif proxy['type'] == 'ss':
+        if 'cipher' not in proxy or 'password' not in proxy:
+            return None
+        outbound['type'] = 'shadowsocks'
+        outbound['method'] = proxy['cipher']
+        outbound['password'] = proxy['password']
+    elif proxy['type'] == 'http':
+        outbound['type'] = 'http'
+    elif proxy['type'] == 'socks5':
+        outbound['type'] = 'socks'
+        outbound['version'] = '5'
+    else:
+        return None
+    
+    return outbound
+
+
+def bandwidth_members(entries: List[Tuple]) -> List[Tuple]:
+    """پروکسی‌های فعال پرسرعت به ترتیب سرعت دانلود اندازه‌گیری شده"""
+    measured = [e for e in entries if e[0].get('is_active', False)
+                and (e[0].get('speed_kbps') or 0) >= BANDWIDTH_MIN_KBPS]
+    return heapq.nlargest(BANDWIDTH_GROUP_SIZE, measured, key=lambda e: e[0]['speed_kbps'])
+
+
+def build_clash_config(clash_proxies: List[Dict[str, Any]], active_count: int,
+                       bandwidth_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """ساختار کامل کانفیگ کلش"""
+    groups = [
+        {
+            'name': '🚀 Auto Select',
+            'type': 'url-test',
+            # گروه خالی در کلش نامعتبر است
+            'proxies': [p['name'] for p in clash_proxies] or ['DIRECT'],
+            'url': TEST_URL,
+            'interval': 300
+        },
+        {
+            'name': '🌍 Proxy',
+            'type': 'select',
+            'proxies': ['🚀 Auto Select', 'DIRECT']
+        }
+    ]
+    if bandwidth_names:
+        # fallback ترتیب سرعت را حفظ می‌کند (url-test فقط کمترین تاخیر را انتخاب می‌کند)
+        groups.insert(1, {
+            'name': BANDWIDTH_GROUP,
+            'type': 'fallback',
+            'proxies': bandwidth_names,
+            'url': TEST_URL,
+            'interval': 300
+        })
+        groups[-1]['proxies'].insert(1, BANDWIDTH_GROUP)
+    
+    return {
+        'proxies': clash_proxies,
+        'proxy-groups': groups,
+        'rules': [
+            'DOMAIN-SUFFIX,google.com,🌍 Proxy',
+            'DOMAIN-SUFFIX,youtube.com,🌍 Proxy',
+            'DOMAIN-SUFFIX,telegram.org,🌍 Proxy',
+            'GEOIP,IR,DIRECT',
+            'MATCH,🌍 Proxy'
+        ],
+        'metadata': {
+            'generated': datetime.now().isoformat(),
+            'source': 'Iran Proxy Manager',
+            'total_proxies': len(clash_proxies),
+            'active_proxies': active_count
+        }
+    }
+
+
+def build_singbox_config(outbounds: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """ساختار کانفیگ sing-box با گروه‌های selector و urltest"""
+    tags = [o['tag'] for o in outbounds]
+    return {
+        'log': {'level': 'warn'},
+        'outbounds': [
+            {'type': 'selector', 'tag': 'proxy', 'outbounds': ['auto'] + tags + ['direct']},
+            {'type': 'urltest', 'tag': 'auto', 'outbounds': tags, 'url': TEST_URL, 'interval': '5m'},
+        ] + outbounds + [
+            {'type': 'direct', 'tag': 'direct'},
+        ],
+        'route': {'final': 'proxy'},
+    }
+
+
+def links_to_text(links: List[str]) -> str:
+    """لیست لینک‌های اشتراک به متن (هر خط یک لینک)"""
+    return "\n".join(links) + "\n" if links else ""
+
+
+def select_variants(entries: List[Tuple]) -> Dict[str, Tuple[str, List[Tuple]]]:
+    """انتخاب اعضای هر نسخه فیلتر شده از روی ورودی‌های رندر شده"""
+    variants = {}
+    for name, (description, condition) in VARIANT_FILTERS.items():
+        variants[name] = (description, [e for e in entries if condition(e[0], e[1])])
+    
+    # سریع‌ترین پروکسی‌های فعال بر اساس پینگ
+    measured = [e for e in entries if e[0].get('is_active', False) and (e[0].get('ping', 0) or 0) > 0]
+    fastest = heapq.nsmallest(FAST_VARIANT_SIZE, measured, key=lambda e: e[0]['ping'])
+    variants['fast'] = (f"{FAST_VARIANT_SIZE} پروکسی فعال با کمترین پینگ", fastest)
+    
+    # بیشترین سرعت دانلود (فقط وقتی آزمون سرعت اجرا شده باشد)
+    widest = bandwidth_members(entries)
+    if widest:
+        variants['bandwidth'] = (f"حداکثر {BANDWIDTH_GROUP_SIZE} پروکسی فعال با بیشترین سرعت دانلود", widest)
+    return variants
+
+
+def render_outputs(proxies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """نرمال‌سازی در یک گذر و ساخت همه فرمت‌ها و نسخه‌های فیلتر شده در حافظه"""
+    entries = []
+    used_names = set()
+    
+    for proxy in proxies:
+        clash_proxy = normalize_proxy(proxy, used_names)
+        if not clash_proxy:
+            continue
+        entries.append((proxy, clash_proxy, share_link(clash_proxy), singbox_outbound(clash_proxy)))
+    
+    active_count = len([e for e in entries if e[0].get('is_active', False)])
+    bandwidth_names = [e[1]['name'] for e in bandwidth_members(entries)]
+    links_text = links_to_text([e[2] for e in entries if e[2]])
+    
+    variants = {}
+    for name, (description, members) in select_variants(entries).items():
+        variant_links = links_to_text([e[2] for e in members if e[2]])
+        member_names = {e[1]['name'] for e in members}
+        variants[name] = {
+            'description': description,
+            'clash': build_clash_config([e[1] for e in members],
+                                        len([e for e in members if e[0].get('is_active', False)]),
+                                        [n for n in bandwidth_names if n in member_names]),
+            'subscription': base64.b64encode(variant_links.encode('utf-8')).decode(),
+        }
+    
+    return {
+        'clash': build_clash_config([e[1] for e in entries], active_count, bandwidth_names),
+        'links': links_text,
+        'subscription': base64.b64encode(links_text.encode('utf-8')).decode(),
+        'singbox': json.dumps(build_singbox_config([e[3] for e in entries if e[3]]), ensure_ascii=False, indent=2) + "\n",
+        'variants': variants,
+    }
+
+
+def write_clash_config(path: str, clash_config: Dict[str, Any]) -> bool:
+    """نوشتن کانفیگ کلش با هش محتوا (metadata خارج از هش)"""
+    payload = {key: clash_config[key] for key in ['proxies', 'proxy-groups', 'rules']}
+    clash_config['metadata']['payload_hash'] = payload_hash(payload)
+    
+    def render_clash(digest):
+        return yaml.dump(clash_config,
+                         Dumper=YAML_DUMPER,
+                         default_flow_style=False,
+                         allow_unicode=True,
+                         indent=2)
+    
+    return write_if_changed(path, payload, render_clash)
+
+
+def delta_base_key(proxy: Dict[str, Any]) -> str:
+    """کلید پایه پروکسی (نوع، سرور، پورت و شناسه)؛ نام که پینگ را دارد جزو کلید نیست"""
+    identity = proxy.get('uuid') or proxy.get('password') or ''
+    base_key = f"{proxy['type']}://{proxy['server']}:{proxy['port']}"
+    if identity:
+        base_key += f"#{hashlib.sha1(str(identity).encode('utf-8')).hexdigest()[:8]}"
+    return base_key
+
+
+def delta_keys(clash_proxies: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """کلید پایدار و مستقل از ترتیب هر پروکسی ← پروکسی"""
+    groups = {}
+    for proxy in clash_proxies:
+        groups.setdefault(delta_base_key(proxy), []).append(proxy)
+    
+    keyed = {}
+    for base_key, proxies in groups.items():
+        if len(proxies) == 1:
+            keyed[base_key] = proxies[0]
+            continue
+        # کلیدهای تکراری با هش محتوای بدون نام جدا می‌شوند (پروکسی‌های کاملا یکسان یکی می‌شوند)
+        for proxy in proxies:
+            content = {field: value for field, value in proxy.items() if field != 'name'}
+            keyed[f"{base_key}~{payload_hash(content)[:8]}"] = proxy
+    return keyed
+
+
+def read_json(path: str) -> Optional[Dict[str, Any]]:
+    """خواندن فایل JSON (None = نبود یا خراب بودن فایل)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def build_delta(clash_proxies: List[Dict[str, Any]], output_dir: str) -> Dict[str, Any]:
+    """مقایسه پروکسی‌های کلش با آخرین نسخه منتشر شده (نسخه فقط با تغییر پروکسی‌ها بالا می‌رود)"""
+    state = read_json(os.path.join(output_dir, DELTA_DIR, 'state.json')) or {'revision': 0, 'digests': {}}
+    previous = state.get('digests', {})
+    keyed = delta_keys(clash_proxies)
+    current = {key: payload_hash(proxy)[:16] for key, proxy in keyed.items()}
+    
+    # added و changed مثل removed با همان کلیدها هستند تا کلاینت بتواند deltaهای بعدی را اعمال کند
+    added = {key: keyed[key] for key in current if key not in previous}
+    removed = sorted(key for key in previous if key not in current)
+    changed = {key: keyed[key] for key in current if key in previous and previous[key] != current[key]}
+    
+    revision = state.get('revision', 0)
+    changed_any = bool(added or removed or changed) or not revision
+    return {
+        'from': revision,
+        'revision': revision + 1 if changed_any else revision,
+        'changed_any': changed_any,
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'digests': current,
+    }
+
+
+def write_delta(delta: Dict[str, Any], output_dir: str, full_path: str, full_hash: str) -> Dict[str, bool]:
+    """نوشتن فایل delta نسخه جدید، وضعیت و manifest (فایل‌های delta خارج از manifest حذف می‌شوند)"""
+    written = {}
+    delta_dir = os.path.join(output_dir, DELTA_DIR)
+    manifest_path = os.path.join(delta_dir, 'manifest.json')
+    manifest = read_json(manifest_path)
+    if not delta['changed_any'] and manifest is not None:
+        return written
+    manifest = manifest or {'deltas': []}
+    
+    deltas = [d for d in manifest.get('deltas', []) if d['to'] < delta['revision']]
+    # نسخه اول (یا از دست رفتن وضعیت) delta ندارد؛ کلاینت فایل کامل را می‌گیرد
+    if delta['from'] and delta['changed_any']:
+        name = f"r{delta['revision']:06d}.json"
+        content = json.dumps({
+            'from': delta['from'],
+            'to': delta['revision'],
+            'added': delta['added'],
+            'removed': delta['removed'],
+            'changed': delta['changed'],
+        }, ensure_ascii=False, sort_keys=True) + "\n"
+        path = os.path.join(delta_dir, name)
+        written[path] = write_content_if_changed(path, content)
+        deltas.append({
+            'from': delta['from'],
+            'to': delta['revision'],
+            'file': f"{DELTA_DIR}/{name}",
+            'bytes': len(content.encode('utf-8')),
+            'added': len(delta['added']),
+            'removed': len(delta['removed']),
+            'changed': len(delta['changed']),
+        })
+    
+    deltas = deltas[-DELTA_HISTORY:]
+    prune_deltas(delta_dir, deltas)
+    
+    state_path = os.path.join(delta_dir, 'state.json')
+    state_text = json.dumps({'revision': delta['revision'], 'digests': delta['digests']}, sort_keys=True) + "\n"
+    written[state_path] = write_content_if_changed(state_path, state_text)
+    
+    manifest = {
+        'revision': delta['revision'],
+        'generated': datetime.now().isoformat(),
+        'full': {
+            'file': os.path.relpath(full_path, output_dir).replace(os.sep, '/'),
+            'sha256': full_hash,
+            'bytes': os.path.getsize(full_path) if os.path.exists(full_path) else 0,
+        },
+        # کلاینت با نسخه r فایل‌های deltaهایی با from >= r را به ترتیب اعمال می‌کند
+        'oldest': deltas[0]['from'] if deltas else delta['revision'],
+        'deltas': deltas,
+    }
+    written[manifest_path] = write_content_if_changed(
+        manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n")
+    return written
+
+
+def prune_deltas(delta_dir: str, deltas: List[Dict[str, Any]]):
+    """حذف فایل‌های delta که manifest به آن‌ها اشاره نمی‌کند (قدیمی یا مانده از وضعیت بازنشانی شده)"""
+    if not os.path.isdir(delta_dir):
+        return
+    referenced = {os.path.basename(d['file']) for d in deltas}
+    for name in os.listdir(delta_dir):
+        if re.fullmatch(r'r\d+\.json', name) and name not in referenced:
+            os.remove(os.path.join(delta_dir, name))
+
+
+def deltas_since(manifest: Dict[str, Any], revision: int) -> Optional[List[str]]:
+    """فایل‌های delta لازم برای رسیدن از revision به نسخه فعلی (None = فایل کامل ارزان‌تر یا لازم است)"""
+    if revision == manifest.get('revision'):
+        return []
+    if revision < manifest.get('oldest', 0) or revision > manifest.get('revision', 0):
+        return None
+    needed = [d for d in manifest.get('deltas', []) if d['from'] >= revision]
+    if not needed or needed[0]['from'] != revision:
+        return None
+    if sum(d['bytes'] for d in needed) >= manifest.get('full', {}).get('bytes', 0):
+        return None
+    return [d['file'] for d in needed]
+
+
+def write_variants(variants: Dict[str, Dict[str, Any]], output_dir: str) -> Dict[str, bool]:
+    """نوشتن نسخه‌های فیلتر شده و فایل فهرست آن‌ها (نسخه‌های خارج از فهرست حذف می‌شوند)"""
+    written = {}
+    variants_dir = os.path.join(output_dir, VARIANTS_DIR)
+    index = {}
+    
+    for name in sorted(variants):
+        variant = variants[name]
+        clash_file = f"{name}.yaml"
+        subscription_file = f"{name}.txt"
+        
+        clash_path = os.path.join(variants_dir, clash_file)
+        written[clash_path] = write_clash_config(clash_path, variant['clash'])
+        subscription_path = os.path.join(variants_dir, subscription_file)
+        written[subscription_path] = write_content_if_changed(subscription_path, variant['subscription'])
+        
+        index[name] = {
+            'description': variant['description'],
+            'count': len(variant['clash']['proxies']),
+            'clash': f"{VARIANTS_DIR}/{clash_file}",
+            'subscription': f"{VARIANTS_DIR}/{subscription_file}",
+            'sha256': variant['clash']['metadata']['payload_hash'],
+        }
+    
+    index_path = os.path.join(variants_dir, 'index.json')
+    index_text = json.dumps({'variants': index}, ensure_ascii=False, indent=2, sort_keys=True) + "\n"
+    written[index_path] = write_content_if_changed(index_path, index_text)
+    
+    # نسخه‌ای که از انتخاب خارج شده (مثلا bandwidth بدون اندازه‌گیری) دیگر سرو نمی‌شود
+    listed = {os.path.basename(entry[kind]) for entry in index.values() for kind in ['clash', 'subscription']}
+    for name in os.listdir(variants_dir):
+        if name.endswith(('.yaml', '.txt')) and name not in listed:
+            os.remove(os.path.join(variants_dir, name))
+    return written
+
+
+def write_outputs(rendered: Dict[str, Any], output_dir: str = "output") -> Dict[str, bool]:
+    """نوشتن همه فرمت‌ها (فقط فایل‌های تغییر کرده)"""
+    written = {}
+    
+    clash_path = os.path.join(output_dir, OUTPUT_FILES['clash'])
+    delta = build_delta(rendered['clash']['proxies'], output_dir)
+    rendered['clash']['metadata']['revision'] = delta['revision']
+    written[clash_path] = write_clash_config(clash_path, rendered['clash'])
+    written.update(write_delta(delta, output_dir, clash_path, rendered['clash']['metadata']['payload_hash']))
+    
+    for kind in ['subscription', 'singbox', 'links']:
+        path = os.path.join(output_dir, OUTPUT_FILES[kind])
+        written[path] = write_content_if_changed(path, rendered[kind])
+    
+    written.update(write_variants(rendered.get('variants', {}), output_dir))
+    return written
+
+
+def main():
+    """رندر دوباره خروجی‌ها از output/config.yaml"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output_dir = os.path.join(base_dir, 'output')
+    input_path = os.path.join(output_dir, 'config.yaml')
+    
+    if not os.path.exists(input_path):
+        print("❌ فایل کانفیگ اصلی یافت نشد!")
+        return 1
+    
+    with open(input_path, 'r', encoding='utf-8') as f:
+        config = yaml.load(f, Loader=YAML_LOADER)
+    
+    if not config or 'proxies' not in config:
+        print("❌ ساختار فایل نامعتبر است!")
+        return 1
+    
+    rendered = render_outputs(config['proxies'])
+    for path, changed in write_outputs(rendered, output_dir).items():
+        print(f"{'✅' if changed else '⏸️'} {os.path.relpath(path, base_dir)}")
+    print(f"📊 تعداد پروکسی‌ها: {len(rendered['clash']['proxies'])}")
+    
+    repo_name = os.environ.get('GITHUB_REPOSITORY', 'your-username/your-repo')
+    print(f"\n🔗 لینک مستقیم ساب‌اسکریپشن:")
+    print(f"https://raw.githubusercontent.com/{repo_name}/main/output/{OUTPUT_FILES['subscription']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
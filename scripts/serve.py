@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+سرور محلی ساب‌اسکریپشن
+خروجی‌ها از حافظه سرو می‌شوند با gzip/brotli از پیش محاسبه شده،
+ETag قوی، پاسخ 304 و پشتیبانی از Range
+"""
+
+import os
+import sys
+import gzip
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple, List
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+CONTENT_TYPES = {
+    '.yaml': 'text/yaml; charset=utf-8',
+    '.yml': 'text/yaml; charset=utf-8',
+    '.txt': 'text/plain; charset=utf-8',
+    '.json': 'application/json',
+}
+
+# پوشه‌هایی که سرو نمی‌شوند
+EXCLUDED_DIRS = {'logs', 'shards'}
+
+
+class ContentEntry:
+    """یک فایل خروجی با همه کدگذاری‌های از پیش محاسبه شده"""
+    def __init__(self, name: str, body: bytes, mtime: float):
+        self.name = name
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        self.last_modified = formatdate(mtime, usegmt=True)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        
+        # هر کدگذاری نمایش جداگانه‌ای است و ETag قوی خودش را دارد
+        self.representations = {'identity': (body, f'"{digest}"')}
+        self.representations['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if HAS_BROTLI:
+            self.representations['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+    
+    def etags(self) -> List[str]:
+        """همه ETagهای این فایل"""
+        return [etag for _, etag in self.representations.values()]
+
+
+class ContentStore:
+    """نگهداری خروجی‌ها در حافظه با جایگزینی اتمیک پس از هر اجرا"""
+    def __init__(self, output_dir: str = "output"):
+        self.output_dir = output_dir
+        self.entries = {}
+        self.signature = None
+        self.lock = threading.Lock()
+    
+    def scan(self) -> Dict[str, Tuple[str, float, int]]:
+        """فهرست فایل‌های قابل سرو: نام ← (مسیر، mtime، اندازه)"""
+        files = {}
+        for root, dirs, names in os.walk(self.output_dir):
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS and not d.startswith('.')]
+            for name in names:
+                if name.startswith('.') or os.path.splitext(name)[1] not in CONTENT_TYPES:
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.output_dir).replace(os.sep, '/')
+                stat = os.stat(path)
+                files[rel] = (path, stat.st_mtime, stat.st_size)
+        return files
+    
+    def publish(self, contents: Dict[str, Tuple[bytes, float]]):
+        """ساخت کامل نسخه جدید و جایگزینی یکجا (درخواست‌های در حال اجرا نسخه قبلی را می‌بینند)"""
+        entries = {name: ContentEntry(name, body, mtime) for name, (body, mtime) in contents.items()}
+        with self.lock:
+            self.entries = entries
+    
+    def reload_if_changed(self) -> bool:
+        """بارگذاری دوباره از دیسک در صورت تغییر فایل‌ها"""
+        files = self.scan()
+        signature = tuple(sorted((name, mtime, size) for name, (_, mtime, size) in files.items()))
+        if signature == self.signature:
+            return False
+        
+        contents = {}
+        for name, (path, mtime, _) in files.items():
+            with open(path, 'rb') as f:
+                contents[name] = (f.read(), mtime)
+        self.publish(contents)
+        self.signature = signature
+        return True
+    
+    def get(self, name: str) -> Optional[ContentEntry]:
+        """دریافت یک فایل از نسخه فعلی"""
+        return self.entries.get(name)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """پارس Accept-Encoding به کدگذاری ← q"""
+    accepted = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(entry: ContentEntry, header: str) -> str:
+    """انتخاب بهترین کدگذاری موجود بر اساس Accept-Encoding"""
+    accepted = parse_accept_encoding(header or '')
+    for coding in ['br', 'gzip']:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if coding in entry.representations and q > 0:
+            return coding
+    return 'identity'
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """پارس یک بازه bytes=start-end (None = نامعتبر، بازه‌های چندگانه پشتیبانی نمی‌شوند)"""
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition('-')
+    try:
+        if start_text == '':
+            suffix = int(end_text)
+            if suffix <= 0:
+                return None
+            return max(length - suffix, 0), length - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return None
+    return start, min(end, length - 1)
+
+
+class SubscriptionHandler(BaseHTTPRequestHandler):
+    """پاسخ به درخواست‌های GET/HEAD از روی ContentStore"""
+    store = None
+    server_version = "IranProxySubscription/1.0"
+    
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+    
+    def do_GET(self):
+        self.handle_request(send_body=True)
+    
+    def handle_request(self, send_body: bool):
+        """سرو یک فایل با مذاکره کدگذاری، 304 و Range"""
+        name = self.path.split('?', 1)[0].lstrip('/') or 'clash_config.yaml'
+        entry = self.store.get(name)
+        if entry is None:
+            self.send_error(404, "Not Found")
+            return
+        
+        coding = choose_encoding(entry, self.headers.get('Accept-Encoding', ''))
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        # Range روی نمایش بدون فشرده‌سازی اعمال می‌شود
+        if range_header and (not if_range or if_range.strip() == entry.representations['identity'][1]):
+            coding = 'identity'
+        else:
+            range_header = None
+        
+        body, etag = entry.representations[coding]
+        
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+            if '*' in tags or any(tag in entry.etags() for tag in tags):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_common_headers(entry)
+                self.end_headers()
+                return
+        
+        status = 200
+        content_range = None
+        if range_header:
+            byte_range = parse_range(range_header, len(body))
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range
+            content_range = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+            status = 206
+        
+        self.send_response(status)
+        self.send_header('Content-Type', entry.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        if coding != 'identity':
+            self.send_header('Content-Encoding', coding)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.send_common_headers(entry)
+        self.end_headers()
+        
+        if send_body:
+            self.wfile.write(body)
+    
+    def send_common_headers(self, entry: ContentEntry):
+        """هدرهای مشترک پاسخ‌های 200/206/304"""
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def watch(store: ContentStore, interval: float, stop_event: threading.Event):
+    """بررسی دوره‌ای تغییر فایل‌ها و جایگزینی اتمیک محتوا"""
+    while not stop_event.wait(interval):
+        try:
+            if store.reload_if_changed():
+                print(f"🔄 خروجی‌ها دوباره بارگذاری شدند ({len(store.entries)} فایل)")
+        except Exception as e:
+            print(f"⚠️ خطا در بارگذاری خروجی‌ها: {e}")
+
+
+def create_server(store: ContentStore, host: str = "0.0.0.0", port: int = 8080) -> ThreadingHTTPServer:
+    """ساخت سرور HTTP متصل به ContentStore"""
+    handler = type('BoundSubscriptionHandler', (SubscriptionHandler,), {'store': store})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(output_dir: str = "output", host: str = "0.0.0.0", port: int = 8080, interval: float = 5.0):
+    """اجرای سرور تا زمان توقف"""
+    store = ContentStore(output_dir)
+    store.reload_if_changed()
+    
+    stop_event = threading.Event()
+    watcher = threading.Thread(target=watch, args=(store, interval, stop_event), daemon=True)
+    watcher.start()
+    
+    server = create_server(store, host, port)
+    print(f"🌐 سرور ساب‌اسکریپشن روی http://{host}:{port}/ ({len(store.entries)} فایل)")
+    if not HAS_BROTLI:
+        print("⚠️ فشرده‌سازی brotli غیرفعال است: ماژول brotli نصب نیست (pip install -r requirements.txt) - فقط gzip")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        server.server_close()
+
+
+def main():
+    """تابع اصلی"""
+    parser = argparse.ArgumentParser(description="سرور محلی ساب‌اسکریپشن")
+    parser.add_argument('--dir', default="output", help="پوشه خروجی‌ها")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--interval', type=float, default=5.0, help="فاصله بررسی تغییر فایل‌ها (ثانیه)")
+    args = parser.parse_args()
+    
+    serve(args.dir, args.host, args.port, args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,7 @@
 """
 
 import yaml
-import requests
+import argparse
 from datetime import datetime, timedelta
 import os
 import sys
@@ -16,16 +16,185 @@ import json
 import re
 import random
 import threading
+import zlib
+import signal
+import atexit
+import functools
+import gzip
+import shutil
+import hashlib
+from contextlib import contextmanager
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
-from typing import List, Dict, Any, Tuple, Set, Optional
+from typing import List, Dict, Any, Tuple, Set, Optional, Iterable, Union
+
+from render import render_outputs, write_outputs, write_if_changed, YAML_DUMPER, YAML_LOADER
+from health import (update_health, seed_health, health_score, stable_health, parse_time, top_k, bottom_k,
+                    rank_proxies, DEAD_SCORE, HEALTHY_SCORE)
+
+try:
+    import dns.resolver
+    HAS_DNSPYTHON = True
+except ImportError:
+    HAS_DNSPYTHON = False
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# لاگ خام تازه‌تر از این ممکن است متعلق به اجرایی باشد که هنوز قفلش را نگرفته است
+LIVE_LOG_GRACE_SECONDS = 60
+# بدون fcntl لاگ خام فقط پس از این مدت بی‌تغییری رها شده حساب می‌شود
+ABANDONED_LOG_SECONDS = 6 * 3600
+# وضعیت اجرا (لاگ‌ها و آمار منابع) خارج از output/ تا در تاریخچه git جمع نشود
+STATE_DIR = ".state"
+LEGACY_SOURCE_STATS = "output/source_stats.json"
+
+IPV4_RE = re.compile(r"^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$")
+
+# رنج‌های bogon/خصوصی/رزرو شده (RFC 1918, 5735, 6598, ...)
+BOGON_NETWORKS = [
+    "0.0.0.0/8",
+    "10.0.0.0/8",
+    "100.64.0.0/10",
+    "127.0.0.0/8",
+    "169.254.0.0/16",
+    "172.16.0.0/12",
+    "192.0.0.0/24",
+    "192.0.2.0/24",
+    "192.88.99.0/24",
+    "192.168.0.0/16",
+    "198.18.0.0/15",
+    "198.51.100.0/24",
+    "203.0.113.0/24",
+    "224.0.0.0/4",
+    "240.0.0.0/4",
+]
+
+
+def ipv4_to_int(ip: str) -> Optional[int]:
+    """تبدیل IPv4 به عدد صحیح (برای نام دامنه None برمی‌گرداند)"""
+    match = IPV4_RE.match(ip or "")
+    if not match:
+        return None
+    a, b, c, d = (int(part) for part in match.groups())
+    if a > 255 or b > 255 or c > 255 or d > 255:
+        return None
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def build_interval_table(networks: Iterable[str]) -> Tuple[List[int], List[int]]:
+    """ساخت جدول بازه‌های مرتب و ادغام‌شده برای جستجوی دودویی"""
+    intervals = []
+    for network in networks:
+        base, prefix = network.split('/')
+        start = ipv4_to_int(base)
+        size = 1 << (32 - int(prefix))
+        intervals.append((start, start + size - 1))
+    intervals.sort()
+    
+    starts, ends = [], []
+    for start, end in intervals:
+        if starts and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+BOGON_STARTS, BOGON_ENDS = build_interval_table(BOGON_NETWORKS)
+
+
+def is_bogon_int(ip_int: int) -> bool:
+    """بررسی عضویت IP در جدول بازه‌های bogon"""
+    idx = bisect_right(BOGON_STARTS, ip_int) - 1
+    return idx >= 0 and ip_int <= BOGON_ENDS[idx]
+
+def log_stage(stage: str):
+    """دکوراتور تنظیم مرحله (stage) برای رویدادهای لاگ یک متد"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.logger.scope(stage=stage):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def proxy_key(proxy: Dict[str, Any]) -> str:
+    """کلید یکتای پروکسی برای حذف تکراری‌ها"""
+    return f"{proxy.get('server', '')}:{proxy.get('port', 0)}-{proxy.get('type', '')}"
+
+
+# اندازه‌گیری‌هایی که در هر بررسی تغییر می‌کنند و تغییر محتوای config.yaml حساب نمی‌شوند
+UNHASHED_FIELDS = {'probe', 'udp_ping', 'speed_kbps'}
+
+# گام گرد کردن پینگ در هش محتوا (میلی‌ثانیه) و پسوند پینگ در نام پروکسی
+PING_HASH_STEP = 100
+PING_SUFFIX_RE = re.compile(r' \(\d+ms\)$')
+
+
+def hash_view(proxy: Dict[str, Any]) -> Dict[str, Any]:
+    """نمای پایدار رکورد پروکسی برای هش محتوای config.yaml"""
+    view = {field: value for field, value in proxy.items() if field not in UNHASHED_FIELDS}
+    # زمان دقیق و تعداد بررسی‌ها هر اجرا تغییر می‌کنند؛ سلامت مثل last_checked در سطح روز هش می‌شود
+    if view.get('health'):
+        view['health'] = stable_health(view['health'])
+    # نوسان جزئی تاخیر بین اجراها تغییر محتوا نیست
+    if 'name' in view:
+        view['name'] = PING_SUFFIX_RE.sub('', str(view['name']))
+    if view.get('ping'):
+        view['ping'] = int(round(float(view['ping']) / PING_HASH_STEP)) * PING_HASH_STEP
+    return view
+
+
+# منابع لیست ساده ip:port که مستقیم روی بایت‌ها پیمایش می‌شوند
+PLAIN_LIST_TYPES = ['http', 'socks5', 'mixed']
+
+# CDNهای jsDelivr برای فایل‌های گیت‌هاب (همان محتوای raw.githubusercontent.com)
+GITHUB_MIRROR_HOSTS = ['cdn.jsdelivr.net', 'fastly.jsdelivr.net']
+
+
+def github_mirrors(url: str) -> List[str]:
+    """آدرس‌های جایگزین jsDelivr برای یک آدرس raw.githubusercontent.com"""
+    parsed = urlparse(url)
+    if parsed.netloc != 'raw.githubusercontent.com':
+        return []
+    parts = parsed.path.strip('/').split('/')
+    # فرم refs/heads/<branch> هم پشتیبانی می‌شود
+    if len(parts) > 5 and parts[2] == 'refs' and parts[3] == 'heads':
+        parts = parts[:2] + parts[4:]
+    if len(parts) < 4:
+        return []
+    user, repo, branch, path = parts[0], parts[1], parts[2], '/'.join(parts[3:])
+    return [f"https://{host}/gh/{user}/{repo}@{branch}/{path}" for host in GITHUB_MIRROR_HOSTS]
+
+
+def mirror_host(url: str) -> str:
+    """کلید تاریخچه تاخیر آینه (نام میزبان)"""
+    return urlparse(url).netloc
+
 
 class Logger:
-    """سیستم لاگ‌گیری پیشرفته با مدیریت خودکار فضای دیسک"""
-    def __init__(self, log_dir="output/logs"):
+    """سیستم لاگ‌گیری ساختاریافته (JSONL فشرده) با مدیریت خودکار فضای دیسک"""
+    def __init__(self, log_dir=os.path.join(STATE_DIR, "logs"), retention_days: int = 14, max_total_bytes: int = 20 * 1024 * 1024):
         self.log_dir = log_dir
+        self.retention_days = retention_days
+        self.max_total_bytes = max_total_bytes
         os.makedirs(self.log_dir, exist_ok=True)
         
+        # زمینه فعلی رویدادها (مرحله، منبع، ...)
+        self.context = {}
+        self.write_lock = threading.Lock()
+        self.closed = False
+        # بستن لاگ پیش از پاک شدن ماژول‌ها در پایان مفسر
+        atexit.register(self.close)
+        
         # آمارها
         self.stats = {
             'total_proxies_received': 0,
@@ -40,52 +209,149 @@ class Logger:
             'ip_cache_hits': 0,
             'api_requests': 0,
             'api_failures': 0,
+            'dns_lookups': 0,
+            'dns_cache_hits': 0,
+            'dns_rejected': 0,
+            'alive_cache_hits': 0,
+            'memo_hits': 0,
+            'geo_hedges': 0,
+            'geo_disagreements': 0,
+            'speed_tests': 0,
+            'udp_probes': 0,
+            'udp_supported': 0,
+            'udp_unmeasured': 0,
+            'geo_prefix_hits': 0,
+            'mirror_races': 0,
+            'mirror_wins': 0,
+            'mirror_mismatches': 0,
+            'geo_spot_checks': 0,
+            'geo_prefix_mixed': 0,
             'sources_used': 0,
             'sources_failed': 0,
             'old_logs_deleted': 0
         }
         
-        # حذف لاگ‌های قدیمی‌تر از 2 هفته
+        # حذف لاگ‌های قدیمی بر اساس سن و حجم کل
         self.clean_old_logs()
         
-        # فایل لاگ با timestamp
+        # لاگ رویدادهای JSONL با timestamp (هنگام بستن gzip می‌شود)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_file = os.path.join(self.log_dir, f"proxy_update_{timestamp}.log")
+        # pid در نام فایل تا اجراهای هم‌زمان (shardها، check کنار daemon) فایل هم را باز نکنند
+        self.event_file = os.path.join(self.log_dir, f"run_{timestamp}_{os.getpid()}.jsonl")
+        self.log_file = self.event_file + ".gz"
+        # latest.log فقط خلاصه متنی آخرین اجرا (بدون DEBUG) است و هر بار بازنویسی می‌شود
         self.console_log_file = os.path.join(self.log_dir, "latest.log")
         
         # باز کردن فایل‌ها
-        self.log_fd = open(self.log_file, 'w', encoding='utf-8')
+        self.log_fd = open(self.event_file, 'w', encoding='utf-8')
+        # قفل تا پایان اجرا نگه داشته می‌شود؛ لاگ قفل شده متعلق به اجرای زنده است
+        if HAS_FCNTL:
+            try:
+                fcntl.flock(self.log_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                pass
         self.console_log_fd = open(self.console_log_file, 'w', encoding='utf-8')
     
+    def compress_log(self, path: str):
+        """فشرده‌سازی یک فایل JSONL و حذف نسخه خام"""
+        with open(path, 'rb') as src, gzip.open(path + ".gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    
+    def is_abandoned(self, path: str) -> bool:
+        """لاگ خام رها شده (اجرای ناتمام) است؟ لاگ اجرای زنده قفل fcntl دارد"""
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return False
+        if age < LIVE_LOG_GRACE_SECONDS:
+            return False
+        if not HAS_FCNTL:
+            return age > ABANDONED_LOG_SECONDS
+        try:
+            with open(path, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(f, fcntl.LOCK_UN)
+            return True
+        except OSError:
+            return False
+    
     def clean_old_logs(self):
-        """حذف لاگ‌های قدیمی‌تر از 2 هفته"""
-        cutoff_date = datetime.now() - timedelta(days=14)
+        """حذف لاگ‌های قدیمی‌تر از مدت نگهداری و سپس قدیمی‌ترین‌ها تا رسیدن به سقف حجم"""
+        cutoff_date = datetime.now() - timedelta(days=self.retention_days)
         deleted_count = 0
         
         if os.path.exists(self.log_dir):
+            # فشرده‌سازی لاگ‌های خام اجراهای ناتمام قبلی (لاگ اجراهای هم‌زمان دست نمی‌خورد)
             for filename in os.listdir(self.log_dir):
-                if filename.endswith('.log'):
-                    file_path = os.path.join(self.log_dir, filename)
-                    
+                file_path = os.path.join(self.log_dir, filename)
+                if filename.endswith('.jsonl') and self.is_abandoned(file_path):
                     try:
-                        if filename.startswith('proxy_update_'):
-                            date_str = filename[13:21]  # YYYYMMDD
-                            file_date = datetime.strptime(date_str, "%Y%m%d")
-                            
-                            if file_date < cutoff_date:
-                                os.remove(file_path)
-                                deleted_count += 1
-                    except:
-                        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                        if file_mtime < cutoff_date:
-                            os.remove(file_path)
-                            deleted_count += 1
+                        self.compress_log(file_path)
+                    except OSError:
+                        pass
+            
+            log_files = []
+            for filename in os.listdir(self.log_dir):
+                if filename == 'latest.log' or not filename.endswith(('.log', '.jsonl.gz')):
+                    continue
+                file_path = os.path.join(self.log_dir, filename)
+                
+                try:
+                    if filename.startswith('run_'):
+                        date_str = filename[4:12]  # YYYYMMDD
+                    elif filename.startswith('proxy_update_'):
+                        date_str = filename[13:21]  # YYYYMMDD
+                    else:
+                        raise ValueError(filename)
+                    file_date = datetime.strptime(date_str, "%Y%m%d")
+                except ValueError:
+                    file_date = datetime.fromtimestamp(os.path.getmtime(file_path))
+                
+                if file_date < cutoff_date:
+                    os.remove(file_path)
+                    deleted_count += 1
+                else:
+                    log_files.append((file_date, filename, os.path.getsize(file_path)))
+            
+            # محدودیت حجم کل: حذف قدیمی‌ترین‌ها
+            log_files.sort()
+            total_bytes = sum(size for _, _, size in log_files)
+            for _, filename, size in log_files:
+                if total_bytes <= self.max_total_bytes:
+                    break
+                os.remove(os.path.join(self.log_dir, filename))
+                total_bytes -= size
+                deleted_count += 1
         
         self.stats['old_logs_deleted'] = deleted_count
         if deleted_count > 0:
-            print(f"🗑️  حذف {deleted_count} فایل لاگ قدیمی (بیشتر از 2 هفته)")
+            print(f"🗑️  حذف {deleted_count} فایل لاگ قدیمی (بیشتر از {self.retention_days} روز یا بیش از سقف حجم)")
+    
+    @contextmanager
+    def scope(self, **fields):
+        """تنظیم موقت زمینه رویدادها (مثلا stage و source)"""
+        previous = self.context
+        self.context = {**previous, **fields}
+        try:
+            yield
+        finally:
+            self.context = previous
     
-    def log(self, message: str, level: str = "INFO"):
+    def event(self, level: str, message: str, **fields):
+        """ثبت یک رویداد ساختاریافته در لاگ JSONL"""
+        record = {
+            'ts': datetime.now().isoformat(timespec='seconds'),
+            'level': level,
+            **self.context,
+            **fields,
+            'msg': message.strip(),
+        }
+        with self.write_lock:
+            if not self.closed:
+                self.log_fd.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    
+    def log(self, message: str, level: str = "INFO", **fields):
         """ذخیره لاگ در فایل و نمایش در کنسول"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         formatted_message = f"[{timestamp}] [{level}] {message}"
@@ -93,13 +359,18 @@ class Logger:
         # چاپ در کنسول
         print(formatted_message)
         
-        # ذخیره در فایل‌ها
-        self.log_fd.write(formatted_message + "\n")
-        self.console_log_fd.write(formatted_message + "\n")
+        # ذخیره رویداد ساختاریافته
+        self.event(level, message, **fields)
         
-        # flush برای اطمینان از ذخیره
-        self.log_fd.flush()
-        self.console_log_fd.flush()
+        with self.write_lock:
+            if self.closed:
+                return
+            if level != "DEBUG":
+                self.console_log_fd.write(formatted_message + "\n")
+            
+            # flush برای اطمینان از ذخیره
+            self.log_fd.flush()
+            self.console_log_fd.flush()
     
     def update_stat(self, stat_name: str, value: int = 1):
         """به‌روزرسانی آمار"""
@@ -133,6 +404,20 @@ class Logger:
         self.log(f"   • استفاده از کش IP: {self.stats['ip_cache_hits']:,}", "STATS")
         self.log(f"   • درخواست‌های API: {self.stats['api_requests']:,}", "STATS")
         self.log(f"   • خطاهای API: {self.stats['api_failures']:,}", "STATS")
+        self.log(f"   • پرسش‌های موازی (hedge): {self.stats['geo_hedges']:,}", "STATS")
+        self.log(f"   • اختلاف نظر سرویس‌های GeoIP: {self.stats['geo_disagreements']:,}", "STATS")
+        self.log(f"   • پاسخ استنتاجی از پیشوند: {self.stats['geo_prefix_hits']:,} "
+                 f"(بررسی نمونه‌ای: {self.stats['geo_spot_checks']:,}، پیشوند مختلط: {self.stats['geo_prefix_mixed']:,})", "STATS")
+        self.log(f"   • درخواست‌های DNS: {self.stats['dns_lookups']:,}", "STATS")
+        self.log(f"   • استفاده از کش DNS: {self.stats['dns_cache_hits']:,}", "STATS")
+        self.log(f"   • دامنه‌های رد شده (bogon/نامعتبر): {self.stats['dns_rejected']:,}", "STATS")
+        self.log(f"   • استفاده از کش سلامت: {self.stats['alive_cache_hits']:,}", "STATS")
+        self.log(f"   • پاسخ/نتیجه منبع از حافظه همین اجرا: {self.stats['memo_hits']:,}", "STATS")
+        self.log(f"   • دریافت با آینه: {self.stats['mirror_races']:,} (برنده آینه: {self.stats['mirror_wins']:,}، "
+                 f"پاسخ متفاوت: {self.stats['mirror_mismatches']:,})", "STATS")
+        self.log(f"   • آزمون‌های سرعت دانلود: {self.stats['speed_tests']:,}", "STATS")
+        self.log(f"   • آزمون‌های رله UDP: {self.stats['udp_probes']:,} (پشتیبانی: {self.stats['udp_supported']:,}، "
+                 f"بدون اندازه‌گیری: {self.stats['udp_unmeasured']:,})", "STATS")
         
         self.log(f"\n🗑️  مدیریت فایل‌ها:", "STATS")
         self.log(f"   • لاگ‌های قدیمی حذف شده: {self.stats['old_logs_deleted']}", "STATS")
@@ -140,46 +425,596 @@ class Logger:
         self.log("="*80, "STATS")
     
     def close(self):
-        """بستن فایل‌های لاگ"""
-        self.log_fd.close()
-        self.console_log_fd.close()
+        """بستن فایل‌های لاگ و فشرده‌سازی لاگ رویدادها"""
+        if self.closed:
+            return
+        self.event("STATS", "final stats", stats=self.stats)
+        with self.write_lock:
+            self.closed = True
+            self.log_fd.close()
+            self.console_log_fd.close()
+        try:
+            self.compress_log(self.event_file)
+        except OSError:
+            pass
+
+class RunBudget:
+    """بودجه زمانی کل اجرا و سهمیه توقف زودهنگام"""
+    def __init__(self, budget_seconds: Optional[float] = None, target_active: Optional[int] = None,
+                 reserve_seconds: float = 60, stop_event: Optional[threading.Event] = None):
+        self.started = time.time()
+        self.deadline = self.started + budget_seconds if budget_seconds else None
+        self.target_active = target_active
+        # زمان رزرو شده برای ذخیره خروجی‌ها در انتهای اجرا
+        self.reserve_seconds = reserve_seconds
+        self.verified_active = set()
+        self.stop_reason = None
+        # رویداد توقف بیرونی (سیگنال daemon)؛ اجرا در اولین نقطه بررسی بودجه متوقف می‌شود
+        self.stop_event = stop_event
+    
+    def remaining(self) -> float:
+        """زمان باقیمانده تا مهلت (ثانیه)"""
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.time()
+    
+    def near_deadline(self, needed: float = 0) -> bool:
+        """آیا تا مهلت کمتر از زمان لازم + رزرو باقیمانده است؟"""
+        return self.remaining() <= self.reserve_seconds + needed
+    
+    def quota_met(self) -> bool:
+        """آیا به تعداد هدف پروکسی فعال تایید شده رسیده‌ایم؟"""
+        return self.target_active is not None and len(self.verified_active) >= self.target_active
+    
+    def stopped(self) -> bool:
+        """آیا توقف از بیرون درخواست شده است؟"""
+        return self.stop_event is not None and self.stop_event.is_set()
+    
+    def quota_left(self) -> Optional[int]:
+        """تعداد پروکسی فعال باقیمانده تا سهمیه (None = بدون سهمیه)"""
+        if self.target_active is None:
+            return None
+        return max(0, self.target_active - len(self.verified_active))
+    
+    def should_stop(self, needed: float = 0) -> bool:
+        """بررسی توقف دریافت و تست (درخواست توقف، سهمیه پر شده یا نزدیک مهلت)"""
+        if self.stopped():
+            self.stop_reason = self.stop_reason or 'signal'
+            return True
+        if self.quota_met():
+            self.stop_reason = self.stop_reason or 'quota'
+            return True
+        if self.near_deadline(needed):
+            self.stop_reason = self.stop_reason or 'deadline'
+            return True
+        return False
+    
+    def record_active(self, key: str):
+        """ثبت یک پروکسی فعال تایید شده در این اجرا"""
+        self.verified_active.add(key)
+    
+    def timeout_for(self, default: float) -> float:
+        """محدود کردن تایم‌اوت شبکه به زمان باقیمانده"""
+        available = self.remaining() - self.reserve_seconds
+        return max(1, min(default, available))
+
+class LatencyTracker:
+    """تاریخچه تاخیر پاسخ‌های موفق هر سرویس برای محاسبه تاخیر hedge"""
+    def __init__(self, window: int = 50, default_delay: float = 0.8, multiplier: float = 2.0,
+                 min_delay: float = 0.15, max_delay: float = 3.0):
+        self.window = window
+        self.default_delay = default_delay
+        self.multiplier = multiplier
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.samples = {}
+        self.lock = threading.Lock()
+    
+    def record(self, name: str, seconds: float):
+        """ثبت تاخیر یک پاسخ موفق"""
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+    
+    def p50(self, name: str) -> Optional[float]:
+        """میانه تاخیر اخیر سرویس (None = بدون نمونه)"""
+        with self.lock:
+            samples = sorted(self.samples.get(name, []))
+        return samples[len(samples) // 2] if samples else None
+    
+    def hedge_delay(self, name: str) -> float:
+        """زمان انتظار برای سرویس قبل از پرسش موازی از سرویس بعدی"""
+        median = self.p50(name)
+        if median is None:
+            return self.default_delay
+        return min(max(median * self.multiplier, self.min_delay), self.max_delay)
+
+
+class PrefixCache:
+    """استنتاج کشور IP از پاسخ‌های تایید شده IPهای هم‌پیشوند (پیش‌فرض /24)"""
+    def __init__(self, prefix_len: int = 24, min_agree: int = 3, spot_check_every: int = 10):
+        self.prefix_len = prefix_len
+        self.min_agree = min_agree
+        self.spot_check_every = spot_check_every
+        self.counts = {}  # پیشوند -> {کشور: تعداد پاسخ تایید شده}
+        self.served = {}  # پیشوند -> تعداد پاسخ‌های استنتاجی
+        self.mixed = set()
+        # IPهایی که فیلتر دسته‌ای نوبت بررسی نمونه‌ای را برایشان برداشته است
+        self.spot_ips = set()
+        self.lock = threading.Lock()
+    
+    def prefix(self, ip_int: int) -> int:
+        """پیشوند IP با طول prefix_len"""
+        return ip_int >> (32 - self.prefix_len)
+    
+    def lookup(self, ip_int: Optional[int]) -> Optional[Tuple[str, float, bool]]:
+        """(کشور، اطمینان، نیاز به بررسی نمونه‌ای) یا None اگر پیشوند قابل استنتاج نباشد"""
+        if ip_int is None or not self.prefix_len:
+            return None
+        key = self.prefix(ip_int)
+        with self.lock:
+            countries = self.counts.get(key)
+            if key in self.mixed or not countries or len(countries) > 1:
+                return None
+            country, agree = next(iter(countries.items()))
+            if agree < self.min_agree:
+                return None
+            if ip_int in self.spot_ips:
+                self.spot_ips.discard(ip_int)
+                return country, round(agree / (agree + 1), 3), True
+            self.served[key] = self.served.get(key, 0) + 1
+            # هر چند پاسخ استنتاجی یک بار با سرویس واقعی بررسی می‌شود تا پیشوندهای مختلط پیدا شوند
+            spot_check = self.spot_check_every > 0 and self.served[key] % self.spot_check_every == 0
+        return country, round(agree / (agree + 1), 3), spot_check
+    
+    def claim_foreign(self, ip_int: int, home: str = 'IR') -> bool:
+        """مثل lookup برای فیلتر دسته‌ای: True اگر کشور پیشوند با اطمینان غیر از home باشد (IP نوبت بررسی نمونه‌ای نگه داشته می‌شود)"""
+        if not self.prefix_len:
+            return False
+        key = self.prefix(ip_int)
+        with self.lock:
+            countries = self.counts.get(key)
+            if key in self.mixed or not countries or len(countries) > 1:
+                return False
+            country, agree = next(iter(countries.items()))
+            if agree < self.min_agree or country == home:
+                return False
+            self.served[key] = self.served.get(key, 0) + 1
+            # نوبت بررسی نمونه‌ای: IP در دسته می‌ماند و lookup بعدی آن را به سرویس واقعی می‌فرستد
+            if self.spot_check_every > 0 and self.served[key] % self.spot_check_every == 0:
+                self.spot_ips.add(ip_int)
+                return False
+        return True
+    
+    def observe(self, ip_int: Optional[int], country: Optional[str]) -> bool:
+        """ثبت پاسخ تایید شده سرویس؛ True یعنی پیشوند تازه مختلط شده است"""
+        if ip_int is None or not country or not self.prefix_len:
+            return False
+        key = self.prefix(ip_int)
+        with self.lock:
+            countries = self.counts.setdefault(key, {})
+            countries[country] = countries.get(country, 0) + 1
+            if len(countries) > 1 and key not in self.mixed:
+                self.mixed.add(key)
+                return True
+        return False
+    
+    def export(self) -> Dict[str, Any]:
+        """وضعیت قابل ذخیره در snapshot"""
+        with self.lock:
+            return {'prefix_len': self.prefix_len,
+                    'counts': {str(key): dict(value) for key, value in self.counts.items()},
+                    'mixed': sorted(self.mixed)}
+    
+    def load(self, state: Dict[str, Any]):
+        """بارگذاری وضعیت snapshot (فقط با طول پیشوند یکسان)"""
+        if not state or state.get('prefix_len') != self.prefix_len:
+            return
+        with self.lock:
+            for key, countries in state.get('counts', {}).items():
+                self.counts[int(key)] = dict(countries)
+            self.mixed.update(state.get('mixed', []))
+
+
+class DNSResolver:
+    """حل‌کننده DNS همزمان با کش رکوردهای A بر اساس TTL"""
+    def __init__(self, logger: Logger, max_workers: int = 32, timeout: int = 5,
+                 default_ttl: int = 300, negative_ttl: int = 60):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = {}  # host -> (ips, expires_at)
+        self.lock = threading.Lock()
+    
+    def get_cached(self, host: str) -> Tuple[bool, List[str]]:
+        """خواندن رکوردهای معتبر از کش"""
+        with self.lock:
+            entry = self.cache.get(host)
+            if entry and entry[1] > time.time():
+                return True, entry[0]
+            return False, []
+    
+    def query(self, host: str) -> Tuple[List[str], int]:
+        """دریافت رکوردهای A یک دامنه همراه با TTL"""
+        if HAS_DNSPYTHON:
+            answer = dns.resolver.resolve(host, 'A', lifetime=self.timeout)
+            return [record.address for record in answer], answer.rrset.ttl
+        
+        # بدون dnspython، TTL در دسترس نیست و از مقدار پیش‌فرض استفاده می‌شود
+        infos = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+        ips = []
+        for info in infos:
+            if info[4][0] not in ips:
+                ips.append(info[4][0])
+        return ips, self.default_ttl
+    
+    def resolve_host(self, host: str) -> List[str]:
+        """حل یک دامنه و ذخیره نتیجه در کش"""
+        try:
+            ips, ttl = self.query(host)
+        except Exception:
+            ips, ttl = [], self.negative_ttl
+        
+        # حذف آدرس‌های bogon، خصوصی و رزرو شده
+        public_ips = []
+        for ip in ips:
+            ip_int = ipv4_to_int(ip)
+            if ip_int is not None and not is_bogon_int(ip_int):
+                public_ips.append(ip)
+        
+        self.logger.update_stat('dns_lookups')
+        if not public_ips:
+            self.logger.update_stat('dns_rejected')
+            ttl = self.negative_ttl
+        
+        with self.lock:
+            self.cache[host] = (public_ips, time.time() + max(ttl, 1))
+        return public_ips
+    
+    def resolve_many(self, hosts: Iterable[str]) -> Dict[str, Optional[str]]:
+        """حل همزمان همه میزبان‌های یکتا و برگرداندن اولین IP عمومی هر کدام"""
+        results = {}
+        pending = []
+        
+        for host in set(h for h in hosts if h):
+            ip_int = ipv4_to_int(host)
+            if ip_int is not None:
+                results[host] = None if is_bogon_int(ip_int) else host
+                continue
+            
+            found, ips = self.get_cached(host)
+            if found:
+                self.logger.update_stat('dns_cache_hits')
+                results[host] = ips[0] if ips else None
+            else:
+                pending.append(host)
+        
+        if pending:
+            workers = min(self.max_workers, len(pending))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for host, ips in zip(pending, executor.map(self.resolve_host, pending)):
+                    results[host] = ips[0] if ips else None
+        
+        return results
+    
+    def resolve(self, host: str) -> Optional[str]:
+        """حل یک میزبان (IP یا دامنه)"""
+        return self.resolve_many([host]).get(host)
+
+class SourceStats:
+    """تاریخچه بازدهی منابع و زمان‌بندی تطبیقی بر اساس آن"""
+    def __init__(self, path: str = os.path.join(STATE_DIR, "source_stats.json"), history_size: int = 20, alpha: float = 0.3):
+        self.path = path
+        self.history_size = history_size
+        self.alpha = alpha
+        self.data = self.load()
+        self.pending = {}
+        self.run_records = {}
+    
+    def load(self) -> Dict[str, Any]:
+        """بارگذاری تاریخچه منابع (نسخه قدیمی داخل output/ در اولین اجرا منتقل می‌شود)"""
+        path = self.path if os.path.exists(self.path) else LEGACY_SOURCE_STATS
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict) and 'sources' in data:
+                    return data
+        except Exception:
+            pass
+        return {'version': 1, 'sources': {}}
+    
+    def save(self):
+        """ذخیره تاریخچه منابع"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    
+    def history(self, name: str) -> Dict[str, Any]:
+        """تاریخچه یک منبع"""
+        return self.data['sources'].setdefault(name, {'runs': [], 'consecutive_failures': 0})
+    
+    def start_run(self, name: str) -> Dict[str, Any]:
+        """شروع ثبت آمار یک منبع در اجرای فعلی"""
+        record = {
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'started': time.time(),
+            'lines': 0,
+            'candidates': 0,
+            'geo_checked': 0,
+            'iranian': 0,
+            'alive': 0,
+            'failed': False,
+            'partial': False,
+        }
+        self.pending[name] = record
+        return record
+    
+    def update(self, name: str, **fields):
+        """به‌روزرسانی آمار منبع در حال پردازش"""
+        if name in self.pending:
+            self.pending[name].update(fields)
+    
+    def finish_run(self, name: str, proxies: List[Dict[str, Any]]):
+        """پایان ثبت آمار منبع و افزودن به تاریخچه"""
+        record = self.pending.pop(name, None)
+        if record is None:
+            return
+        
+        record['duration'] = round(time.time() - record.pop('started'), 2)
+        record['iranian'] = len(proxies)
+        record['alive'] = len([p for p in proxies if p.get('is_active')])
+        
+        self.run_records[name] = record
+        self.append_run(name, record)
+    
+    def mirror(self, host: str) -> Dict[str, Any]:
+        """تاریخچه تاخیر یک میزبان آینه"""
+        return self.data.setdefault('mirrors', {}).setdefault(host, {'latency': None, 'failures': 0, 'mismatches': 0})
+    
+    def record_mirror(self, host: str, seconds: Optional[float], ok: bool):
+        """ثبت نتیجه یک درخواست به میزبان آینه (EWMA تاخیر و شکست‌های متوالی)"""
+        entry = self.mirror(host)
+        if ok and seconds is not None:
+            previous = entry['latency']
+            entry['latency'] = round(seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous, 3)
+            entry['failures'] = 0
+        else:
+            entry['failures'] += 1
+    
+    def record_mismatch(self, host: str):
+        """ثبت پاسخ متفاوت آینه با منبع اصلی"""
+        self.mirror(host)['mismatches'] += 1
+    
+    def mirror_cost(self, host: str, default_latency: float = 2.0) -> float:
+        """تاخیر مورد انتظار آینه با جریمه شکست‌ها و پاسخ‌های متفاوت"""
+        entry = self.data.get('mirrors', {}).get(host)
+        if not entry:
+            return default_latency
+        latency = entry['latency'] if entry['latency'] is not None else default_latency
+        return latency * (1 + entry['failures']) + 5 * entry['mismatches']
+    
+    def discard_run(self, name: str):
+        """کنار گذاشتن آمار منبعی که در این اجرا کاری برایش انجام نشد (پاسخ از حافظه)"""
+        self.pending.pop(name, None)
+    
+    def append_run(self, name: str, record: Dict[str, Any]):
+        """افزودن یک اجرای کامل به تاریخچه منبع"""
+        hist = self.history(name)
+        hist['runs'] = (hist['runs'] + [record])[-self.history_size:]
+        hist['consecutive_failures'] = hist['consecutive_failures'] + 1 if record['failed'] else 0
+    
+    def merge_shard_runs(self, shard_runs: List[Dict[str, Dict[str, Any]]]):
+        """ترکیب آمار منابع از shardها در یک اجرای واحد"""
+        combined = {}
+        for runs in shard_runs:
+            for name, record in runs.items():
+                if name not in combined:
+                    combined[name] = dict(record)
+                    continue
+                merged = combined[name]
+                # هر shard کل منبع را دانلود می‌کند ولی فقط سهم خودش را بررسی می‌کند
+                for field in ['candidates', 'geo_checked', 'iranian', 'alive']:
+                    merged[field] = merged.get(field, 0) + record.get(field, 0)
+                merged['lines'] = max(merged.get('lines', 0), record.get('lines', 0))
+                merged['duration'] = max(merged.get('duration', 0), record.get('duration', 0))
+                merged['failed'] = merged.get('failed', False) and record.get('failed', False)
+                merged['partial'] = merged.get('partial', False) or record.get('partial', False)
+        
+        for name in sorted(combined):
+            self.append_run(name, combined[name])
+    
+    def ewma(self, runs: List[Dict[str, Any]], field: str) -> float:
+        """میانگین متحرک نمایی یک فیلد (اجراهای جدیدتر وزن بیشتر)"""
+        value = None
+        for run in runs:
+            x = run.get(field, 0) or 0
+            value = x if value is None else self.alpha * x + (1 - self.alpha) * value
+        return value or 0.0
+    
+    def complete_runs(self, name: str) -> List[Dict[str, Any]]:
+        """اجراهایی که با بودجه زمانی قطع نشده‌اند"""
+        return [r for r in self.history(name)['runs'] if not r.get('partial')]
+    
+    def expected_yield(self, name: str) -> Optional[float]:
+        """بازدهی مورد انتظار: پروکسی ایرانی فعال در ثانیه (None = بدون تاریخچه)"""
+        runs = self.complete_runs(name)
+        if not runs:
+            return None
+        return self.ewma(runs, 'alive') / max(self.ewma(runs, 'duration'), 1.0)
+    
+    def ir_hit_rate(self, name: str) -> float:
+        """نسبت IPهای ایرانی به IPهای بررسی شده"""
+        runs = self.complete_runs(name)
+        checked = sum(r.get('geo_checked', 0) for r in runs)
+        return sum(r.get('iranian', 0) for r in runs) / checked if checked else 0.0
+    
+    def alive_rate(self, name: str) -> float:
+        """نسبت پروکسی‌های فعال به پروکسی‌های ایرانی"""
+        runs = self.complete_runs(name)
+        iranian = sum(r.get('iranian', 0) for r in runs)
+        return sum(r.get('alive', 0) for r in runs) / iranian if iranian else 0.0
+    
+    def plan(self, sources: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """مرتب‌سازی منابع بر اساس بازدهی و رد منابع مرده (به جز نمونه‌برداری گاه‌به‌گاه)"""
+        selected, skipped = [], []
+        for source in sources:
+            hist = self.history(source['name'])
+            if hist['consecutive_failures'] >= source['skip_after_failures'] and random.random() >= source['sample_rate']:
+                skipped.append(source)
+            else:
+                selected.append(source)
+        
+        # منابع بدون تاریخچه اول امتحان می‌شوند تا آمارشان ساخته شود
+        def priority(source):
+            expected = self.expected_yield(source['name'])
+            return (0, 0.0) if expected is None else (1, -expected)
+        
+        selected.sort(key=priority)
+        return selected, skipped
+
+class Checkpoint:
+    """وضعیت میانی اجرا خارج از output/ برای ادامه در تلاش‌های بعدی workflow"""
+    def __init__(self, state_dir: str = ".state/checkpoint", max_age_minutes: float = 180):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, "state.json.gz")
+        self.bodies_dir = os.path.join(state_dir, "bodies")
+        self.max_age = max_age_minutes * 60
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.data = self.empty('')
+    
+    def empty(self, fingerprint: str) -> Dict[str, Any]:
+        """وضعیت خالی برای یک اجرای جدید"""
+        return {'version': 1, 'created': time.time(), 'fingerprint': fingerprint,
+                'bodies': {}, 'geo': {}, 'probes': {}, 'completed': {}}
+    
+    def open(self, fingerprint: str) -> bool:
+        """بارگذاری checkpoint تازه با ورودی‌های یکسان (True = ادامه تلاش قبلی)"""
+        self.enabled = self.max_age > 0
+        if not self.enabled:
+            return False
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            fresh = time.time() - data.get('created', 0) < self.max_age
+            if data.get('version') == 1 and data.get('fingerprint') == fingerprint and fresh:
+                self.data = data
+                return True
+        except (OSError, ValueError):
+            pass
+        
+        # checkpoint قدیمی یا متعلق به ورودی‌های دیگر کنار گذاشته می‌شود
+        shutil.rmtree(self.bodies_dir, ignore_errors=True)
+        self.data = self.empty(fingerprint)
+        return False
+    
+    def save(self, geo: Dict[str, Optional[str]], probes: Dict[str, Tuple[bool, int, float]]):
+        """ذخیره اتمیک وضعیت همراه با کش GeoIP و نتایج بررسی سلامت"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.data['geo'] = dict(geo)
+            self.data['probes'] = {key: list(value) for key, value in probes.items()}
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.path)
+    
+    def body(self, url: str, raw: bool = False) -> Optional[Union[str, bytes]]:
+        """پاسخ ذخیره شده یک URL (raw = بایت‌ها بدون رمزگشایی)"""
+        name = self.data['bodies'].get(url) if self.enabled else None
+        if not name:
+            return None
+        try:
+            with gzip.open(os.path.join(self.bodies_dir, name), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return data if raw else data.decode('utf-8', errors='replace')
+    
+    def store_body(self, url: str, text: Union[str, bytes]):
+        """ذخیره فشرده پاسخ یک URL"""
+        if not self.enabled:
+            return
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest() + ".txt.gz"
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        with gzip.open(os.path.join(self.bodies_dir, name), 'wb') as f:
+            f.write(text.encode('utf-8') if isinstance(text, str) else text)
+        with self.lock:
+            self.data['bodies'][url] = name
+    
+    def completed(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        """نتیجه منبعی که در تلاش قبلی کامل پردازش شده است"""
+        return self.data['completed'].get(name) if self.enabled else None
+    
+    def complete_source(self, name: str, proxies: List[Dict[str, Any]]):
+        """ثبت منبع کامل شده در فهرست منابع تمام شده"""
+        if self.enabled:
+            with self.lock:
+                self.data['completed'][name] = proxies
+
 
 class IranProxyManager:
-    def __init__(self, config_path: str = "output/config.yaml"):
+    def __init__(self, config_path: str = "output/config.yaml", sources_path: str = "config/sources.yaml"):
         self.config_path = config_path
+        self.sources_path = sources_path
         self.logger = Logger()
         self.config = self.load_config()
         self.failed_sources = []
         self.ip_cache = {}
         self.lock = threading.Lock()
-        
-        # منابع اصلی
-        self.SOURCES = [
-            ("https://raw.githubusercontent.com/mahdibland/V2RayAggregator/master/sub/splitted/vmess.txt", "vmess", "github-vmess"),
-            ("https://raw.githubusercontent.com/mahdibland/V2RayAggregator/master/sub/splitted/vless.txt", "vless", "github-vless"),
-            ("https://raw.githubusercontent.com/mahdibland/V2RayAggregator/master/sub/splitted/ss.txt", "ss", "github-ss"),
-            ("https://raw.githubusercontent.com/iranxray/hope/main/singbox", "vless", "github-hope"),
-            ("https://raw.githubusercontent.com/yebekhe/TelegramV2rayCollector/main/singbox", "vless", "github-telegram"),
-            ("https://raw.githubusercontent.com/mahdibland/ShadowsocksAggregator/master/sub/sb", "ss", "github-ss-aggr"),
-            ("https://raw.githubusercontent.com/freefq/free/master/v2", "vmess", "github-freefq"),
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=socks5&country=IR", "socks5", "proxyscrape-socks5"),
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&country=IR", "http", "proxyscrape-http"),
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=https&country=IR", "http", "proxyscrape-https"),
-            ("https://raw.githubusercontent.com/TheSpeedX/SOCKS-List/master/socks5.txt", "socks5", "github-socks5"),
-            ("https://raw.githubusercontent.com/hookzof/socks5_list/master/proxy.txt", "socks5", "github-hookzof"),
-            ("https://raw.githubusercontent.com/peasoft/NoMoreWalls/master/list.txt", "mixed", "github-nowalls"),
-            ("https://raw.githubusercontent.com/BlueSkyXN/9.DDFHP/main/1", "mixed", "github-ddfhp"),
-            ("https://proxyhub.me/en/ir-http-proxy-list.html", "html-http", "proxyhub-http"),
-            ("https://proxyhub.me/en/ir-sock5-proxy-list.html", "html-socks5", "proxyhub-socks5"),
-            ("https://www.proxydocker.com/en/socks5-list/country/Iran", "html-socks5", "proxydocker-socks5"),
-            ("https://www.proxydocker.com/en/proxylist/search?need=all&type=http-https&anonymity=all&port=&country=Iran&city=&state=all", "html-http", "proxydocker-http"),
-            ("https://www.freeproxy.world/?type=http&anonymity=&country=IR", "html-http", "freeproxy-http"),
-            ("https://www.freeproxy.world/?type=socks5&anonymity=&country=IR", "html-socks5", "freeproxy-socks5"),
-            # منابع اضطراری
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&timeout=10000&country=all", "http", "emergency-http"),
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=socks5&timeout=10000&country=all", "socks5", "emergency-socks5"),
-            ("https://raw.githubusercontent.com/freefq/free/master/v2", "vmess", "emergency-vmess"),
-        ]
+        self.resolver = DNSResolver(self.logger)
+        self.budget = RunBudget()
+        # کش سلامت: ip:port-type -> (فعال، پینگ، زمان بررسی)
+        self.alive_cache = {}
+        self.alive_cache_ttl = 600
+        # مقصد CONNECT در بررسی پروکسی‌های HTTP/SOCKS5
+        self.probe_target = ("www.google.com", 443)
+        # کاندیدهای ایرانی هر منبع در دسته‌هایی با این اندازه هم‌زمان بررسی می‌شوند
+        self.probe_concurrency = 32
+        # زمان آخرین بررسی سلامت هر پروکسی و آخرین به‌روزرسانی هر منبع
+        self.last_probe = {}
+        self.source_refreshed = {}
+        # checkpoint برای ادامه در تلاش بعدی (با resume_checkpoint فعال می‌شود)
+        self.checkpoint = Checkpoint()
+        # حافظه همین اجرا: URL -> پاسخ و (hash پاسخ، نوع) -> پروکسی‌های بررسی شده
+        self.response_memo = {}
+        self.parse_memo = {}
+        # بررسی کاندیدها به ترتیب احتمال فعال بودن (False = ترتیب متن منبع)
+        self.check_priority = True
+        # تخمین‌گر احتمال فعال بودن فقط به مخزن موجود وابسته است و یک بار در هر اجرا ساخته می‌شود
+        self.alive_estimator = None
+        # پرسش hedge شده GeoIP: سرویس بعدی اگر سرویس قبلی از p50 خودش کندتر باشد موازی پرسیده می‌شود
+        self.geo_hedge = True
+        self.geo_latency = LatencyTracker()
+        self.geo_executor = None
+        # آینه‌ها: احتمال دریافت آدرس اصلی در پس‌زمینه برای مقایسه وقتی آینه برنده شده است
+        self.mirror_executor = None
+        self.mirror_verify_rate = 0.2
+        # کش استنتاجی پیشوند: IP -> اطمینان پاسخ‌هایی که بدون پرسش از سرویس داده شده‌اند
+        self.prefix_cache = PrefixCache()
+        self.geo_inferred = {}
+        # آزمون سرعت دانلود اختیاری (speed_test_url = None یعنی غیرفعال)
+        self.speed_test_url = None
+        self.speed_test_bytes = 256 * 1024
+        self.speed_test_concurrency = 4
+        self.speed_test_bandwidth_kbps = 2048
+        self.speed_test_limit = 50
+        # آزمون رله UDP هم‌زمان با بررسی TCP (udp_check = False یعنی udp: false برای SOCKS5/SS)
+        self.udp_check = True
+        self.udp_warned = False
+        self.udp_target = ("8.8.8.8", 53)
+        self.udp_timeout = 5
+        self.udp_executor = None
+        # حالت shard: (شماره shard, تعداد کل) یا None
+        self.shard = None
+        
+        # منابع از فایل تنظیمات
+        self.SOURCES = self.load_sources()
+        self.source_stats = SourceStats()
         
         # سرویس‌های بررسی IP با تایم‌اوت بیشتر
         self.IP_CHECK_SERVICES = [
@@ -213,7 +1048,7 @@ class IranProxyManager:
                 with open(self.config_path, 'r', encoding='utf-8') as f:
                     content = f.read()
                     if content.strip():
-                        config = yaml.safe_load(content)
+                        config = yaml.load(content, Loader=YAML_LOADER)
                         if config and 'proxies' in config:
                             self.logger.log(f"فایل کانفیگ با {len(config['proxies'])} پروکسی بارگذاری شد")
                             return config
@@ -223,8 +1058,40 @@ class IranProxyManager:
             self.logger.log(f"خطا در بارگذاری کانفیگ: {e}", "ERROR")
             return {"proxies": [], "metadata": {}}
     
+    def load_sources(self) -> List[Dict[str, Any]]:
+        """بارگذاری منابع و تنظیمات هر منبع از فایل"""
+        try:
+            with open(self.sources_path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+        except Exception as e:
+            self.logger.log(f"❌ خطا در بارگذاری منابع ({self.sources_path}): {e}", "ERROR")
+            return []
+        
+        defaults = {'timeout': 35, 'retries': 3, 'skip_after_failures': 3, 'sample_rate': 0.25, 'refresh_minutes': 120,
+                    'emergency': False, 'enabled': True, 'auto_mirrors': True}
+        defaults.update(data.get('defaults') or {})
+        
+        sources = []
+        for entry in data.get('sources') or []:
+            if not all(key in entry for key in ['name', 'url', 'type']):
+                continue
+            source = dict(defaults)
+            source.update(entry)
+            # آینه‌های دستی و آینه‌های jsDelivr برای آدرس‌های گیت‌هاب
+            mirrors = list(source.get('mirrors') or [])
+            if source['auto_mirrors']:
+                mirrors += [m for m in github_mirrors(source['url']) if m not in mirrors]
+            source['mirrors'] = [m for m in mirrors if m != source['url']]
+            if source['enabled']:
+                sources.append(source)
+        
+        return sources
+    
+    @log_stage('save')
     def save_config(self):
         """ذخیره فایل کانفیگ با اصلاحات کامل برای کلش اندروید"""
+        from probes import udp_value
+        
         try:
             os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
             
@@ -244,11 +1111,11 @@ class IranProxyManager:
                     'country': str(proxy.get('country', 'IR')),
                 }
                 
-                # 🔥 **اضافه کردن udp: true برای کلش اندروید**
-                cleaned_proxy['udp'] = True
+                # udp از آزمون رله UDP؛ بدون اندازه‌گیری مقدار محافظه‌کارانه
+                cleaned_proxy['udp'] = udp_value(proxy)
                 
                 # فیلدهای اختیاری استاندارد
-                optional_fields = ['ping', 'source', 'uuid', 'cipher', 'password', 'network', 'tls']
+                optional_fields = ['ping', 'probe', 'health', 'speed_kbps', 'udp_ping', 'geo_confidence', 'source', 'uuid', 'cipher', 'password', 'network', 'tls']
                 for field in optional_fields:
                     if field in proxy:
                         cleaned_proxy[field] = proxy[field]
@@ -303,17 +1170,24 @@ class IranProxyManager:
                 'clash_compatible': True,
                 'alterId_min': 4,
                 'udp_enabled': True,
+                'udp_count': len([p for p in cleaned_proxies if p['udp']]),
                 'fixed_hosts': True
             }
             
-            final_config = {'proxies': cleaned_proxies, 'metadata': metadata}
+            def render(digest):
+                metadata['payload_hash'] = digest
+                final_config = {'proxies': cleaned_proxies, 'metadata': metadata}
+                return yaml.dump(final_config,
+                                 Dumper=YAML_DUMPER,
+                                 default_flow_style=False, 
+                                 allow_unicode=True, 
+                                 sort_keys=False,
+                                 indent=2)
             
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(final_config, f, 
-                         default_flow_style=False, 
-                         allow_unicode=True, 
-                         sort_keys=False,
-                         indent=2)
+            # فقط لیست پروکسی‌ها در هش است؛ last_updated، log_file، زمان‌های probe و جزئیات روزانه health تغییر محسوب نمی‌شوند
+            if not write_if_changed(self.config_path, [hash_view(p) for p in cleaned_proxies], render):
+                self.logger.log(f"⏸️ پروکسی‌ها تغییری نکرده‌اند - نوشتن {self.config_path} رد شد")
+                return True
             
             self.logger.log(f"✅ فایل کانفیگ برای کلش اندروید ذخیره شد ({len(cleaned_proxies)} پروکسی)")
             return True
@@ -321,130 +1195,166 @@ class IranProxyManager:
             self.logger.log(f"❌ خطا در ذخیره کانفیگ: {e}", "ERROR")
             return False
     
-    def is_alive(self, ip: str, port: int, proxy_type: str = "tcp", timeout: int = 15) -> Tuple[bool, int]:
-        """بررسی فعال بودن پروکسی با تایم‌اوت بیشتر"""
-        try:
-            start = time.time()
-            
-            # 🔥 **تست واقعی با درخواست HTTP برای پروکسی‌های HTTP/SOCKS5**
-            if proxy_type.lower() in ["http", "socks5"]:
-                return self.test_http_proxy(ip, port, proxy_type, timeout)
-            else:
-                # تست معمولی TCP برای vmess/vless
-                s = socket.create_connection((ip, port), timeout=timeout)
-                s.close()
-                ping = int((time.time() - start) * 1000)
-                if ping > 0:
-                    self.logger.update_stat('active_proxies_found')
-                return True, ping
-                
-        except socket.timeout:
-            self.logger.log(f"   ⏱️ تایم‌اوت برای {ip}:{port} ({proxy_type})", "DEBUG")
-            self.logger.update_stat('inactive_proxies')
-            return False, 0
-        except Exception as e:
-            self.logger.log(f"   ❌ خطا برای {ip}:{port}: {str(e)[:50]}", "DEBUG")
-            self.logger.update_stat('inactive_proxies')
-            return False, 0
+    def alive_many(self, items: List[Tuple[str, int, str, Optional[str]]], timeout: int = 15,
+                   max_age: Optional[float] = None) -> List[Tuple[bool, int]]:
+        """بررسی هم‌زمان یک دسته (ip، پورت، نوع، sni) در یک event loop؛ نتایج اخیر از کش سلامت خوانده می‌شوند"""
+        from probes import run_probe_many
+        
+        max_age = self.alive_cache_ttl if max_age is None else max_age
+        results = [None] * len(items)
+        pending = []
+        for index, (ip, port, proxy_type, sni) in enumerate(items):
+            key = self.alive_key(ip, port, proxy_type, sni)
+            with self.lock:
+                cached = self.alive_cache.get(key)
+            if cached and time.time() - cached[2] < max_age:
+                self.logger.update_stat('alive_cache_hits')
+                results[index] = (cached[0], cached[1])
+                continue
+            pending.append((index, key, {'kind': self.probe_kind(proxy_type, sni), 'ip': ip, 'port': port,
+                                         'timeout': self.budget.timeout_for(timeout),
+                                         'target': self.probe_target, 'sni': sni}))
+        
+        if pending:
+            outcomes = run_probe_many([item for _, _, item in pending], self.probe_concurrency)
+            for (index, key, item), result in zip(pending, outcomes):
+                self.record_probe(key, item, result)
+                results[index] = (result['alive'], result['ping'])
+        return results
     
-    def test_http_proxy(self, ip: str, port: int, proxy_type: str, timeout: int = 15) -> Tuple[bool, int]:
-        """تست واقعی پروکسی HTTP/SOCKS5 با ارسال درخواست"""
+    def alive_key(self, ip: str, port: int, proxy_type: str, sni: Optional[str] = None) -> str:
+        """کلید کش سلامت"""
+        return f"{ip}:{port}-{proxy_type}" + ("-tls" if sni else "")
+    
+    def probe_timings(self, ip: str, port: int, proxy_type: str, sni: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """زمان‌های اتصال، دست‌دهی و اولین بایت آخرین بررسی"""
+        cached = self.alive_cache.get(self.alive_key(ip, port, proxy_type, sni))
+        return cached[3] if cached and len(cached) > 3 else None
+    
+    def submit_udp_probe(self, proxy: Dict[str, Any], ip: str):
+        """شروع آزمون رله UDP در پس‌زمینه تا بررسی TCP کاندیدهای بعدی ادامه یابد (None = بدون آزمون)"""
+        from probes import UDP_RELAY_TYPES, HAS_CRYPTOGRAPHY
+        
+        ptype = str(proxy.get('type', '')).lower()
+        if not self.udp_check or ptype not in UDP_RELAY_TYPES:
+            return None
+        if ptype == 'ss' and not HAS_CRYPTOGRAPHY and not self.udp_warned:
+            self.udp_warned = True
+            self.logger.log("⚠️ ماژول cryptography نصب نیست - آزمون UDP شدوساکس انجام نمی‌شود و udp: false ثبت می‌شود", "WARNING")
+        if self.udp_executor is None:
+            self.udp_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="udp")
+        return self.udp_executor.submit(self.probe_udp, proxy, ip)
+    
+    def probe_udp(self, proxy: Dict[str, Any], ip: str) -> Dict[str, Any]:
+        """آزمون رله UDP یک پروکسی (SOCKS5 UDP ASSOCIATE یا رله UDP شدوساکس)"""
+        from probes import run_udp_probe
+        
+        result = run_udp_probe(str(proxy['type']), ip, int(proxy['port']), self.budget.timeout_for(self.udp_timeout),
+                               self.udp_target, proxy.get('cipher'), proxy.get('password'))
+        if result['udp'] is not None:
+            self.logger.update_stat('udp_probes')
+        if result['udp']:
+            self.logger.update_stat('udp_supported')
+        elif result['error']:
+            self.logger.log(f"   📵 UDP برای {ip}:{proxy['port']}: {result['error']}", "DEBUG")
+        return result
+    
+    def apply_udp(self, proxy: Dict[str, Any], job) -> None:
+        """ثبت نتیجه آزمون UDP روی پروکسی؛ بدون نتیجه مقدار محافظه‌کارانه (udp_value) ثبت می‌شود"""
+        from probes import udp_value, UDP_RELAY_TYPES
+        
         try:
-            start = time.time()
-            
-            proxies = {}
-            if proxy_type.lower() == "http":
-                proxies = {
-                    'http': f"http://{ip}:{port}",
-                    'https': f"http://{ip}:{port}"
-                }
-            elif proxy_type.lower() == "socks5":
-                proxies = {
-                    'http': f"socks5://{ip}:{port}",
-                    'https': f"socks5://{ip}:{port}"
-                }
-            
-            # تست با یک سایت ساده
-            response = requests.get(
-                'http://httpbin.org/ip',
-                proxies=proxies,
-                timeout=timeout,
-                headers={'User-Agent': random.choice(self.USER_AGENTS)}
-            )
-            
-            ping = int((time.time() - start) * 1000)
-            
-            if response.status_code == 200:
-                self.logger.update_stat('active_proxies_found')
-                return True, ping
-            else:
-                self.logger.update_stat('inactive_proxies')
-                return False, 0
-                
-        except requests.exceptions.ProxyError:
-            self.logger.log(f"   🔧 Proxy error: {ip}:{port}", "DEBUG")
-            self.logger.update_stat('inactive_proxies')
-            return False, 0
-        except requests.exceptions.ConnectTimeout:
-            self.logger.log(f"   ⏱️ Connect timeout: {ip}:{port}", "DEBUG")
-            self.logger.update_stat('inactive_proxies')
-            return False, 0
-        except requests.exceptions.ReadTimeout:
-            self.logger.log(f"   ⏱️ Read timeout: {ip}:{port}", "DEBUG")
-            self.logger.update_stat('inactive_proxies')
-            return False, 0
+            result = job.result() if job else None
         except Exception as e:
-            self.logger.log(f"   ❌ HTTP test error: {ip}:{port} - {str(e)[:50]}", "DEBUG")
+            self.logger.log(f"   ⚠️ خطا در آزمون UDP {proxy['server']}:{proxy['port']}: {e}", "DEBUG")
+            result = None
+        
+        if result and result['udp'] is not None:
+            if result['udp']:
+                proxy['udp_ping'] = result['udp_ping']
+            else:
+                proxy.pop('udp_ping', None)
+        elif str(proxy.get('type', '')).lower() in UDP_RELAY_TYPES:
+            self.logger.update_stat('udp_unmeasured')
+            reason = result['error'] if result else "آزمون UDP انجام نشد"
+            self.logger.log(f"   ❔ UDP برای {proxy['server']}:{proxy['port']} اندازه‌گیری نشد ({reason})"
+                            f" - udp: {str(udp_value(proxy)).lower()}", "DEBUG")
+        proxy['udp'] = udp_value(proxy)
+    
+    def tls_sni(self, proxy: Dict[str, Any]) -> Optional[str]:
+        """SNI برای بررسی TLS پروکسی‌های vmess/vless (None = بدون TLS)"""
+        if proxy.get('type') not in ['vmess', 'vless'] or not proxy.get('tls'):
+            return None
+        host = proxy.get('ws-opts', {}).get('headers', {}).get('Host')
+        return proxy.get('sni') or host or proxy['server']
+    
+    def probe_kind(self, proxy_type: str, sni: Optional[str] = None) -> str:
+        """probe سبک متناسب با پروتکل (CONNECT، SOCKS5، ClientHello یا TCP)"""
+        kind = proxy_type.lower()
+        if kind not in ['http', 'socks5']:
+            kind = 'tls' if sni else 'tcp'
+        return kind
+    
+    def record_probe(self, key: str, item: Dict[str, Any], result: Dict[str, Any]):
+        """ثبت نتیجه یک probe در آمار و کش سلامت"""
+        if result['alive']:
+            self.logger.update_stat('active_proxies_found')
+        else:
+            self.logger.log(f"   ❌ بررسی {item['kind']} برای {item['ip']}:{item['port']}: {result['error']}", "DEBUG")
             self.logger.update_stat('inactive_proxies')
-            return False, 0
+        timings = {field: result[field] for field in ['connect_ms', 'handshake_ms', 'first_byte_ms']}
+        with self.lock:
+            self.alive_cache[key] = (result['alive'], result['ping'], time.time(), timings)
     
     def is_private_ip(self, ip: str) -> bool:
-        """بررسی IP خصوصی"""
-        private_ranges = [
-            ('10.0.0.0', '10.255.255.255'),
-            ('172.16.0.0', '172.31.255.255'),
-            ('192.168.0.0', '192.168.255.255'),
-            ('127.0.0.0', '127.255.255.255'),
-            ('169.254.0.0', '169.254.255.255'),
-        ]
-        
+        """بررسی IP خصوصی، bogon یا رزرو شده"""
         ip_int = self.ip_to_int(ip)
-        for start, end in private_ranges:
-            if ip_int >= self.ip_to_int(start) and ip_int <= self.ip_to_int(end):
-                return True
-        return False
+        if ip_int is None:
+            return False
+        return is_bogon_int(ip_int)
     
-    def ip_to_int(self, ip: str) -> int:
-        """تبدیل IP به عدد صحیح"""
-        parts = ip.split('.')
-        return (int(parts[0]) << 24) + (int(parts[1]) << 16) + (int(parts[2]) << 8) + int(parts[3])
+    def ip_to_int(self, ip: str) -> Optional[int]:
+        """تبدیل IP به عدد صحیح (برای نام دامنه None)"""
+        return ipv4_to_int(ip)
     
-    def check_ip_service(self, service: dict, ip: str) -> Optional[str]:
-        """بررسی IP با یک سرویس خاص"""
+    def check_ip_service(self, service: dict, ip: str, attempts: Optional[int] = None,
+                         cancel: Optional[threading.Event] = None) -> Optional[str]:
+        """بررسی IP با یک سرویس خاص (cancel: تلاشی که هنوز شروع نشده انجام نمی‌شود؛ درخواست در جریان قطع نمی‌شود)"""
+        import requests
+        
         self.logger.update_stat('api_requests')
         
-        for attempt in range(service['max_retries']):
+        tries = attempts or service['max_retries']
+        for attempt in range(tries):
+            if cancel is not None and cancel.is_set():
+                return None
             try:
+                started = time.time()
                 url = service['url'].format(ip=ip)
                 headers = self.get_headers()
                 
-                response = requests.get(url, timeout=service['timeout'], headers=headers)
+                response = requests.get(url, timeout=self.budget.timeout_for(service['timeout']), headers=headers)
                 
                 if response.status_code == 200:
                     if service['field'] == 'text':
                         country = response.text.strip()
                         if len(country) == 2:
+                            self.geo_latency.record(service['name'], time.time() - started)
                             return country
                     else:
                         data = response.json()
                         if service['field'] in data:
                             country = data[service['field']]
                             if country and len(country) == 2:
+                                self.geo_latency.record(service['name'], time.time() - started)
                                 return country
                 
                 if response.status_code == 429:
+                    # در حالت hedge یا آخرین تلاش صبر فایده‌ای ندارد؛ سرویس بعدی فورا جایگزین می‌شود
+                    if cancel is not None or attempt + 1 >= tries:
+                        break
                     time.sleep(3)
-                    
+            
             except requests.exceptions.Timeout:
                 continue
             except requests.exceptions.ConnectionError:
@@ -480,6 +1390,14 @@ class IranProxyManager:
                 self.logger.update_stat('ip_cache_hits')
                 return self.ip_cache[ip]
         
+        # برای نام دامنه، کشور IP حل‌شده بررسی می‌شود نه خود نام (شمارش فقط در سطح IP)
+        if self.ip_to_int(ip) is None:
+            resolved = self.resolver.resolve(ip)
+            country = self.check_ip_country(resolved) if resolved else None
+            with self.lock:
+                self.ip_cache[ip] = country
+            return country
+        
         self.logger.update_stat('ip_checks')
         
         if self.is_private_ip(ip):
@@ -487,19 +1405,113 @@ class IranProxyManager:
                 self.ip_cache[ip] = None
             return None
         
+        ip_int = self.ip_to_int(ip)
+        inferred = self.prefix_cache.lookup(ip_int)
+        if inferred:
+            country, confidence, spot_check = inferred
+            if not spot_check:
+                self.logger.update_stat('geo_prefix_hits')
+                with self.lock:
+                    self.ip_cache[ip] = country
+                    self.geo_inferred[ip] = confidence
+                return country
+            self.logger.update_stat('geo_spot_checks')
+        
         country = None
         
-        for service in self.IP_CHECK_SERVICES:
-            result = self.check_ip_service(service, ip)
-            if result:
-                country = result
-                break
+        if self.geo_hedge:
+            country = self.hedged_country(ip)
+        else:
+            for service in self.IP_CHECK_SERVICES:
+                result = self.check_ip_service(service, ip)
+                if result:
+                    country = result
+                    break
+        
+        if self.prefix_cache.observe(ip_int, country):
+            self.logger.update_stat('geo_prefix_mixed')
+            self.logger.log(f"   🌍 پیشوند {ip}/{self.prefix_cache.prefix_len} مختلط است - استنتاج متوقف شد", "DEBUG",
+                            event="geo_prefix_mixed", ip=ip, answer=country)
         
         with self.lock:
             self.ip_cache[ip] = country
         
         return country
     
+    def hedged_country(self, ip: str) -> Optional[str]:
+        """پرسش از سرویس‌ها به ترتیب؛ اگر سرویس فعلی تا تاخیر hedge جواب ندهد سرویس بعدی موازی پرسیده می‌شود"""
+        if self.geo_executor is None:
+            self.geo_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geoip")
+        
+        cancel = threading.Event()
+        services = iter(self.IP_CHECK_SERVICES)
+        pending = {}
+        answers = {}
+        current = None
+        winner = None
+        
+        def launch() -> bool:
+            nonlocal current
+            service = next(services, None)
+            if service is None:
+                return False
+            # در حالت hedge هر سرویس یک بار پرسیده می‌شود؛ تلاش دوباره همان سرویس بعدی است
+            future = self.geo_executor.submit(self.check_ip_service, service, ip, 1, cancel)
+            pending[future] = service
+            current = service
+            return True
+        
+        launch()
+        while pending and winner is None:
+            # تا وقتی سرویس دیگری مانده، بیش از تاخیر hedge سرویس فعلی منتظر نمی‌مانیم
+            has_next = len(pending) + len(answers) < len(self.IP_CHECK_SERVICES)
+            timeout = self.geo_latency.hedge_delay(current['name']) if has_next else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                self.logger.update_stat('geo_hedges')
+                launch()
+                continue
+            
+            for future in done:
+                service = pending.pop(future)
+                answers[service['name']] = future.result()
+                if answers[service['name']] and winner is None:
+                    winner = service['name']
+            
+            # سرویس ناموفق بلافاصله با سرویس بعدی جایگزین می‌شود
+            if winner is None and not pending:
+                launch()
+        
+        # فقط درخواست‌هایی که هنوز شروع نشده‌اند رد می‌شوند؛ درخواست در جریان سرویس بازنده تا پاسخ
+        # یا تایم‌اوت ادامه می‌یابد (و از سهمیه همان سرویس کم می‌کند) و پاسخش پایین‌تر بررسی می‌شود
+        cancel.set()
+        country = answers[winner] if winner else None
+        
+        # پاسخ سرویس‌های بازنده اگر بعدا برسد و متفاوت باشد برای بررسی ثبت می‌شود
+        for future, service in pending.items():
+            future.add_done_callback(
+                lambda f, name=service['name']: self.audit_geo_answer(ip, winner, country, name, f))
+        for name, answer in answers.items():
+            if answer and country and answer != country:
+                self.record_geo_disagreement(ip, winner, country, name, answer)
+        
+        return country
+    
+    def audit_geo_answer(self, ip: str, winner: Optional[str], country: Optional[str], name: str, future):
+        """بررسی پاسخ دیررس یک سرویس بازنده"""
+        try:
+            answer = future.result()
+        except Exception:
+            return
+        if answer and country and answer != country:
+            self.record_geo_disagreement(ip, winner, country, name, answer)
+    
+    def record_geo_disagreement(self, ip: str, winner: str, country: str, name: str, answer: str):
+        """ثبت اختلاف نظر سرویس‌های GeoIP در لاگ ساختاریافته"""
+        self.logger.update_stat('geo_disagreements')
+        self.logger.log(f"   🌍 اختلاف GeoIP برای {ip}: {winner}={country} ولی {name}={answer}", "DEBUG",
+                        event="geo_disagreement", ip=ip, answers={winner: country, name: answer})
+    
     def ip_is_ir(self, ip: str) -> bool:
         """بررسی ایرانی بودن IP"""
         country = self.check_ip_country(ip)
@@ -535,8 +1547,7 @@ class IranProxyManager:
                 "server": server,
                 "port": int(port),
                 "cipher": method,
-                "password": password,
-                "udp": True
+                "password": password
             }
         except:
             return None
@@ -554,7 +1565,6 @@ class IranProxyManager:
                 "port": int(parsed.port),
                 "uuid": parsed.username,
                 "tls": q.get("security", ["none"])[0] == "tls",
-                "udp": True,
                 "network": q.get("type", ["tcp"])[0],
                 "ws-opts": {
                     "path": q.get("path", ["/"])[0],
@@ -564,18 +1574,24 @@ class IranProxyManager:
         except:
             return None
     
-    def fetch_html_proxies(self, url: str, proxy_type: str, source_name: str) -> List[Tuple[str, str, str]]:
-        """استخراج پروکسی از صفحات HTML"""
+    def fetch_html_proxies(self, url: str, proxy_type: str, source_name: str,
+                           html: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """استخراج پروکسی از صفحات HTML (در صورت نبود html صفحه دانلود می‌شود)"""
+        import requests
+        from bs4 import BeautifulSoup
+        
         proxies = []
         try:
-            headers = self.get_headers()
-            
-            time.sleep(random.uniform(2, 5))
+            if html is None:
+                headers = self.get_headers()
+                
+                time.sleep(random.uniform(2, 5))
+                
+                res = requests.get(url, headers=headers, timeout=30)
+                res.raise_for_status()
+                html = res.text
+            soup = BeautifulSoup(html, "html.parser")
             
-            res = requests.get(url, headers=headers, timeout=30)
-            res.raise_for_status()
-            soup = BeautifulSoup(res.text, "html.parser")
-
             if "freeproxy.world" in url:
                 table = soup.find("table")
                 rows = table.find_all("tr")[1:] if table else []
@@ -596,23 +1612,25 @@ class IranProxyManager:
                     ip, port = cols[0].text.strip(), cols[1].text.strip()
                     if ip and port and re.match(r"^\d+\.\d+\.\d+\.\d+$", ip):
                         proxies.append((ip, port, "socks5" if "socks5" in proxy_type else "http"))
-
+            
             return proxies
         except Exception:
             return []
     
-    def fetch_source_proxies(self, url: str, ptype: str, source_name: str, source_index: int, total_sources: int) -> List[Dict[str, Any]]:
-        """دریافت پروکسی از یک منبع خاص با تایم‌اوت بیشتر"""
-        proxies = []
+    def download_source(self, source: Dict[str, Any], raw: bool = False) -> Optional[Union[str, bytes]]:
+        """دانلود محتوای یک منبع با تلاش‌های متعدد (None = شکست یا توقف، raw = بایت‌های پاسخ)"""
+        import requests
         
-        # نمایش اطلاعات فعلی
-        current_total = self.logger.stats['total_proxies_received']
-        current_iranian = self.logger.stats['iranian_proxies']
-        self.logger.log(f"[{source_index}/{total_sources}] 🔍 دریافت از {source_name}", "INFO")
-        self.logger.log(f"   📊 وضعیت فعلی: [{current_iranian}/{current_total}]", "DEBUG")
+        url, source_name = source['url'], source['name']
+        retries = max(1, int(source['retries']))
         
         # تلاش‌های متعدد
-        for attempt in range(3):
+        for attempt in range(retries):
+            if self.budget.should_stop():
+                self.logger.log(f"   ⏹️ توقف دریافت {source_name} (بودجه زمانی/سهمیه)", "WARNING")
+                self.source_stats.update(source_name, partial=True)
+                return None
+            
             try:
                 self.logger.update_stat('sources_used')
                 
@@ -622,300 +1640,537 @@ class IranProxyManager:
                 time.sleep(delay)
                 
                 # تایم‌اوت بیشتر
-                response = requests.get(url, timeout=35, headers=headers)
+                timeout = self.budget.timeout_for(source['timeout'])
+                if source.get('mirrors'):
+                    response = self.race_mirrors(source, timeout, headers)
+                else:
+                    response = requests.get(url, timeout=timeout, headers=headers)
                 
                 if response.status_code == 200:
                     break
                 elif response.status_code == 403:
-                    self.logger.log(f"   ⚠️ دسترسی ممنوع (403) - تلاش {attempt+1}/3", "WARNING")
-                    if attempt < 2:
+                    self.logger.log(f"   ⚠️ دسترسی ممنوع (403) - تلاش {attempt+1}/{retries}", "WARNING")
+                    if attempt < retries - 1:
                         time.sleep(random.uniform(5, 8))
                         continue
                     else:
-                        self.logger.log(f"   ❌ بعد از ۳ تلاش موفق نشدیم", "ERROR")
+                        self.logger.log(f"   ❌ بعد از {retries} تلاش موفق نشدیم", "ERROR")
                         self.failed_sources.append(url)
                         self.logger.update_stat('sources_failed')
-                        return []
+                        self.source_stats.update(source_name, failed=True)
+                        return None
                 else:
-                    if attempt < 2:
+                    if attempt < retries - 1:
                         time.sleep(3)
                         continue
                     else:
                         self.failed_sources.append(url)
                         self.logger.update_stat('sources_failed')
-                        return []
-                        
+                        self.source_stats.update(source_name, failed=True)
+                        return None
+            
             except requests.exceptions.Timeout:
-                if attempt < 2:
+                if attempt < retries - 1:
                     time.sleep(5)
                     continue
                 else:
                     self.failed_sources.append(url)
                     self.logger.update_stat('sources_failed')
-                    return []
+                    self.source_stats.update(source_name, failed=True)
+                    return None
             except Exception:
-                if attempt < 2:
+                if attempt < retries - 1:
                     time.sleep(3)
                     continue
                 else:
                     self.failed_sources.append(url)
                     self.logger.update_stat('sources_failed')
+                    self.source_stats.update(source_name, failed=True)
+                    return None
+        
+        return response.content if raw else response.text
+    
+    def fetch_mirror(self, url: str, timeout: float, headers: Dict[str, str]):
+        """یک درخواست به آینه با ثبت تاخیر در تاریخچه"""
+        import requests
+        
+        started = time.time()
+        try:
+            response = requests.get(url, timeout=timeout, headers=headers)
+        except Exception:
+            self.source_stats.record_mirror(mirror_host(url), None, False)
+            raise
+        ok = response.status_code == 200 and bool(response.content.strip())
+        self.source_stats.record_mirror(mirror_host(url), time.time() - started, ok)
+        return response
+    
+    def mirror_delay(self, url: str) -> float:
+        """زمان انتظار برای یک آینه قبل از شروع آینه بعدی (دو برابر تاخیر معمول)"""
+        return min(max(2 * self.source_stats.mirror_cost(mirror_host(url)), 1.0), 10.0)
+    
+    def race_mirrors(self, source: Dict[str, Any], timeout: float, headers: Dict[str, str]):
+        """دریافت از آدرس اصلی و آینه‌ها: سریع‌ترین آینه اول، آینه بعدی اگر آینه فعلی کند باشد یا شکست بخورد"""
+        if self.mirror_executor is None:
+            self.mirror_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mirror")
+        
+        primary = source['url']
+        urls = sorted([primary] + source['mirrors'], key=lambda u: self.source_stats.mirror_cost(mirror_host(u)))
+        remaining = iter(urls)
+        pending = {}
+        responses = {}
+        error = None
+        winner = None
+        
+        def launch() -> bool:
+            url = next(remaining, None)
+            if url is None:
+                return False
+            pending[self.mirror_executor.submit(self.fetch_mirror, url, timeout, headers)] = url
+            return True
+        
+        self.logger.update_stat('mirror_races')
+        launch()
+        while pending and winner is None:
+            current = list(pending.values())[-1]
+            has_next = len(pending) + len(responses) < len(urls)
+            done, _ = wait(pending, timeout=self.mirror_delay(current) if has_next else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                responses[url] = response
+                if response.status_code == 200 and response.content.strip() and winner is None:
+                    winner = url
+            if winner is None and not pending:
+                launch()
+        
+        if winner is None:
+            if responses:
+                return list(responses.values())[-1]
+            raise error
+        
+        if winner == primary:
+            return responses[winner]
+        
+        # پاسخ آینه با آدرس اصلی مقایسه می‌شود (آینه ممکن است نسخه قدیمی کش شده را بدهد)
+        self.logger.update_stat('mirror_wins')
+        self.logger.log(f"   🪞 {source['name']} از آینه {mirror_host(winner)} دریافت شد", "DEBUG", mirror=winner)
+        reference = responses.get(primary)
+        if reference is not None:
+            if not self.verify_mirror(source, winner, responses[winner], reference):
+                return reference
+            return responses[winner]
+        
+        # پاسخ دیررس آدرس اصلی بدون معطل کردن اجرا بررسی می‌شود و در ترتیب آینه‌ها در اجراهای بعد اثر دارد
+        primary_future = next((f for f, url in pending.items() if url == primary), None)
+        if primary_future is None and random.random() < self.mirror_verify_rate:
+            primary_future = self.mirror_executor.submit(self.fetch_mirror, primary, timeout, headers)
+        if primary_future is not None:
+            body = responses[winner]
+            primary_future.add_done_callback(
+                lambda f: f.exception() or self.verify_mirror(source, winner, body, f.result()))
+        return responses[winner]
+    
+    def verify_mirror(self, source: Dict[str, Any], mirror_url: str, mirror_response, reference) -> bool:
+        """مقایسه پاسخ آینه با آدرس اصلی (False = پاسخ متفاوت)"""
+        if reference.status_code != 200:
+            return True
+        if hashlib.sha256(reference.content).digest() == hashlib.sha256(mirror_response.content).digest():
+            return True
+        self.logger.update_stat('mirror_mismatches')
+        self.source_stats.record_mismatch(mirror_host(mirror_url))
+        self.logger.log(f"   🪞 پاسخ {mirror_host(mirror_url)} با منبع اصلی {source['name']} یکسان نیست", "DEBUG",
+                        event="mirror_mismatch", mirror=mirror_url)
+        return False
+    
+    def fetch_source_proxies(self, source: Dict[str, Any], source_index: int, total_sources: int) -> List[Dict[str, Any]]:
+        """دریافت پروکسی از یک منبع خاص با تایم‌اوت بیشتر"""
+        url, ptype, source_name = source['url'], source['type'], source['name']
+        
+        # نمایش اطلاعات فعلی
+        current_total = self.logger.stats['total_proxies_received']
+        current_iranian = self.logger.stats['iranian_proxies']
+        self.logger.log(f"[{source_index}/{total_sources}] 🔍 دریافت از {source_name}", "INFO")
+        self.logger.log(f"   📊 وضعیت فعلی: [{current_iranian}/{current_total}]", "DEBUG")
+        
+        # لیست‌های ساده ip:port به صورت بایت خام دریافت و پیمایش می‌شوند
+        raw = ptype in PLAIN_LIST_TYPES
+        
+        # پاسخ همین اجرا از حافظه و پاسخ تلاش قبلی از checkpoint خوانده می‌شود
+        text = self.response_memo.get(url)
+        if text is not None:
+            self.logger.update_stat('memo_hits')
+            self.logger.log("   ♻️ این URL در همین اجرا دریافت شده است", "DEBUG")
+        else:
+            text = self.checkpoint.body(url, raw=raw)
+            if text is not None:
+                self.logger.log("   ♻️ استفاده از پاسخ ذخیره شده در checkpoint", "DEBUG")
+            else:
+                text = self.download_source(source, raw=raw)
+                if text is None:
                     return []
+                self.checkpoint.store_body(url, text)
+                self.save_checkpoint()
+            self.response_memo[url] = text
+        
+        # محتوای یکسان (حتی از URL دیگر) در یک اجرا فقط یک بار پارس و بررسی می‌شود
+        memo_key = (hashlib.sha1(text if isinstance(text, bytes) else text.encode('utf-8')).hexdigest(), ptype)
+        if memo_key in self.parse_memo:
+            proxies = self.parse_memo[memo_key]
+            self.logger.update_stat('memo_hits')
+            self.source_stats.discard_run(source_name)
+            self.logger.log(f"[{source_index}/{total_sources}] ♻️ {source_name}: همین محتوا در این اجرا پردازش شده است "
+                            f"({len(proxies)} پروکسی)")
+            return proxies
+        
+        proxies = self.parse_source_text(text, source, source_index, total_sources)
+        if not self.source_stats.pending.get(source_name, {}).get('partial'):
+            self.parse_memo[memo_key] = proxies
+        return proxies
+    
+    def parse_source_text(self, text: Union[str, bytes], source: Dict[str, Any], source_index: int,
+                          total_sources: int) -> List[Dict[str, Any]]:
+        """پارس محتوای دریافتی یک منبع و بررسی کاندیدها"""
+        url, ptype, source_name = source['url'], source['type'], source['name']
+        
+        if isinstance(text, bytes):
+            if ptype in PLAIN_LIST_TYPES:
+                from formats import scan_ip_ports
+                batch = scan_ip_ports(text)
+                # بدنه‌ای که هیچ خط ip:port ندارد (مثلا base64) از مسیر تشخیص فرمت می‌رود
+                if len(batch) or not text.strip():
+                    return self.check_ip_port_batch(batch, source, source_index, total_sources)
+            text = text.decode('utf-8', errors='replace')
         
         # اگر منبع HTML است
         if ptype.startswith("html-"):
-            html_proxies = self.fetch_html_proxies(url, ptype, source_name)
+            html_proxies = self.fetch_html_proxies(url, ptype, source_name, html=text)
             total_lines = len(html_proxies)
             self.logger.update_stat('total_proxies_received', total_lines)
+            self.source_stats.update(source_name, lines=total_lines)
             
-            added_count = 0
-            skipped_non_iran = 0
-            
-            for idx, (ip, port, proto) in enumerate(html_proxies, 1):
-                # نمایش هر ۵ پروکسی
-                if idx % 5 == 0:
-                    current_total = self.logger.stats['total_proxies_received']
-                    current_iranian = self.logger.stats['iranian_proxies']
-                    self.logger.log(f"   🔄 [{source_index}/{total_sources}] | [{current_iranian}/{current_total}] - پردازش پروکسی {idx}", "DEBUG")
-                
-                if not self.ip_is_ir(ip):
-                    skipped_non_iran += 1
+            candidates = []
+            for ip, port, proto in html_proxies:
+                try:
+                    candidates.append({'name': f"{ip}:{port}", 'type': proto, 'server': ip, 'port': int(port)})
+                except ValueError:
                     continue
-                
-                self.logger.update_stat('iranian_proxies')
-                alive, ping = self.is_alive(ip, int(port), proto)
-                
-                proxy_data = {
-                    'name': f"{ip}:{port} ({ping}ms)" if alive else f"{ip}:{port}",
-                    'type': proto,
-                    'server': ip,
-                    'port': int(port),
-                    'added_date': datetime.now().strftime('%Y-%m-%d'),
-                    'last_checked': datetime.now().strftime('%Y-%m-%d'),
-                    'is_active': alive,
-                    'country': 'IR',
-                    'ping': ping if alive else 0,
-                    'source': url,
-                    'source_name': source_name,
-                    'udp': True  # 🔥 اضافه شد
-                }
-                proxies.append(proxy_data)
-                added_count += 1
             
-            # نمایش نتایج
-            current_total = self.logger.stats['total_proxies_received']
-            current_iranian = self.logger.stats['iranian_proxies']
-            self.logger.log(f"[{source_index}/{total_sources}] ✅ {source_name}: {added_count} پروکسی ایرانی", "INFO")
-            self.logger.log(f"   📊 وضعیت نهایی: [{current_iranian}/{current_total}]", "DEBUG")
-            
-            return proxies
+            return self.check_candidates(candidates, url, source_name, source_index, total_sources)
         
-        # برای منابع متنی/API
-        lines = response.text.strip().splitlines()
-        total_lines = len(lines)
+        # برای منابع متنی/API: کل محتوا یک بار تشخیص و رمزگشایی می‌شود
+        from formats import decode_body, structured_proxies, FORMAT_SINGBOX, FORMAT_CLASH
+        fmt, records = decode_body(text.strip())
+        total_lines = len(records)
         self.logger.update_stat('total_proxies_received', total_lines)
+        self.source_stats.update(source_name, lines=total_lines, format=fmt)
         
-        self.logger.log(f"   📄 {total_lines} خط دریافت شد", "DEBUG")
+        self.logger.log(f"   📄 {total_lines} رکورد دریافت شد (فرمت: {fmt})", "DEBUG", lines=total_lines, format=fmt)
         
-        added_count = 0
-        skipped_non_iran = 0
-        skipped_invalid = 0
+        # sing-box و کلش مستقیم به کاندید تبدیل می‌شوند (نوع منبع فقط فیلتر است)
+        if fmt in (FORMAT_SINGBOX, FORMAT_CLASH):
+            converted = structured_proxies(fmt, records)
+            candidates = [c for c in converted if ptype == 'mixed' or c['type'] == ptype]
+            self.logger.log(f"   🧩 {len(candidates)} کاندید معتبر | نوع دیگر: {len(converted) - len(candidates)} | "
+                            f"نامعتبر: {total_lines - len(converted)}", "DEBUG")
+            return self.check_candidates(candidates, url, source_name, source_index, total_sources)
         
-        for line_num, line in enumerate(lines, 1):
+        # مرحله ۱: پارس همه خطوط بدون هیچ درخواست شبکه
+        candidates = []
+        skipped_invalid = 0
+        for line in records:
             line = line.strip()
             if not line:
                 continue
             
-            # نمایش هر ۱۰ خط
-            if line_num % 10 == 0:
-                current_total = self.logger.stats['total_proxies_received']
-                current_iranian = self.logger.stats['iranian_proxies']
-                self.logger.log(f"   🔄 [{source_index}/{total_sources}] | [{current_iranian}/{current_total}] - خط {line_num}/{total_lines}", "DEBUG")
+            conf = self.parse_proxy_line(line, ptype)
+            if conf:
+                candidates.append(conf)
+            else:
+                skipped_invalid += 1
+        
+        self.logger.log(f"   🧩 {len(candidates)} کاندید معتبر | نامعتبر: {skipped_invalid}", "DEBUG")
+        
+        return self.check_candidates(candidates, url, source_name, source_index, total_sources)
+    
+    def check_ip_port_batch(self, batch, source: Dict[str, Any], source_index: int,
+                            total_sources: int) -> List[Dict[str, Any]]:
+        """بررسی دسته آرایه‌ای ip:port (bogonها یکجا روی uint32 حذف می‌شوند)"""
+        url, ptype, source_name = source['url'], source['type'], source['name']
+        self.logger.update_stat('total_proxies_received', batch.lines)
+        self.source_stats.update(source_name, lines=batch.lines, format='ip-port')
+        
+        bogons = batch.drop(is_bogon_int)
+        # IPهایی که پیشوندشان با اطمینان غیرایرانی است روی همان آرایه uint32 حذف می‌شوند (بدون ساخت رشته و دیکشنری)
+        # در حالت shard سهم shard روی کلید رشته‌ای تعیین می‌شود و این فیلتر در check_candidates انجام می‌شود
+        foreign = batch.drop(self.prefix_cache.claim_foreign) if not self.shard else 0
+        if foreign:
+            for stat in ['ip_checks', 'geo_prefix_hits', 'non_iranian_proxies']:
+                self.logger.update_stat(stat, foreign)
+        self.logger.log(f"   📄 {batch.lines} خط دریافت شد (فرمت: ip-port)", "DEBUG", lines=batch.lines, format='ip-port')
+        self.logger.log(f"   🧩 {len(batch)} کاندید معتبر | نامعتبر: {batch.rejected} | تکراری: {batch.duplicates} | "
+                        f"bogon: {bogons} | پیشوند غیرایرانی: {foreign}", "DEBUG")
+        
+        return self.check_candidates(batch.to_candidates(ptype), url, source_name, source_index, total_sources,
+                                     foreign=foreign)
+    
+    def parse_vmess(self, line: str) -> Optional[Dict[str, Any]]:
+        """پارس کردن لینک VMESS"""
+        try:
+            decoded = base64.b64decode(line[8:] + "==").decode()
+            conf = json.loads(decoded)
+            server = conf.get("add")
+            port = conf.get("port")
             
-            try:
-                # VMESS
-                if ptype == "vmess" and line.startswith("vmess://"):
-                    decoded = base64.b64decode(line[8:] + "==").decode()
-                    conf = json.loads(decoded)
-                    ip = conf.get("add")
-                    port = conf.get("port")
-                    
-                    if not ip or not port:
-                        skipped_invalid += 1
-                        continue
-                    
-                    if not self.ip_is_ir(ip):
-                        skipped_non_iran += 1
-                        continue
-                    
-                    self.logger.update_stat('iranian_proxies')
-                    alive, ping = self.is_alive(ip, port)
-                    
-                    # 🔥 تصحیح alterId هنگام دریافت
-                    alter_id = int(conf.get("aid", 0))
-                    if alter_id == 0:  # اگر 0 است، برای کلش اندروید به 4 تغییر بده
-                        alter_id = 4
-                        self.logger.log(f"   ⚡ alterId اصلاح شد: 0 → 4 برای {ip}:{port}", "DEBUG")
-                    
-                    proxy_data = {
-                        'name': f"{ip}:{port} ({ping}ms)" if alive else f"{ip}:{port}",
-                        'type': 'vmess',
-                        'server': ip,
-                        'port': int(port),
-                        'uuid': conf.get("id"),
-                        'alterId': alter_id,
-                        'cipher': conf.get("cipher", "auto"),
-                        'tls': conf.get("tls") == "tls",
-                        'network': conf.get("net", "tcp"),
-                        'added_date': datetime.now().strftime('%Y-%m-%d'),
-                        'last_checked': datetime.now().strftime('%Y-%m-%d'),
-                        'is_active': alive,
-                        'country': 'IR',
-                        'ping': ping if alive else 0,
-                        'source': url,
-                        'source_name': source_name,
-                        'udp': True  # 🔥 اضافه شد
-                    }
-                    
-                    if conf.get("net") == "ws":
-                        ws_headers = {'Host': conf.get("host", "")}
-                        # اگر Host خالی است، با IP پر کن
-                        if not ws_headers['Host']:
-                            ws_headers['Host'] = ip
-                        
-                        proxy_data["ws-opts"] = {
-                            'path': conf.get("path", "/"),
-                            'headers': ws_headers
-                        }
-                    
-                    proxies.append(proxy_data)
-                    added_count += 1
-                
-                # VLESS
-                elif ptype == "vless" and line.startswith("vless://"):
-                    conf = self.parse_vless(line)
-                    if not conf:
-                        skipped_invalid += 1
-                        continue
-                    
-                    ip = conf.get("server")
-                    
-                    if not ip or not self.ip_is_ir(ip):
-                        skipped_non_iran += 1
-                        continue
-                    
-                    self.logger.update_stat('iranian_proxies')
-                    alive, ping = self.is_alive(ip, conf["port"])
-                    conf["added_date"] = datetime.now().strftime('%Y-%m-%d')
-                    conf["last_checked"] = datetime.now().strftime('%Y-%m-%d')
-                    conf["is_active"] = alive
-                    conf["country"] = 'IR'
-                    conf["ping"] = ping if alive else 0
-                    conf["source"] = url
-                    conf["source_name"] = source_name
-                    conf["name"] = f"{conf['server']}:{conf['port']} ({ping}ms)" if alive else f"{conf['server']}:{conf['port']}"
-                    conf['udp'] = True  # 🔥 اضافه شد
-                    
-                    proxies.append(conf)
-                    added_count += 1
+            if not server or not port:
+                return None
+            
+            # 🔥 تصحیح alterId هنگام دریافت
+            alter_id = int(conf.get("aid", 0))
+            if alter_id == 0:  # اگر 0 است، برای کلش اندروید به 4 تغییر بده
+                alter_id = 4
+                self.logger.log(f"   ⚡ alterId اصلاح شد: 0 → 4 برای {server}:{port}", "DEBUG")
+            
+            proxy_data = {
+                'name': f"{server}:{port}",
+                'type': 'vmess',
+                'server': server,
+                'port': int(port),
+                'uuid': conf.get("id"),
+                'alterId': alter_id,
+                'cipher': conf.get("cipher", "auto"),
+                'tls': conf.get("tls") == "tls",
+                'network': conf.get("net", "tcp"),
+            }
+            
+            if conf.get("net") == "ws":
+                ws_headers = {'Host': conf.get("host", "")}
+                # اگر Host خالی است، با آدرس سرور پر کن
+                if not ws_headers['Host']:
+                    ws_headers['Host'] = server
                 
-                # Shadowsocks
-                elif ptype == "ss" and line.startswith("ss://"):
-                    conf = self.parse_ss(line)
-                    if not conf:
-                        skipped_invalid += 1
-                        continue
-                    
-                    ip = conf.get("server")
-                    
-                    if not ip or not self.ip_is_ir(ip):
-                        skipped_non_iran += 1
-                        continue
-                    
-                    self.logger.update_stat('iranian_proxies')
-                    alive, ping = self.is_alive(ip, conf["port"])
-                    conf["added_date"] = datetime.now().strftime('%Y-%m-%d')
-                    conf["last_checked"] = datetime.now().strftime('%Y-%m-%d')
-                    conf["is_active"] = alive
-                    conf["country"] = 'IR'
-                    conf["ping"] = ping if alive else 0
-                    conf["source"] = url
-                    conf["source_name"] = source_name
-                    conf["name"] = f"{conf['server']}:{conf['port']} ({ping}ms)" if alive else f"{conf['server']}:{conf['port']}"
-                    conf['udp'] = True  # 🔥 اضافه شد
-                    
-                    proxies.append(conf)
-                    added_count += 1
+                proxy_data["ws-opts"] = {
+                    'path': conf.get("path", "/"),
+                    'headers': ws_headers
+                }
+            
+            return proxy_data
+        except Exception:
+            return None
+    
+    def parse_proxy_line(self, line: str, ptype: str) -> Optional[Dict[str, Any]]:
+        """پارس یک خط از منبع متنی به کاندید پروکسی (بدون بررسی شبکه)"""
+        # VMESS
+        if ptype == "vmess" and line.startswith("vmess://"):
+            return self.parse_vmess(line)
+        
+        # VLESS
+        if ptype == "vless" and line.startswith("vless://"):
+            conf = self.parse_vless(line)
+            return conf if conf and conf.get("server") else None
+        
+        # Shadowsocks
+        if ptype == "ss" and line.startswith("ss://"):
+            conf = self.parse_ss(line)
+            return conf if conf and conf.get("server") else None
+        
+        # HTTP/SOCKS5/MIXED
+        if ":" in line and ptype in ["http", "socks5", "mixed"]:
+            parts = line.split(":")
+            ip = parts[0].strip()
+            port = parts[1].strip()
+            
+            if self.ip_to_int(ip) is None or not port.isdigit():
+                return None
+            
+            proto = ptype
+            if proto == "mixed":
+                proto = "http" if len(parts) == 2 else "socks5"
+            
+            return {'name': f"{ip}:{port}", 'type': proto, 'server': ip, 'port': int(port)}
+        
+        return None
+    
+    def in_shard(self, proxy: Dict[str, Any]) -> bool:
+        """آیا کاندید متعلق به shard فعلی است؟ (تقسیم پایدار با crc32)"""
+        index, count = self.shard
+        return zlib.crc32(proxy_key(proxy).encode('utf-8')) % count == index
+    
+    def prioritized(self, candidates: List[Dict[str, Any]], source_name: str,
+                    resolved: Dict[str, str]):
+        """صف اولویت کاندیدها بر اساس اعتبار منبع، پورت، تاریخچه IP/پیشوند و پروتکل"""
+        from priority import AliveEstimator, priority_order, smoothed
+        
+        if self.alive_estimator is None:
+            self.alive_estimator = AliveEstimator(self.config.get('proxies', []))
+        # نرخ فعال منبع هموار می‌شود تا منبع با تاریخچه کوتاه اثر زیادی نگذارد
+        runs = self.source_stats.complete_runs(source_name)
+        iranian = sum(r.get('iranian', 0) for r in runs)
+        source_rate = smoothed(self.source_stats.alive_rate(source_name) * iranian, iranian) if iranian else None
+        self.logger.log(f"   🎯 ترتیب بررسی بر اساس احتمال فعال بودن (اعتبار منبع: "
+                        f"{'-' if source_rate is None else f'{source_rate:.2f}'})", "DEBUG")
+        return priority_order(candidates, self.alive_estimator, source_rate, resolved)
+    
+    @log_stage('check')
+    def check_candidates(self, candidates: List[Dict[str, Any]], url: str, source_name: str,
+                         source_index: int, total_sources: int, foreign: int = 0) -> List[Dict[str, Any]]:
+        """حل DNS دسته‌ای، بررسی کشور IP و سلامت کاندیدها (foreign: کاندیدهای غیرایرانی که پیش‌تر حذف شده‌اند)"""
+        proxies = []
+        added_count = 0
+        skipped_non_iran = foreign
+        skipped_unresolved = 0
+        
+        # در حالت shard فقط سهم همین shard بررسی می‌شود
+        if self.shard:
+            candidates = [c for c in candidates if self.in_shard(c)]
+        
+        # مرحله ۲: حل همزمان همه نام‌های دامنه یکتا
+        resolved = self.resolver.resolve_many(c['server'] for c in candidates)
+        self.source_stats.update(source_name, candidates=len(candidates) + foreign)
+        geo_checked = foreign
+        total = len(candidates)
+        udp_jobs = []
+        batch = []
+        
+        def flush():
+            """بررسی سلامت هم‌زمان دسته کاندیدهای ایرانی و ثبت نتیجه‌ها"""
+            nonlocal added_count
+            if not batch:
+                return
+            outcomes = self.alive_many([(ip, conf['port'], conf['type'], sni) for conf, ip, sni in batch])
+            today = datetime.now().strftime('%Y-%m-%d')
+            for (conf, ip, sni), (alive, ping) in zip(batch, outcomes):
+                if alive:
+                    self.budget.record_active(proxy_key(conf))
+                    conf['probe'] = self.probe_timings(ip, conf['port'], conf['type'], sni)
+                udp_jobs.append((conf, self.submit_udp_probe(conf, ip) if alive else None))
                 
-                # HTTP/SOCKS5/MIXED
-                elif ":" in line and ptype in ["http", "socks5", "mixed"]:
-                    parts = line.split(":")
-                    if len(parts) >= 2:
-                        ip = parts[0].strip()
-                        port = parts[1].strip()
-                        
-                        if not re.match(r"^\d+\.\d+\.\d+\.\d+$", ip):
-                            skipped_invalid += 1
-                            continue
-                        
-                        proto = ptype
-                        if proto == "mixed":
-                            proto = "http" if len(parts) == 2 else "socks5"
-                        
-                        if not self.ip_is_ir(ip):
-                            skipped_non_iran += 1
-                            continue
-                        
-                        self.logger.update_stat('iranian_proxies')
-                        alive, ping = self.is_alive(ip, int(port), proto)
-                        
-                        proxy_data = {
-                            'name': f"{ip}:{port} ({ping}ms)" if alive else f"{ip}:{port}",
-                            'type': proto,
-                            'server': ip,
-                            'port': int(port),
-                            'added_date': datetime.now().strftime('%Y-%m-%d'),
-                            'last_checked': datetime.now().strftime('%Y-%m-%d'),
-                            'is_active': alive,
-                            'country': 'IR',
-                            'ping': ping if alive else 0,
-                            'source': url,
-                            'source_name': source_name,
-                            'udp': True  # 🔥 اضافه شد
-                        }
-                        proxies.append(proxy_data)
-                        added_count += 1
-                    else:
-                        skipped_invalid += 1
+                conf.update({
+                    'name': f"{conf['server']}:{conf['port']} ({ping}ms)" if alive else f"{conf['server']}:{conf['port']}",
+                    'added_date': today,
+                    'last_checked': today,
+                    'is_active': alive,
+                    'country': 'IR',
+                    'ping': ping if alive else 0,
+                    'source': url,
+                    'source_name': source_name
+                })
+                update_health(conf, alive, ping)
+                proxies.append(conf)
+                added_count += 1
+            batch.clear()
+        
+        # کاندیدهای محتمل‌تر اول بررسی می‌شوند تا سهمیه با بررسی‌های کمتری پر شود
+        if self.check_priority:
+            ordered = (conf for _, conf in self.prioritized(candidates, source_name, resolved))
+        else:
+            ordered = iter(candidates)
+        
+        # مرحله ۳: بررسی کشور IP حل‌شده و سلامت
+        for idx, conf in enumerate(ordered, 1):
+            if self.budget.should_stop():
+                self.logger.log(f"   ⏹️ توقف بررسی {source_name} در کاندید {idx}/{total} ({self.budget.stop_reason})", "WARNING")
+                self.source_stats.update(source_name, partial=True)
+                break
             
-            except Exception:
-                skipped_invalid += 1
+            # نمایش هر ۱۰ کاندید
+            if idx % 10 == 0:
+                current_total = self.logger.stats['total_proxies_received']
+                current_iranian = self.logger.stats['iranian_proxies']
+                self.logger.log(f"   🔄 [{source_index}/{total_sources}] | [{current_iranian}/{current_total}] - کاندید {idx}/{total}", "DEBUG")
+            
+            ip = resolved.get(conf['server'])
+            if not ip:
+                skipped_unresolved += 1
+                continue
+            
+            geo_checked += 1
+            self.source_stats.update(source_name, geo_checked=geo_checked)
+            if not self.ip_is_ir(ip):
+                skipped_non_iran += 1
                 continue
+            
+            self.logger.update_stat('iranian_proxies')
+            # کشور استنتاج شده از پیشوند با میزان اطمینانش علامت‌گذاری می‌شود
+            if ip in self.geo_inferred:
+                conf['geo_confidence'] = self.geo_inferred[ip]
+            batch.append((conf, ip, self.tls_sni(conf)))
+            # دسته از باقیمانده سهمیه بزرگ‌تر نمی‌شود تا بیش از هدف پروب نشود
+            batch_size = self.probe_concurrency
+            if self.budget.quota_left() is not None:
+                batch_size = max(1, min(batch_size, self.budget.quota_left()))
+            if len(batch) >= batch_size:
+                flush()
+        
+        # کاندیدهای ایرانی باقیمانده (بررسی کشورشان انجام شده است)
+        flush()
+        
+        # آزمون‌های UDP هم‌زمان با بررسی‌های TCP بالا اجرا شده‌اند
+        for conf, job in udp_jobs:
+            self.apply_udp(conf, job)
         
         # نمایش نتایج
         current_total = self.logger.stats['total_proxies_received']
         current_iranian = self.logger.stats['iranian_proxies']
-        self.logger.log(f"[{source_index}/{total_sources}] ✅ {source_name}: {added_count} پروکسی ایرانی", "INFO")
-        self.logger.log(f"   📊 وضعیت نهایی: [{current_iranian}/{current_total}] | نامعتبر: {skipped_invalid} | غیرایرانی: {skipped_non_iran}", "DEBUG")
+        self.logger.log(f"[{source_index}/{total_sources}] ✅ {source_name}: {added_count} پروکسی ایرانی", "INFO",
+                        iranian=added_count, non_iranian=skipped_non_iran, unresolved=skipped_unresolved)
+        self.logger.log(f"   📊 وضعیت نهایی: [{current_iranian}/{current_total}] | حل‌نشده/bogon: {skipped_unresolved} | غیرایرانی: {skipped_non_iran}", "DEBUG")
         
         return proxies
     
-    def fetch_all_proxies(self) -> List[Dict[str, Any]]:
-        """دریافت همه پروکسی‌ها از منابع با تاخیر هوشمند"""
+    @log_stage('fetch')
+    def fetch_all_proxies(self, sources: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """دریافت همه پروکسی‌ها از منابع به ترتیب بازدهی مورد انتظار"""
         all_proxies = []
         seen_keys = set()
         
-        total_sources = len(self.SOURCES)
+        sources, skipped = self.source_stats.plan(self.SOURCES if sources is None else sources)
+        for source in skipped:
+            failures = self.source_stats.history(source['name'])['consecutive_failures']
+            self.logger.log(f"⏭️ رد منبع مرده {source['name']} ({failures} شکست متوالی)", "DEBUG")
+        
+        total_sources = len(sources)
         self.logger.log(f"\n📥 شروع دریافت پروکسی‌ها از {total_sources} منبع:")
         self.logger.log("=" * 70)
         
-        for idx, (url, ptype, source_name) in enumerate(self.SOURCES, 1):
-            proxies = self.fetch_source_proxies(url, ptype, source_name, idx, total_sources)
+        for idx, source in enumerate(sources, 1):
+            if self.budget.should_stop():
+                self.logger.log(f"⏹️ توقف دریافت منابع ({self.budget.stop_reason}) - {total_sources - idx + 1} منبع باقیمانده رد شد", "WARNING")
+                break
+            
+            expected = self.source_stats.expected_yield(source['name'])
+            if expected is not None:
+                self.logger.log(f"   📈 بازدهی مورد انتظار {source['name']}: {expected:.4f} پروکسی فعال/ثانیه", "DEBUG")
+            
+            # منابع کامل شده در تلاش قبلی دوباره پردازش نمی‌شوند
+            reused = self.checkpoint.completed(source['name'])
+            if reused is not None:
+                self.logger.log(f"[{idx}/{total_sources}] ♻️ {source['name']}: {len(reused)} پروکسی از checkpoint")
+                proxies = reused
+                for proxy in proxies:
+                    if proxy.get('is_active'):
+                        self.budget.record_active(proxy_key(proxy))
+            else:
+                self.source_stats.start_run(source['name'])
+                with self.logger.scope(source=source['name']):
+                    proxies = self.fetch_source_proxies(source, idx, total_sources)
+                partial = self.source_stats.pending.get(source['name'], {}).get('partial')
+                self.source_stats.finish_run(source['name'], proxies)
+                if not partial:
+                    self.checkpoint.complete_source(source['name'], proxies)
+                    self.save_checkpoint()
             
             # حذف تکراری‌ها
             filtered_proxies = []
             for proxy in proxies:
-                key = f"{proxy.get('server', '')}:{proxy.get('port', 0)}-{proxy.get('type', '')}"
+                key = proxy_key(proxy)
                 if key not in seen_keys:
                     seen_keys.add(key)
                     filtered_proxies.append(proxy)
@@ -925,7 +2180,7 @@ class IranProxyManager:
             all_proxies.extend(filtered_proxies)
             
             # 🔥 تاخیر هوشمند بین منابع
-            if idx < total_sources:
+            if reused is None and idx < total_sources:
                 remaining = total_sources - idx
                 if remaining > 10:
                     delay = random.uniform(3, 6)
@@ -934,62 +2189,93 @@ class IranProxyManager:
                 else:
                     delay = random.uniform(1, 2)
                 
+                # با نزدیک شدن به مهلت یا درخواست توقف، تاخیر بین منابع حذف می‌شود
+                if self.budget.quota_met() or self.budget.near_deadline(delay) or self.budget.stopped():
+                    continue
+                
                 self.logger.log(f"   ⏳ تاخیر {delay:.1f} ثانیه قبل از منبع بعدی...", "DEBUG")
                 time.sleep(delay)
         
+        # در حالت shard آمار منابع در فایل نتیجه جزئی ذخیره و در مرحله merge ترکیب می‌شود
+        if not self.shard:
+            try:
+                self.source_stats.save()
+            except Exception as e:
+                self.logger.log(f"⚠️ خطا در ذخیره آمار منابع: {e}", "WARNING")
+        
         self.logger.log("=" * 70)
         self.logger.log(f"📊 مجموع {len(all_proxies)} پروکسی ایرانی از {total_sources} منبع دریافت شد")
         return all_proxies
     
+    @log_stage('merge')
     def add_new_proxies(self, new_proxies: List[Dict[str, Any]]) -> Tuple[int, int]:
-        """اضافه کردن پروکسی‌های جدید به لیست موجود"""
-        existing_keys = set()
+        """اضافه کردن پروکسی‌های جدید و اعمال نتیجه بررسی تازه روی پروکسی‌های موجود"""
+        existing = {}
         for proxy in self.config.get('proxies', []):
-            key = f"{proxy.get('server', '')}:{proxy.get('port', 0)}-{proxy.get('type', '')}"
-            existing_keys.add(key)
+            existing[proxy_key(proxy)] = proxy
         
         added_count = 0
         duplicate_count = 0
         
         for proxy in new_proxies:
-            key = f"{proxy.get('server', '')}:{proxy.get('port', 0)}-{proxy.get('type', '')}"
-            if key not in existing_keys:
+            key = proxy_key(proxy)
+            current = existing.get(key)
+            if current is None:
                 self.config.setdefault('proxies', []).append(proxy)
+                existing[key] = proxy
                 added_count += 1
                 self.logger.update_stat('proxies_added')
             else:
                 duplicate_count += 1
                 self.logger.update_stat('duplicates_found')
+                if current is not proxy and 'last_checked' in proxy:
+                    self.refresh_proxy(current, proxy)
         
         return added_count, duplicate_count
     
+    def refresh_proxy(self, proxy: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+        """اعمال نتیجه بررسی جدیدتر روی رکورد موجود (تاریخ افزودن، اولین منبع و تاریخچه سلامت حفظ می‌شوند)"""
+        if 'health' not in proxy:
+            proxy['health'] = seed_health(proxy)
+        
+        # هر بررسی فقط یک بار در تاریخچه شمرده می‌شود
+        checked_at = (fresh.get('health') or {}).get('updated', str(fresh.get('last_checked', '')))
+        if checked_at <= proxy['health'].get('updated', ''):
+            return False
+        
+        # ترتیب منابع هر اجرا بر اساس بازدهی عوض می‌شود؛ منبعی که پروکسی اول از آن دیده شده حفظ می‌شود
+        kept = {field: proxy[field] for field in ['added_date', 'source', 'source_name'] if proxy.get(field)}
+        proxy.update({field: value for field, value in fresh.items() if field != 'health'})
+        for field in ['geo_confidence', 'udp_ping']:
+            if field not in fresh:
+                proxy.pop(field, None)
+        proxy.update(kept)
+        update_health(proxy, bool(fresh.get('is_active')), fresh.get('ping') or 0, parse_time(checked_at))
+        return True
+    
     def should_remove_old_proxies(self) -> Tuple[bool, List[Dict], int]:
-        """بررسی شرایط حذف پروکسی‌های قدیمی"""
-        total_proxies = len(self.config.get('proxies', []))
+        """انتخاب پروکسی‌های قابل حذف (قدیمی‌تر از ۳ روز یا عملا مرده) با کمترین امتیاز سلامت"""
+        proxies = self.config.get('proxies', [])
+        total_proxies = len(proxies)
         
         if total_proxies <= 50:
             return False, [], 0
         
         excess_count = total_proxies - 50
         
-        today = datetime.now()
-        cutoff_date = today - timedelta(days=3)
-        
-        old_proxies = []
-        for proxy in self.config.get('proxies', []):
-            try:
-                added_date = datetime.strptime(proxy['added_date'], '%Y-%m-%d')
-                if added_date < cutoff_date:
-                    old_proxies.append(proxy)
-            except (ValueError, KeyError):
-                continue
+        now = datetime.now()
+        cutoff_date = (now - timedelta(days=3)).strftime('%Y-%m-%d')
         
-        old_proxies.sort(key=lambda x: datetime.strptime(x['added_date'], '%Y-%m-%d'))
+        # پروکسی‌های جدید فرصت ساختن تاریخچه دارند مگر اینکه از همان ابتدا مرده باشند
+        evictable = [p for p in proxies
+                     if str(p.get('added_date', '')) < cutoff_date or health_score(p, now) < DEAD_SCORE]
+        old_proxies = bottom_k(evictable, excess_count, now)
         
         should_remove = len(old_proxies) > 0 and excess_count > 0
         
         return should_remove, old_proxies, excess_count
     
+    @log_stage('evict')
     def remove_old_proxies_with_conditions(self) -> int:
         """حذف پروکسی‌های قدیمی در صورت برقراری شرایط"""
         should_remove, old_proxies, excess_count = self.should_remove_old_proxies()
@@ -1011,7 +2297,8 @@ class IranProxyManager:
             if key in old_keys_to_remove and removed_count < excess_count:
                 removed_count += 1
                 self.logger.update_stat('proxies_removed')
-                self.logger.log(f"   🗑️ حذف پروکسی قدیمی: {proxy.get('server')}:{proxy.get('port')} (تاریخ: {proxy.get('added_date')})", "INFO")
+                self.logger.log(f"   🗑️ حذف پروکسی: {proxy.get('server')}:{proxy.get('port')} "
+                                f"(تاریخ: {proxy.get('added_date')}، امتیاز سلامت: {health_score(proxy):.2f})", "INFO")
                 continue
             
             remaining_proxies.append(proxy)
@@ -1019,131 +2306,568 @@ class IranProxyManager:
         self.config['proxies'] = remaining_proxies
         return removed_count
     
+    @log_stage('emergency')
     def ensure_minimum_proxies(self):
-        """اطمینان از وجود حداقل ۵۰ پروکسی فعال"""
-        active_proxies = [p for p in self.config.get('proxies', []) if p.get('is_active', False)]
+        """اطمینان از وجود حداقل ۵۰ پروکسی فعال با امتیاز سلامت کافی"""
+        now = datetime.now()
+        proxies = self.config.get('proxies', [])
+        active_proxies = [p for p in proxies if p.get('is_active', False) and health_score(p, now) >= HEALTHY_SCORE]
+        
+        for proxy in top_k(proxies, 5, now):
+            self.logger.log(f"   🏅 {proxy.get('server')}:{proxy.get('port')} امتیاز سلامت {health_score(proxy, now):.2f}", "DEBUG")
         
         if len(active_proxies) >= 50:
-            self.logger.log(f"✅ {len(active_proxies)} پروکسی فعال موجود است (کافی است)")
+            self.logger.log(f"✅ {len(active_proxies)} پروکسی فعال سالم موجود است (کافی است)")
             return
         
         needed = 50 - len(active_proxies)
-        self.logger.log(f"⚠️ فقط {len(active_proxies)} پروکسی فعال داریم. نیاز به {needed} پروکسی بیشتر")
+        self.logger.log(f"⚠️ فقط {len(active_proxies)} پروکسی فعال سالم داریم. نیاز به {needed} پروکسی بیشتر")
         
-        self.logger.log("🔍 تلاش برای دریافت پروکسی‌های بیشتر از منابع اضطراری...")
+        if self.budget.should_stop():
+            self.logger.log(f"⏹️ منابع اضطراری رد شد ({self.budget.stop_reason})", "WARNING")
+            return
         
-        # استفاده از منابع اضطراری
-        emergency_sources = [
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&timeout=10000&country=all", "http", "emergency-http"),
-            ("https://api.proxyscrape.com/v2/?request=displayproxies&protocol=socks5&timeout=10000&country=all", "socks5", "emergency-socks5"),
-            ("https://raw.githubusercontent.com/freefq/free/master/v2", "vmess", "emergency-vmess"),
-        ]
+        self.logger.log("🔍 تلاش برای دریافت پروکسی‌های بیشتر از منابع اضطراری...")
         
-        original_sources = self.SOURCES.copy()
-        self.SOURCES = emergency_sources
+        # استفاده از منابع اضطراری (به ترتیب بازدهی تاریخچه)
+        emergency_sources = [s for s in self.SOURCES if s['emergency']]
         
-        new_emergency_proxies = self.fetch_all_proxies()
+        new_emergency_proxies = self.fetch_all_proxies(emergency_sources)
         added, _ = self.add_new_proxies(new_emergency_proxies)
         
-        self.SOURCES = original_sources
-        
         if added > 0:
             self.logger.log(f"✅ {added} پروکسی اضطراری اضافه شد")
         else:
             self.logger.log("❌ نتوانستیم پروکسی اضافی پیدا کنیم")
     
-    def create_clash_config(self):
-        """ایجاد کانفیگ بهینه برای کلش اندروید"""
-        clash_path = "output/clash_config.yaml"
+    @log_stage('fixes')
+    def apply_clash_fixes(self) -> int:
+        """اعمال اصلاحات نهایی کلش اندروید روی همه پروکسی‌ها"""
+        from probes import udp_value
         
+        fix_count = 0
+        for proxy in self.config.get('proxies', []):
+            # udp فقط با آزمون موفق true می‌ماند (رکوردهای قدیمی udp: true اجباری داشتند)
+            udp = udp_value(proxy)
+            if proxy.get('udp') != udp:
+                proxy['udp'] = udp
+                fix_count += 1
+            
+            if proxy['type'] == 'vmess':
+                # اصلاح alterId اگر 0 یا کمتر از 4 است
+                current_alter = proxy.get('alterId', 0)
+                if current_alter < 4:
+                    proxy['alterId'] = 4
+                    self.logger.log(f"   ⚡ alterId اصلاح شد: {proxy['server']}:{proxy['port']} → 4", "DEBUG")
+                    fix_count += 1
+                
+                # اصلاح TLS برای پورت 443
+                if proxy['port'] == 443 and not proxy.get('tls', False):
+                    proxy['tls'] = True
+                    self.logger.log(f"   ⚡ TLS فعال شد برای {proxy['server']}:443", "DEBUG")
+                    fix_count += 1
+                
+                # اصلاح Host خالی در ws-opts
+                if 'ws-opts' in proxy:
+                    headers = proxy['ws-opts'].get('headers', {})
+                    if headers.get('Host', '') == '':
+                        headers['Host'] = proxy['server']
+                        proxy['ws-opts']['headers'] = headers
+                        self.logger.log(f"   ⚡ Host اصلاح شد: {proxy['server']}:{proxy['port']}", "DEBUG")
+                        fix_count += 1
+                
+                # اضافه کردن sni برای TLS
+                if proxy.get('tls', False) and 'sni' not in proxy:
+                    host = proxy.get('ws-opts', {}).get('headers', {}).get('Host', '')
+                    proxy['sni'] = host if host else proxy['server']
+                    fix_count += 1
+        
+        return fix_count
+    
+    @log_stage('render')
+    def create_clash_config(self):
+        """ایجاد کانفیگ کلش، ساب‌اسکریپشن، sing-box و لینک‌ها در یک گذر"""
         if not self.config.get('proxies'):
             self.logger.log("❌ هیچ پروکسی برای ایجاد کانفیگ کلش وجود ندارد", "WARNING")
             return
         
-        clash_proxies = []
+        # بهترین پروکسی‌ها از نظر امتیاز سلامت اول می‌آیند
+        rendered = render_outputs(rank_proxies(self.config.get('proxies', [])))
+        written = write_outputs(rendered, os.path.dirname(self.config_path) or '.')
+        
+        for path, changed in written.items():
+            if changed:
+                self.logger.log(f"✅ خروجی ایجاد شد: {path}")
+        unchanged = len([path for path, changed in written.items() if not changed])
+        if unchanged:
+            self.logger.log(f"⏸️ {unchanged} خروجی تغییری نکرده‌اند - نوشتن آن‌ها رد شد")
+        self.logger.log(f"   📊 {len(rendered['clash']['proxies'])} پروکسی در کانفیگ کلش")
+        for name, variant in sorted(rendered['variants'].items()):
+            self.logger.log(f"   📦 نسخه {name}: {len(variant['clash']['proxies'])} پروکسی ({variant['description']})")
+    
+    def reset_run_memo(self):
+        """خالی کردن حافظه پاسخ‌ها و نتایج منابع در شروع هر اجرا"""
+        self.response_memo = {}
+        self.parse_memo = {}
+        self.alive_estimator = None
+    
+    def resume_checkpoint(self) -> bool:
+        """بارگذاری checkpoint تلاش قبلی با ورودی‌های یکسان و گرم کردن کش‌ها"""
+        fingerprint = hashlib.sha256()
+        try:
+            with open(self.sources_path, 'rb') as f:
+                fingerprint.update(f.read())
+        except OSError:
+            pass
+        fingerprint.update(repr(self.shard).encode())
+        
+        if not self.checkpoint.open(fingerprint.hexdigest()):
+            if self.checkpoint.enabled:
+                self.logger.log(f"💾 checkpoint جدید در {self.checkpoint.state_dir}", "DEBUG")
+            return False
         
+        data = self.checkpoint.data
+        self.ip_cache.update(data['geo'])
+        for key, value in data['probes'].items():
+            self.alive_cache[key] = tuple(value)
+        # نتایج بررسی سلامت تلاش قبلی در پنجره تازگی checkpoint معتبرند
+        self.alive_cache_ttl = max(self.alive_cache_ttl, self.checkpoint.max_age)
+        
+        age_minutes = (time.time() - data['created']) / 60
+        self.logger.log(f"♻️ ادامه از checkpoint ({age_minutes:.0f} دقیقه پیش): {len(data['completed'])} منبع کامل، "
+                        f"{len(data['bodies'])} پاسخ، {len(data['geo'])} IP، {len(data['probes'])} بررسی سلامت")
+        return True
+    
+    def save_checkpoint(self):
+        """ذخیره وضعیت فعلی در checkpoint"""
+        try:
+            with self.lock:
+                geo = dict(self.ip_cache)
+                probes = dict(self.alive_cache)
+            self.checkpoint.save(geo, probes)
+        except Exception as e:
+            self.logger.log(f"⚠️ خطا در ذخیره checkpoint: {e}", "WARNING")
+    
+    def publish_outputs(self):
+        """حذف قدیمی‌ها، اصلاحات کلش و نوشتن خروجی‌ها (فقط فایل‌های تغییر کرده نوشته می‌شوند)"""
+        self.remove_old_proxies_with_conditions()
+        self.apply_clash_fixes()
+        self.create_clash_config()
+        self.save_config()
+    
+    def reprobe_proxies(self, limit: int, active_interval: float = 900, inactive_interval: float = 3600) -> int:
+        """بررسی دوباره سلامت پروکسی‌های موجود (قدیمی‌ترین بررسی اول)"""
+        now = time.time()
+        due = []
         for proxy in self.config.get('proxies', []):
-            clash_proxy = {
-                'name': proxy.get('name', f"{proxy['server']}:{proxy['port']}"),
-                'type': proxy['type'],
-                'server': proxy['server'],
-                'port': proxy['port'],
-                'udp': True  # 🔥 همیشه true برای کلش
-            }
+            interval = active_interval if proxy.get('is_active') else inactive_interval
+            last_probe = self.last_probe.get(proxy_key(proxy), 0)
+            if now - last_probe >= interval:
+                due.append((last_probe, proxy))
+        due.sort(key=lambda item: item[0])
+        
+        changed = 0
+        udp_jobs = []
+        selected = [(proxy, self.resolver.resolve(proxy['server']), self.tls_sni(proxy)) for _, proxy in due[:limit]]
+        # همه پروکسی‌های این نوبت در یک event loop بررسی می‌شوند
+        outcomes = iter(self.alive_many([(ip, int(proxy['port']), proxy['type'], sni)
+                                         for proxy, ip, sni in selected if ip], max_age=0))
+        for proxy, ip, sni in selected:
+            alive, ping = next(outcomes) if ip else (False, 0)
+            if alive:
+                proxy['probe'] = self.probe_timings(ip, int(proxy['port']), proxy['type'], sni)
+                udp_jobs.append((proxy, self.submit_udp_probe(proxy, ip)))
+            self.last_probe[proxy_key(proxy)] = time.time()
             
-            if proxy['type'] == 'vmess':
-                clash_proxy.update({
-                    'uuid': proxy.get('uuid', ''),
-                    'alterId': max(proxy.get('alterId', 0), 4),
-                    'cipher': proxy.get('cipher', 'auto'),
-                    'tls': proxy.get('tls', False)
-                })
+            if alive != bool(proxy.get('is_active')):
+                changed += 1
+            proxy['is_active'] = alive
+            proxy['ping'] = ping if alive else 0
+            proxy['last_checked'] = datetime.now().strftime('%Y-%m-%d')
+            proxy['name'] = f"{proxy['server']}:{proxy['port']} ({ping}ms)" if alive else f"{proxy['server']}:{proxy['port']}"
+            update_health(proxy, alive, ping)
+        
+        for proxy, job in udp_jobs:
+            self.apply_udp(proxy, job)
+        return changed
+    
+    @log_stage('speed')
+    def measure_throughput(self, proxies: Optional[List[Dict[str, Any]]] = None) -> int:
+        """آزمون سرعت دانلود پروکسی‌های فعال HTTP/SOCKS5 (بهترین امتیاز سلامت اول) و ذخیره speed_kbps"""
+        from probes import run_throughput_many
+        
+        if not self.speed_test_url:
+            return 0
+        
+        proxies = self.config.get('proxies', []) if proxies is None else proxies
+        eligible = [p for p in proxies if p.get('is_active') and str(p.get('type', '')).lower() in ['http', 'socks5']]
+        selected = []
+        items = []
+        for proxy in top_k(eligible, self.speed_test_limit):
+            ip = self.resolver.resolve(proxy['server'])
+            if not ip:
+                continue
+            selected.append(proxy)
+            items.append({'kind': str(proxy['type']).lower(), 'ip': ip, 'port': int(proxy['port'])})
+        if not items:
+            return 0
+        
+        self.logger.log(f"⚡ آزمون سرعت {len(items)} پروکسی ({self.speed_test_bytes // 1024}KB، "
+                        f"هم‌زمانی {self.speed_test_concurrency}، سقف {self.speed_test_bandwidth_kbps}KB/s)")
+        results = run_throughput_many(items, self.speed_test_url, self.speed_test_bytes,
+                                      self.speed_test_concurrency, self.speed_test_bandwidth_kbps)
+        
+        measured = 0
+        for proxy, result in zip(selected, results):
+            self.logger.update_stat('speed_tests')
+            proxy['speed_kbps'] = result['speed_kbps']
+            if result['error']:
+                self.logger.log(f"   ❌ آزمون سرعت {proxy['server']}:{proxy['port']}: {result['error']}", "DEBUG")
+            else:
+                measured += 1
+        
+        fastest = sorted(selected, key=lambda p: p['speed_kbps'], reverse=True)[:3]
+        self.logger.log(f"   ✅ {measured}/{len(items)} آزمون موفق؛ سریع‌ترین: " +
+                        ", ".join(f"{p['server']}:{p['port']}={p['speed_kbps']}KB/s" for p in fastest))
+        return measured
+    
+    def due_sources(self) -> List[Dict[str, Any]]:
+        """منابعی که زمان به‌روزرسانی‌شان رسیده است"""
+        now = time.time()
+        return [s for s in self.SOURCES
+                if now - self.source_refreshed.get(s['name'], 0) >= float(s['refresh_minutes']) * 60]
+    
+    def snapshot_state(self) -> Dict[str, Any]:
+        """وضعیت گرم حافظه برای ذخیره در snapshot"""
+        with self.lock:
+            return {
+                'saved_at': time.time(),
+                'proxies': self.config.get('proxies', []),
+                'ip_cache': dict(self.ip_cache),
+                'geo_inferred': dict(self.geo_inferred),
+                'geo_prefixes': self.prefix_cache.export(),
+                'dns_cache': {host: [ips, expires] for host, (ips, expires) in self.resolver.cache.items()},
+                'alive_cache': {key: list(value) for key, value in self.alive_cache.items()},
+                'last_probe': dict(self.last_probe),
+                'source_refreshed': dict(self.source_refreshed),
+            }
+    
+    def write_snapshot(self, path: str):
+        """ذخیره اتمیک snapshot فشرده"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(self.snapshot_state(), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+    
+    def load_snapshot(self, path: str) -> bool:
+        """بارگذاری snapshot برای شروع گرم"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            self.logger.log(f"⚠️ خطا در بارگذاری snapshot: {e}", "WARNING")
+            return False
+        
+        if state.get('proxies'):
+            self.config['proxies'] = state['proxies']
+        self.ip_cache.update(state.get('ip_cache', {}))
+        self.geo_inferred.update(state.get('geo_inferred', {}))
+        self.prefix_cache.load(state.get('geo_prefixes'))
+        now = time.time()
+        for host, (ips, expires) in state.get('dns_cache', {}).items():
+            if expires > now:
+                self.resolver.cache[host] = (ips, expires)
+        for key, value in state.get('alive_cache', {}).items():
+            self.alive_cache[key] = tuple(value)
+        self.last_probe.update(state.get('last_probe', {}))
+        self.source_refreshed.update(state.get('source_refreshed', {}))
+        
+        age_minutes = (now - state.get('saved_at', now)) / 60
+        self.logger.log(f"♻️ شروع گرم از snapshot ({age_minutes:.0f} دقیقه پیش): "
+                        f"{len(self.config.get('proxies', []))} پروکسی، {len(self.ip_cache)} IP در کش")
+        return True
+    
+    @log_stage('daemon')
+    def run_daemon(self, tick_seconds: float = 30, reprobe_batch: int = 20,
+                   snapshot_path: str = ".state/daemon_snapshot.json.gz",
+                   snapshot_interval: float = 600, serve_port: Optional[int] = None) -> bool:
+        """اجرای دائمی: به‌روزرسانی منابع طبق زمان‌بندی خودشان، بررسی مداوم سلامت و انتشار تغییرات"""
+        self.load_snapshot(snapshot_path)
+        
+        stop_event = threading.Event()
+        
+        def handle_signal(signum, frame):
+            self.logger.log(f"⏹️ سیگنال {signum} دریافت شد - توقف تدریجی...", "WARNING")
+            stop_event.set()
+        
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+        
+        store = None
+        server = None
+        if serve_port:
+            from serve import ContentStore, create_server
+            store = ContentStore(os.path.dirname(self.config_path) or '.')
+            store.reload_if_changed()
+            server = create_server(store, port=serve_port)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.logger.log(f"🌐 سرور ساب‌اسکریپشن روی پورت {serve_port}")
+        
+        self.logger.log(f"🔁 حالت daemon شروع شد ({len(self.SOURCES)} منبع، هر {tick_seconds:.0f} ثانیه)")
+        last_snapshot = time.time()
+        
+        try:
+            while not stop_event.is_set():
+                # سیگنال توقف از طریق بودجه به دریافت و بررسی‌ها می‌رسد (توقف در حد یک دسته پروب)
+                self.budget = RunBudget(stop_event=stop_event)
+                self.reset_run_memo()
+                dirty = False
                 
-                if proxy.get('network') == 'ws':
-                    clash_proxy['network'] = 'ws'
-                    if 'ws-opts' in proxy:
-                        clash_proxy['ws-opts'] = proxy['ws-opts']
+                sources = self.due_sources()
+                if sources:
+                    self.logger.log(f"📥 به‌روزرسانی {len(sources)} منبع: {', '.join(s['name'] for s in sources)}")
+                    new_proxies = self.fetch_all_proxies(sources)
+                    for source in sources:
+                        self.source_refreshed[source['name']] = time.time()
+                    added, _ = self.add_new_proxies(new_proxies)
+                    dirty = dirty or added > 0
                 
-                if clash_proxy.get('tls', False):
-                    host = clash_proxy.get('ws-opts', {}).get('headers', {}).get('Host', '')
-                    clash_proxy['sni'] = host if host else proxy['server']
-            
-            elif proxy['type'] == 'ss':
-                if 'cipher' in proxy:
-                    clash_proxy['cipher'] = proxy['cipher']
-                if 'password' in proxy:
-                    clash_proxy['password'] = proxy['password']
-            
-            clash_proxies.append(clash_proxy)
-        
-        # ساختار کامل کلش
-        clash_config = {
-            'proxies': clash_proxies,
-            'proxy-groups': [
-                {
-                    'name': '🚀 Auto Select',
-                    'type': 'url-test',
-                    'proxies': [p['name'] for p in clash_proxies if p.get('is_active', True)],
-                    'url': 'http://www.gstatic.com/generate_204',
-                    'interval': 300
-                },
-                {
-                    'name': '🌍 Proxy',
-                    'type': 'select',
-                    'proxies': ['🚀 Auto Select', 'DIRECT']
-                }
-            ],
-            'rules': [
-                'DOMAIN-SUFFIX,google.com,🌍 Proxy',
-                'DOMAIN-SUFFIX,youtube.com,🌍 Proxy',
-                'DOMAIN-SUFFIX,telegram.org,🌍 Proxy',
-                'GEOIP,IR,DIRECT',
-                'MATCH,🌍 Proxy'
-            ],
-            'metadata': {
+                if stop_event.is_set():
+                    break
+                
+                changed = self.reprobe_proxies(reprobe_batch)
+                dirty = dirty or changed > 0
+                
+                if dirty:
+                    self.publish_outputs()
+                    if store and store.reload_if_changed():
+                        self.logger.log("🔄 خروجی‌های سرور جایگزین شدند")
+                
+                if time.time() - last_snapshot >= snapshot_interval:
+                    self.write_snapshot(snapshot_path)
+                    last_snapshot = time.time()
+                
+                stop_event.wait(tick_seconds)
+        finally:
+            self.publish_outputs()
+            self.write_snapshot(snapshot_path)
+            self.logger.log(f"💾 snapshot ذخیره شد: {snapshot_path}")
+            if server:
+                server.shutdown()
+                server.server_close()
+            self.logger.close()
+        
+        return True
+    
+    def run_fetch(self, source_names: Optional[List[str]] = None, budget_seconds: Optional[float] = None,
+                  target_active: Optional[int] = None) -> bool:
+        """فقط دریافت، بررسی و ادغام پروکسی‌ها (بدون رندر خروجی‌ها)"""
+        self.budget = RunBudget(budget_seconds, target_active)
+        self.reset_run_memo()
+        self.resume_checkpoint()
+        sources = self.SOURCES
+        if source_names:
+            sources = [s for s in self.SOURCES if s['name'] in source_names]
+            unknown = set(source_names) - {s['name'] for s in sources}
+            if unknown:
+                self.logger.log(f"⚠️ منابع ناشناخته: {', '.join(sorted(unknown))}", "WARNING")
+        if not sources:
+            self.logger.log("❌ هیچ منبعی برای دریافت انتخاب نشد", "ERROR")
+            return False
+        
+        new_proxies = self.fetch_all_proxies(sources)
+        added_count, duplicate_count = self.add_new_proxies(new_proxies)
+        self.logger.log(f"📥 {len(new_proxies)} پروکسی دریافت شد: {added_count} جدید، {duplicate_count} تکراری")
+        self.save_config()
+        return True
+    
+    def run_geo(self, hosts: List[str]) -> bool:
+        """نمایش کشور چند IP یا دامنه"""
+        for host in hosts:
+            ip = self.resolver.resolve(host)
+            if not ip:
+                print(f"{host}\t-\t(resolve نشد یا bogon است)")
+                continue
+            country = self.check_ip_country(ip)
+            print(f"{host}\t{ip}\t{country or '??'}")
+        return True
+    
+    def run_check(self, limit: Optional[int] = None) -> bool:
+        """بررسی دوباره سلامت پروکسی‌های موجود و ذخیره نتیجه"""
+        proxies = self.config.get('proxies', [])
+        limit = limit or len(proxies)
+        changed = self.reprobe_proxies(limit, active_interval=0, inactive_interval=0)
+        self.measure_throughput()
+        active = len([p for p in proxies if p.get('is_active')])
+        self.logger.log(f"🔍 {min(limit, len(proxies))} پروکسی بررسی شد: {changed} تغییر وضعیت، {active} فعال")
+        self.save_config()
+        return True
+    
+    def run_render(self) -> bool:
+        """رندر دوباره خروجی‌ها از config.yaml بدون دسترسی به شبکه"""
+        self.create_clash_config()
+        return bool(self.config.get('proxies'))
+    
+    def run_stats(self) -> bool:
+        """خلاصه وضعیت مخزن پروکسی و بازدهی منابع"""
+        proxies = self.config.get('proxies', [])
+        active = [p for p in proxies if p.get('is_active')]
+        print(f"📊 پروکسی‌ها: {len(proxies)} (فعال: {len(active)})")
+        
+        by_type = {}
+        for proxy in proxies:
+            counts = by_type.setdefault(proxy.get('type', '?'), [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if proxy.get('is_active') else 0
+        for ptype, (total, active_count) in sorted(by_type.items()):
+            print(f"   • {ptype}: {total} (فعال: {active_count})")
+        
+        pings = sorted(p['ping'] for p in active if p.get('ping'))
+        if pings:
+            print(f"   • پینگ میانه: {pings[len(pings) // 2]}ms (کمترین: {pings[0]}ms)")
+        
+        print(f"\n🌐 منابع ({len(self.SOURCES)}):")
+        print(f"   {'name':<28} {'runs':>5} {'alive':>7} {'yield/s':>8} {'fails':>6}")
+        for source in self.SOURCES:
+            name = source['name']
+            history = self.source_stats.history(name)
+            runs = self.source_stats.complete_runs(name)
+            alive = self.source_stats.ewma(runs, 'alive') if runs else 0.0
+            expected = self.source_stats.expected_yield(name)
+            yield_text = f"{expected:.3f}" if expected is not None else "-"
+            print(f"   {name:<28} {len(history.get('runs', [])):>5} {alive:>7.1f} "
+                  f"{yield_text:>8} {history.get('consecutive_failures', 0):>6}")
+        return True
+    
+    def shard_path(self, shard_dir: str = "output/shards") -> str:
+        """مسیر فایل نتیجه جزئی shard فعلی"""
+        index, count = self.shard
+        return os.path.join(shard_dir, f"shard_{index}_of_{count}.json")
+    
+    @log_stage('shard')
+    def run_shard(self, index: int, count: int, budget_seconds: Optional[float] = None,
+                  target_active: Optional[int] = None, shard_dir: str = "output/shards") -> bool:
+        """اجرای فقط یک shard از فضای کاندیدها و ذخیره نتیجه جزئی"""
+        self.shard = (index, count)
+        self.budget = RunBudget(budget_seconds, target_active)
+        self.reset_run_memo()
+        # هر shard checkpoint جداگانه خودش را دارد
+        self.checkpoint = Checkpoint(f"{self.checkpoint.state_dir}_shard_{index}_of_{count}",
+                                     self.checkpoint.max_age / 60)
+        self.resume_checkpoint()
+        
+        self.logger.log("=" * 80)
+        self.logger.log(f"🧩 اجرای shard {index + 1}/{count}")
+        self.logger.log("=" * 80)
+        
+        try:
+            proxies = self.fetch_all_proxies()
+            
+            partial = {
+                'shard': index,
+                'shards': count,
                 'generated': datetime.now().isoformat(),
-                'source': 'Iran Proxy Manager',
-                'total_proxies': len(clash_proxies),
-                'active_proxies': len([p for p in self.config.get('proxies', []) if p.get('is_active', False)])
+                'proxies': sorted(proxies, key=proxy_key),
+                'source_runs': self.source_stats.run_records,
             }
-        }
-        
-        os.makedirs(os.path.dirname(clash_path), exist_ok=True)
-        with open(clash_path, 'w', encoding='utf-8') as f:
-            yaml.dump(clash_config, f, 
-                     default_flow_style=False, 
-                     allow_unicode=True,
-                     indent=2)
+            
+            path = self.shard_path(shard_dir)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(partial, f, ensure_ascii=False, indent=2, sort_keys=True)
+            
+            self.logger.print_stats()
+            self.logger.log(f"✅ نتیجه shard ذخیره شد: {path} ({len(proxies)} پروکسی)")
+            return True
+        except Exception as e:
+            self.logger.log(f"❌ خطا در اجرای shard: {e}", "ERROR")
+            import traceback
+            self.logger.log(traceback.format_exc(), "ERROR")
+            return False
+    
+    def merge_candidate_rank(self, proxy: Dict[str, Any]) -> Tuple:
+        """رتبه قطعی برای حل تعارض: بررسی جدیدتر، فعال، پینگ کمتر، سپس نام منبع"""
+        ping = proxy.get('ping', 0) or 0
+        return (
+            str(proxy.get('last_checked', '')),
+            bool(proxy.get('is_active', False)),
+            -ping if ping > 0 else float('-inf'),
+            str(proxy.get('source_name', '')),
+        )
+    
+    @log_stage('merge')
+    def merge_partials(self, paths: List[str]) -> bool:
+        """ترکیب نتایج جزئی shardها در config.yaml و clash_config.yaml"""
+        self.logger.log("=" * 80)
+        self.logger.log(f"🔀 ترکیب {len(paths)} نتیجه جزئی")
+        self.logger.log("=" * 80)
         
-        self.logger.log(f"✅ کانفیگ کلش ایجاد شد: {clash_path}")
-        self.logger.log(f"   📊 {len(clash_proxies)} پروکسی در کانفیگ کلش")
+        try:
+            incoming = {}
+            shard_runs = []
+            for path in sorted(paths):
+                with open(path, 'r', encoding='utf-8') as f:
+                    partial = json.load(f)
+                shard_runs.append(partial.get('source_runs', {}))
+                self.logger.log(f"   📄 {path}: {len(partial.get('proxies', []))} پروکسی")
+                
+                for proxy in partial.get('proxies', []):
+                    key = proxy_key(proxy)
+                    current = incoming.get(key)
+                    if current is not None:
+                        self.logger.update_stat('duplicates_found')
+                    if current is None or self.merge_candidate_rank(proxy) > self.merge_candidate_rank(current):
+                        incoming[key] = proxy
+            
+            # به‌روزرسانی پروکسی‌های موجود با نتیجه بررسی جدیدتر
+            updated_count = 0
+            for proxy in self.config.get('proxies', []):
+                key = proxy_key(proxy)
+                newer = incoming.pop(key, None)
+                if newer and self.merge_candidate_rank(newer) > self.merge_candidate_rank(proxy):
+                    if self.refresh_proxy(proxy, newer):
+                        updated_count += 1
+            
+            added_count, _ = self.add_new_proxies([incoming[key] for key in sorted(incoming)])
+            self.logger.log(f"   ✅ {added_count} پروکسی جدید اضافه شد | {updated_count} پروکسی به‌روز شد")
+            
+            self.source_stats.merge_shard_runs(shard_runs)
+            self.source_stats.save()
+            
+            removed_count = self.remove_old_proxies_with_conditions()
+            if removed_count > 0:
+                self.logger.log(f"   🗑️ {removed_count} پروکسی قدیمی حذف شدند")
+            
+            self.apply_clash_fixes()
+            self.create_clash_config()
+            if not self.save_config():
+                return False
+            
+            self.logger.print_stats()
+            return True
+        except Exception as e:
+            self.logger.log(f"❌ خطا در ترکیب نتایج: {e}", "ERROR")
+            import traceback
+            self.logger.log(traceback.format_exc(), "ERROR")
+            return False
     
-    def run(self) -> bool:
-        """اجرای اصلی"""
+    def run(self, budget_seconds: Optional[float] = None, target_active: Optional[int] = None) -> bool:
+        """اجرای اصلی با بودجه زمانی و سهمیه پروکسی فعال اختیاری"""
+        self.budget = RunBudget(budget_seconds, target_active)
+        self.reset_run_memo()
+        self.resume_checkpoint()
+        
         self.logger.log("=" * 80)
         self.logger.log("🚀 شروع فرآیند به‌روزرسانی پروکسی‌های ایرانی")
         self.logger.log(f"🌐 تعداد منابع: {len(self.SOURCES)} منبع")
         self.logger.log("🔧 نسخه نهایی با اصلاحات کامل برای کلش اندروید")
+        if budget_seconds:
+            self.logger.log(f"⏱️ بودجه زمانی: {budget_seconds / 60:.1f} دقیقه")
+        if target_active:
+            self.logger.log(f"🎯 هدف: {target_active} پروکسی فعال تایید شده")
         self.logger.log("=" * 80)
         
         try:
@@ -1193,44 +2917,15 @@ class IranProxyManager:
             self.logger.log(f"\n📊 بررسی حداقل تعداد پروکسی...")
             self.ensure_minimum_proxies()
             
+            # آزمون سرعت اختیاری برای ترتیب خروجی‌ها و گروه پهنای باند بالا
+            if self.speed_test_url:
+                self.logger.log(f"\n⚡ آزمون سرعت دانلود...")
+                self.measure_throughput()
+            
             # 6. 🔥 اعمال اصلاحات نهایی برای کلش
             self.logger.log(f"\n🔧 اعمال اصلاحات نهایی برای کلش اندروید...")
             
-            fix_count = 0
-            for proxy in self.config.get('proxies', []):
-                # 🔥 اضافه کردن udp: true برای همه
-                if 'udp' not in proxy:
-                    proxy['udp'] = True
-                    fix_count += 1
-                
-                if proxy['type'] == 'vmess':
-                    # اصلاح alterId اگر 0 یا کمتر از 4 است
-                    current_alter = proxy.get('alterId', 0)
-                    if current_alter < 4:
-                        proxy['alterId'] = 4
-                        self.logger.log(f"   ⚡ alterId اصلاح شد: {proxy['server']}:{proxy['port']} → 4", "DEBUG")
-                        fix_count += 1
-                    
-                    # اصلاح TLS برای پورت 443
-                    if proxy['port'] == 443 and not proxy.get('tls', False):
-                        proxy['tls'] = True
-                        self.logger.log(f"   ⚡ TLS فعال شد برای {proxy['server']}:443", "DEBUG")
-                        fix_count += 1
-                    
-                    # اصلاح Host خالی در ws-opts
-                    if 'ws-opts' in proxy:
-                        headers = proxy['ws-opts'].get('headers', {})
-                        if headers.get('Host', '') == '':
-                            headers['Host'] = proxy['server']
-                            proxy['ws-opts']['headers'] = headers
-                            self.logger.log(f"   ⚡ Host اصلاح شد: {proxy['server']}:{proxy['port']}", "DEBUG")
-                            fix_count += 1
-                    
-                    # اضافه کردن sni برای TLS
-                    if proxy.get('tls', False) and 'sni' not in proxy:
-                        host = proxy.get('ws-opts', {}).get('headers', {}).get('Host', '')
-                        proxy['sni'] = host if host else proxy['server']
-                        fix_count += 1
+            fix_count = self.apply_clash_fixes()
             
             if fix_count > 0:
                 self.logger.log(f"   ✅ {fix_count} اصلاح برای کلش اندروید اعمال شد")
@@ -1261,6 +2956,11 @@ class IranProxyManager:
             self.logger.log(f"📈 تغییرات کل: {final_count - initial_count:+d} پروکسی")
             self.logger.log(f"📈 تغییرات فعال: {final_active - initial_active:+d} پروکسی")
             self.logger.log(f"🔧 اصلاحات اعمال شده: {fix_count}")
+            self.logger.log(f"⏱️ زمان اجرا: {(time.time() - self.budget.started) / 60:.1f} دقیقه")
+            self.logger.log(f"🎯 پروکسی‌های فعال تایید شده در این اجرا: {len(self.budget.verified_active)}")
+            if self.budget.stop_reason:
+                reason = "سهمیه پر شد" if self.budget.stop_reason == 'quota' else "نزدیک شدن به مهلت"
+                self.logger.log(f"⏹️ توقف زودهنگام: {reason}")
             
             # گزارش منابع
             successful_sources = len(self.SOURCES) - len(self.failed_sources)
@@ -1276,11 +2976,16 @@ class IranProxyManager:
             self.logger.log(f"\n📁 فایل‌های تولید شده:")
             self.logger.log(f"   • {self.config_path} - کانفیگ اصلی")
             self.logger.log(f"   • output/clash_config.yaml - کانفیگ کلش آماده")
+            self.logger.log(f"   • output/subscription.txt - ساب‌اسکریپشن base64")
+            self.logger.log(f"   • output/singbox.json - کانفیگ sing-box")
+            self.logger.log(f"   • output/links.txt - لینک‌های اشتراک")
+            self.logger.log(f"   • output/variants/index.json - فهرست نسخه‌های فیلتر شده")
+            self.logger.log(f"   • output/delta/manifest.json - شماره نسخه و فایل‌های تغییرات (delta)")
             self.logger.log(f"   • {self.logger.log_file} - فایل لاگ")
             self.logger.log("=" * 80)
             
             return True
-            
+        
         except KeyboardInterrupt:
             self.logger.log("\n\n⏹️ عملیات توسط کاربر متوقف شد", "WARNING")
             return False
@@ -1292,14 +2997,129 @@ class IranProxyManager:
 
 def main():
     """تابع اصلی"""
-    print("🔧 مدیر پروکسی‌های ایرانی - نسخه نهایی")
-    print("📅 " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-    print(f"🌐 {len(IranProxyManager().SOURCES)} منبع")
-    print("🔧 اصلاحات: udp:true, alterId≥4, TLS برای 443, Host پر")
-    print("⚡ تایم‌اوت: socket=15s, requests=35s")
+    parser = argparse.ArgumentParser(description="مدیر پروکسی‌های ایرانی")
+    parser.add_argument('--budget-minutes', type=float, default=None,
+                        help="بودجه زمانی کل اجرا (دقیقه)")
+    parser.add_argument('--target-active', type=int, default=None,
+                        help="توقف پس از یافتن این تعداد پروکسی فعال تایید شده")
+    parser.add_argument('--shard', default=None, metavar='I/N',
+                        help="فقط shard شماره I از N (شروع از 0) را پردازش کن و نتیجه جزئی بنویس")
+    parser.add_argument('--shard-dir', default="output/shards",
+                        help="پوشه فایل‌های نتیجه جزئی")
+    parser.add_argument('--probe-target', default="www.google.com:443",
+                        help="مقصد CONNECT در بررسی پروکسی‌های HTTP/SOCKS5 (host:port)")
+    parser.add_argument('--udp-target', default="8.8.8.8:53",
+                        help="سرور DNS یا echo برای رفت و برگشت آزمون UDP (host:port)")
+    parser.add_argument('--no-udp-check', action='store_true',
+                        help="بدون آزمون رله UDP (udp: false برای http/socks5/ss، true برای vmess/vless)")
+    parser.add_argument('--no-geo-hedge', action='store_true',
+                        help="پرسش ترتیبی سرویس‌های GeoIP به جای پرسش hedge شده")
+    parser.add_argument('--no-check-priority', action='store_true',
+                        help="بررسی کاندیدها به ترتیب متن منبع به جای ترتیب احتمال فعال بودن")
+    parser.add_argument('--geo-prefix-len', type=int, default=24,
+                        help="طول پیشوند برای استنتاج کشور از IPهای هم‌پیشوند (0 = غیرفعال)")
+    parser.add_argument('--geo-prefix-min', type=int, default=3,
+                        help="حداقل پاسخ هم‌نظر در پیشوند برای استنتاج")
+    parser.add_argument('--speed-test-url', default=None,
+                        help="آدرس http:// محتوای آزمون سرعت از طریق پروکسی‌های HTTP/SOCKS5 (پیش‌فرض: غیرفعال)")
+    parser.add_argument('--speed-test-kb', type=int, default=256, help="حجم دانلود هر آزمون سرعت (KB)")
+    parser.add_argument('--speed-concurrency', type=int, default=4, help="حداکثر آزمون سرعت هم‌زمان")
+    parser.add_argument('--speed-bandwidth-kbps', type=float, default=2048,
+                        help="سقف پهنای باند کل آزمون‌های سرعت (KB/s، 0 = بدون سقف)")
+    parser.add_argument('--speed-limit', type=int, default=50, help="حداکثر تعداد پروکسی در آزمون سرعت")
+    parser.add_argument('--checkpoint-dir', default=".state/checkpoint",
+                        help="پوشه checkpoint برای ادامه در تلاش بعدی (خارج از output/)")
+    parser.add_argument('--checkpoint-minutes', type=float, default=180,
+                        help="پنجره تازگی checkpoint (دقیقه، 0 = غیرفعال)")
+    subparsers = parser.add_subparsers(dest='command')
+    fetch_parser = subparsers.add_parser('fetch', help="فقط دریافت، بررسی و ادغام پروکسی‌ها")
+    fetch_parser.add_argument('--source', action='append', dest='sources', help="فقط این منبع (قابل تکرار)")
+    geo_parser = subparsers.add_parser('geo', help="نمایش کشور IP یا دامنه")
+    geo_parser.add_argument('hosts', nargs='+')
+    check_parser = subparsers.add_parser('check', help="بررسی دوباره سلامت پروکسی‌های موجود")
+    check_parser.add_argument('--limit', type=int, default=None, help="حداکثر تعداد (قدیمی‌ترین بررسی اول)")
+    subparsers.add_parser('render', help="رندر دوباره خروجی‌ها از config.yaml (بدون شبکه)")
+    subparsers.add_parser('stats', help="خلاصه وضعیت پروکسی‌ها و منابع")
+    merge_parser = subparsers.add_parser('merge', help="ترکیب نتایج جزئی shardها")
+    merge_parser.add_argument('partials', nargs='*', help="فایل‌های نتیجه جزئی (پیش‌فرض: همه فایل‌های shard-dir)")
+    daemon_parser = subparsers.add_parser('daemon', help="اجرای دائمی با کش‌های گرم")
+    daemon_parser.add_argument('--tick', type=float, default=30, help="فاصله چرخه‌ها (ثانیه)")
+    daemon_parser.add_argument('--reprobe-batch', type=int, default=20, help="تعداد بررسی دوباره سلامت در هر چرخه")
+    daemon_parser.add_argument('--snapshot', default=".state/daemon_snapshot.json.gz", help="مسیر snapshot")
+    daemon_parser.add_argument('--serve-port', type=int, default=None, help="سرو خروجی‌ها روی این پورت")
+    serve_parser = subparsers.add_parser('serve', help="سرور محلی ساب‌اسکریپشن")
+    serve_parser.add_argument('--dir', default="output", help="پوشه خروجی‌ها")
+    serve_parser.add_argument('--host', default="0.0.0.0")
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--interval', type=float, default=5.0, help="فاصله بررسی تغییر فایل‌ها (ثانیه)")
+    args = parser.parse_args()
+    
+    if args.command == 'serve':
+        from serve import serve
+        serve(args.dir, args.host, args.port, args.interval)
+        sys.exit(0)
     
+    shard = None
+    if args.shard:
+        try:
+            index, count = (int(part) for part in args.shard.split('/'))
+            if count < 1 or not 0 <= index < count:
+                raise ValueError
+        except ValueError:
+            parser.error("فرمت --shard باید I/N باشد (مثلا 0/4)")
+        shard = (index, count)
+    
+    # مدیر فقط یک بار ساخته می‌شود (بارگذاری کانفیگ، منابع و باز کردن لاگ)
     manager = IranProxyManager()
-    success = manager.run()
+    manager.checkpoint = Checkpoint(args.checkpoint_dir, args.checkpoint_minutes)
+    manager.geo_hedge = not args.no_geo_hedge
+    manager.check_priority = not args.no_check_priority
+    manager.udp_check = not args.no_udp_check
+    if not 0 <= args.geo_prefix_len <= 32:
+        parser.error("--geo-prefix-len باید بین 0 و 32 باشد")
+    manager.prefix_cache = PrefixCache(args.geo_prefix_len, args.geo_prefix_min)
+    manager.speed_test_url = args.speed_test_url
+    manager.speed_test_bytes = args.speed_test_kb * 1024
+    manager.speed_test_concurrency = args.speed_concurrency
+    manager.speed_test_bandwidth_kbps = args.speed_bandwidth_kbps
+    manager.speed_test_limit = args.speed_limit
+    try:
+        from probes import parse_target, parse_http_url
+        manager.probe_target = parse_target(args.probe_target)
+        manager.udp_target = parse_target(args.udp_target)
+        if args.speed_test_url:
+            parse_http_url(args.speed_test_url)
+    except ValueError as e:
+        parser.error(str(e))
+    budget_seconds = args.budget_minutes * 60 if args.budget_minutes else None
+    
+    if args.command is None:
+        print("🔧 مدیر پروکسی‌های ایرانی - نسخه نهایی")
+        print("📅 " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        print(f"🌐 {len(manager.SOURCES)} منبع")
+        print("🔧 اصلاحات: udp اندازه‌گیری شده, alterId≥4, TLS برای 443, Host پر")
+        print("⚡ تایم‌اوت: socket=15s, requests=35s")
+    
+    if args.command == 'fetch':
+        success = manager.run_fetch(args.sources, budget_seconds, args.target_active)
+    elif args.command == 'geo':
+        success = manager.run_geo(args.hosts)
+    elif args.command == 'check':
+        success = manager.run_check(args.limit)
+    elif args.command == 'render':
+        success = manager.run_render()
+    elif args.command == 'stats':
+        success = manager.run_stats()
+    elif args.command == 'daemon':
+        success = manager.run_daemon(args.tick, args.reprobe_batch, args.snapshot, serve_port=args.serve_port)
+    elif args.command == 'merge':
+        partials = args.partials or [os.path.join(args.shard_dir, name)
+                                     for name in os.listdir(args.shard_dir) if name.endswith('.json')]
+        success = manager.merge_partials(partials)
+    elif shard:
+        success = manager.run_shard(shard[0], shard[1], budget_seconds, args.target_active, args.shard_dir)
+    else:
+        success = manager.run(budget_seconds, args.target_active)
     
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,6 @@
+"""تنظیمات مشترک تست‌ها: ماژول‌های scripts/ مثل اجرای مستقیم اسکریپت‌ها import می‌شوند"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
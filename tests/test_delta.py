@@ -0,0 +1,109 @@
+"""فایل‌های delta نسخه‌دار کنار کانفیگ کامل کلش"""
+
+import json
+import os
+import random
+
+from render import DELTA_DIR, build_delta, delta_keys, deltas_since, write_delta
+
+
+def proxy(index, **fields):
+    record = {'name': f"5.1.2.{index}:443 ({100 + index}ms)", 'type': 'vmess', 'server': f"5.1.2.{index}",
+              'port': 443, 'uuid': f"uuid-{index}", 'cipher': 'auto', 'udp': True}
+    record.update(fields)
+    return record
+
+
+def publish(output_dir, proxies, full_bytes=100000):
+    """انتشار یک نسخه؛ فایل کامل بزرگ فرض می‌شود تا deltaها ارزان‌تر باشند"""
+    delta = build_delta(proxies, str(output_dir))
+    full_path = os.path.join(str(output_dir), 'clash_config.yaml')
+    with open(full_path, 'w', encoding='utf-8') as f:
+        f.write('#' * full_bytes)
+    write_delta(delta, str(output_dir), full_path, 'digest')
+    return delta
+
+
+def read_manifest(output_dir):
+    with open(os.path.join(str(output_dir), DELTA_DIR, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def delta_files(output_dir):
+    return sorted(name for name in os.listdir(os.path.join(str(output_dir), DELTA_DIR)) if name.startswith('r'))
+
+
+def test_keys_do_not_depend_on_order():
+    """کلیدها (حتی برای پروکسی‌های با کلید پایه یکسان) به ترتیب فهرست بستگی ندارند"""
+    proxies = [proxy(i) for i in range(6)] + [proxy(2, name='copy', network='ws')]
+    shuffled = list(reversed(proxies))
+    assert delta_keys(proxies) == delta_keys(shuffled)
+    assert len(delta_keys(proxies)) == 7
+    # نام (که پینگ را دارد) جزو کلید نیست
+    assert set(delta_keys([proxy(1, name='other')])) == set(delta_keys([proxy(1)]))
+
+
+def test_client_reaches_current_state_by_applying_deltas(tmp_path):
+    """کلاینت با اعمال deltaها به همان نگاشت کلید ← پروکسی نسخه فعلی می‌رسد"""
+    rng = random.Random(3)
+    current = [proxy(i) for i in range(12)]
+    publish(tmp_path, current)
+    client, client_revision = delta_keys(current), read_manifest(tmp_path)['revision']
+    
+    for step in range(4):
+        current = [p for p in current if rng.random() > 0.25] + [proxy(100 + step)]
+        current[0] = dict(current[0], cipher='aes-128-gcm')
+        rng.shuffle(current)
+        publish(tmp_path, current)
+    
+    manifest = read_manifest(tmp_path)
+    assert manifest['revision'] == client_revision + 4
+    for path in deltas_since(manifest, client_revision):
+        with open(os.path.join(str(tmp_path), path), encoding='utf-8') as f:
+            delta = json.load(f)
+        for key in delta['removed']:
+            del client[key]
+        client.update(delta['added'])
+        client.update(delta['changed'])
+    assert client == delta_keys(current)
+
+
+def test_unchanged_proxies_keep_revision(tmp_path):
+    """بدون تغییر پروکسی‌ها نسخه بالا نمی‌رود و delta جدیدی نوشته نمی‌شود"""
+    proxies = [proxy(i) for i in range(3)]
+    publish(tmp_path, proxies)
+    publish(tmp_path, proxies + [proxy(9)])
+    files = delta_files(tmp_path)
+    delta = publish(tmp_path, list(reversed(proxies + [proxy(9)])))
+    assert not delta['changed_any']
+    assert delta_files(tmp_path) == files
+
+
+def test_deltas_since_falls_back_to_full_file(tmp_path):
+    """نسخه خیلی قدیمی، نسخه ناشناخته یا deltaهای بزرگ‌تر از فایل کامل یعنی دریافت فایل کامل"""
+    for count in range(1, 4):
+        publish(tmp_path, [proxy(i) for i in range(count)])
+    manifest = read_manifest(tmp_path)
+    assert deltas_since(manifest, 3) == []
+    assert deltas_since(manifest, 1) == [f"{DELTA_DIR}/r000002.json", f"{DELTA_DIR}/r000003.json"]
+    assert deltas_since(manifest, 7) is None
+    manifest['full']['bytes'] = 10
+    assert deltas_since(manifest, 1) is None
+
+
+def test_stale_delta_files_are_pruned(tmp_path):
+    """فایل‌های delta که manifest به آن‌ها اشاره نمی‌کند پس از بازنشانی وضعیت یا manifest حذف می‌شوند"""
+    for count in range(1, 4):
+        publish(tmp_path, [proxy(i) for i in range(count)])
+    assert delta_files(tmp_path) == ['r000002.json', 'r000003.json']
+    
+    os.remove(os.path.join(str(tmp_path), DELTA_DIR, 'state.json'))
+    publish(tmp_path, [proxy(i) for i in range(2)])
+    assert delta_files(tmp_path) == []
+    
+    os.remove(os.path.join(str(tmp_path), DELTA_DIR, 'manifest.json'))
+    with open(os.path.join(str(tmp_path), DELTA_DIR, 'r000042.json'), 'w', encoding='utf-8') as f:
+        f.write('{}')
+    publish(tmp_path, [proxy(i) for i in range(2)])
+    assert delta_files(tmp_path) == []
+    assert read_manifest(tmp_path)['deltas'] == []
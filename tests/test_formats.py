@@ -0,0 +1,119 @@
+"""تشخیص فرمت کل محتوای منبع، تبدیل رکوردهای sing-box/کلش و پیمایش بایتی لیست‌های ip:port"""
+
+import base64
+import json
+
+import pytest
+
+from formats import (FORMAT_BASE64, FORMAT_CLASH, FORMAT_PLAIN, FORMAT_SINGBOX, decode_body, scan_ip_ports,
+                     sniff_format, structured_proxies)
+from update import PrefixCache, ipv4_to_int, is_bogon_int
+
+LINKS = "vmess://eyJhZGQiOiI1LjEuMi4zIn0=\nss://YWVzLTI1Ni1nY206cGFzcw@5.1.2.4:8388#x\n"
+CLASH = "proxies:\n  - {name: a, type: ss, server: 5.1.2.5, port: 8388, cipher: aes-256-gcm, password: p}\n"
+SINGBOX = {'outbounds': [
+    {'type': 'vmess', 'server': '5.1.2.6', 'server_port': 443, 'uuid': 'u-1',
+     'tls': {'enabled': True, 'server_name': 'cdn.example'}, 'transport': {'type': 'ws', 'path': '/ws'}},
+    {'type': 'direct', 'tag': 'direct'},
+]}
+
+
+@pytest.mark.parametrize('text, expected', [
+    (json.dumps(SINGBOX), FORMAT_SINGBOX),
+    (json.dumps(SINGBOX['outbounds']), FORMAT_SINGBOX),
+    (CLASH, FORMAT_CLASH),
+    (base64.b64encode(LINKS.encode()).decode(), FORMAT_BASE64),
+    (base64.urlsafe_b64encode(LINKS.encode()).decode().rstrip('='), FORMAT_BASE64),
+    ("5.1.2.3:8080\n5.1.2.4:3128\n", FORMAT_PLAIN),
+    (LINKS, FORMAT_PLAIN),
+    ("{not json", FORMAT_PLAIN),
+    # متن base64-مانند که رمزگشایی‌اش لینک نیست ساب‌اسکریپشن حساب نمی‌شود
+    ("abcdefghijklmnopqrstuvwxyz012345", FORMAT_PLAIN),
+])
+def test_sniff_format(text, expected):
+    """هر فرمت فقط با نگاه به کل محتوا تشخیص داده می‌شود"""
+    assert sniff_format(text)[0] == expected
+
+
+def test_decode_body_returns_lines_for_subscriptions():
+    """ساب‌اسکریپشن base64 یک بار رمزگشایی و به خطوط تبدیل می‌شود"""
+    fmt, lines = decode_body(base64.b64encode(LINKS.encode()).decode())
+    assert fmt == FORMAT_BASE64
+    assert lines == LINKS.splitlines()
+
+
+def test_decode_body_unwraps_base64_structured_config():
+    """کانفیگ کلش داخل base64 مستقیم به رکوردهای کلش تبدیل می‌شود"""
+    fmt, records = decode_body(base64.b64encode(CLASH.encode()).decode())
+    assert fmt == FORMAT_CLASH
+    assert records[0]['server'] == '5.1.2.5'
+
+
+def test_structured_proxies_from_singbox():
+    """outboundهای پشتیبانی نشده رد و بقیه به فرمت کانفیگ تبدیل می‌شوند"""
+    fmt, records = decode_body(json.dumps(SINGBOX))
+    proxies = structured_proxies(fmt, records)
+    assert proxies == [{
+        'name': '5.1.2.6:443', 'type': 'vmess', 'server': '5.1.2.6', 'port': 443, 'uuid': 'u-1', 'tls': True,
+        'sni': 'cdn.example', 'network': 'ws', 'ws-opts': {'path': '/ws', 'headers': {'Host': '5.1.2.6'}},
+        'alterId': 4, 'cipher': 'auto',
+    }]
+
+
+def test_structured_proxies_from_clash_skips_incomplete():
+    """پروکسی کلش بدون رمز یا با پورت نامعتبر رد می‌شود"""
+    records = [
+        {'type': 'ss', 'server': '5.1.2.5', 'port': 8388, 'cipher': 'aes-256-gcm', 'password': 'p'},
+        {'type': 'ss', 'server': '5.1.2.7', 'port': 8388, 'cipher': 'aes-256-gcm'},
+        {'type': 'http', 'server': '5.1.2.8', 'port': 'x'},
+        {'type': 'trojan', 'server': '5.1.2.9', 'port': 443},
+    ]
+    proxies = structured_proxies(FORMAT_CLASH, records)
+    assert [p['server'] for p in proxies] == ['5.1.2.5']
+    assert proxies[0]['cipher'] == 'aes-256-gcm'
+
+
+def test_scan_ip_ports_counts_and_filters():
+    """خطوط نامعتبر، تکراری و خالی جدا شمرده می‌شوند و فیلد سوم در extra ثبت می‌شود"""
+    data = (b"5.1.2.3:8080\r\n"
+            b"  5.1.2.4 : 1080 :socks\n"
+            b"\n"
+            b"5.1.2.3:8080\n"
+            b"300.1.2.3:80\n"
+            b"05.1.2.3:80\n"
+            b"5.1.2.5:70000\n"
+            b"not a proxy\n"
+            b"5.1.2.6:3128")
+    batch = scan_ip_ports(data)
+    assert batch.lines == 9
+    assert len(batch) == 3
+    assert batch.duplicates == 1
+    assert batch.rejected == 4
+    assert list(batch.extra) == [0, 1, 0]
+    assert [(c['server'], c['port'], c['type']) for c in batch.to_candidates('mixed')] == [
+        ('5.1.2.3', 8080, 'http'), ('5.1.2.4', 1080, 'socks5'), ('5.1.2.6', 3128, 'http')]
+
+
+def test_ip_port_batch_drop_keeps_columns_aligned():
+    """حذف دسته‌ای روی آرایه‌ها ستون‌های IP، پورت و extra را هم‌تراز نگه می‌دارد"""
+    batch = scan_ip_ports(b"10.0.0.1:80\n5.1.2.3:81\n192.168.1.1:82:x\n5.1.2.4:83:x\n")
+    assert batch.drop(is_bogon_int) == 2
+    assert [(c['server'], c['port'], c['type']) for c in batch.to_candidates('mixed')] == [
+        ('5.1.2.3', 81, 'http'), ('5.1.2.4', 83, 'socks5')]
+
+
+def test_claim_foreign_drops_confident_foreign_prefix_with_spot_checks():
+    """IPهای پیشوند با اطمینان خارجی حذف می‌شوند ولی هر دهمین IP برای بررسی نمونه‌ای می‌ماند"""
+    cache = PrefixCache(min_agree=3, spot_check_every=10)
+    for last in range(1, 4):
+        cache.observe(ipv4_to_int(f"8.8.8.{last}"), 'US')
+        cache.observe(ipv4_to_int(f"5.1.2.{last}"), 'IR')
+    
+    data = "".join(f"8.8.8.{last}:80\n" for last in range(10, 40)) + "5.1.2.50:80\n9.9.9.9:80\n"
+    batch = scan_ip_ports(data.encode())
+    assert batch.drop(cache.claim_foreign) == 27
+    kept = [c['server'] for c in batch.to_candidates('http')]
+    assert kept == ['8.8.8.19', '8.8.8.29', '8.8.8.39', '5.1.2.50', '9.9.9.9']
+    
+    # IP نگه داشته شده در lookup بعدی به سرویس واقعی فرستاده می‌شود
+    assert cache.lookup(ipv4_to_int('8.8.8.19')) == ('US', 0.75, True)
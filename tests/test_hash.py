@@ -0,0 +1,89 @@
+"""هش محتوای config.yaml و رد کردن نوشتن خروجی بدون تغییر"""
+
+import contextlib
+import io
+import time
+
+import pytest
+
+import update
+from render import write_if_changed
+
+
+def proxy(**fields):
+    record = {
+        'name': '5.1.2.3:8080 (120ms)', 'type': 'http', 'server': '5.1.2.3', 'port': 8080,
+        'added_date': '2026-10-01', 'last_checked': '2026-10-19', 'is_active': True, 'country': 'IR',
+        'ping': 120, 'health': {'uptime': 0.83, 'latency': 130.0, 'checks': 7, 'updated': '2026-10-19 10:00:00'},
+    }
+    record.update(fields)
+    return record
+
+
+def test_hash_view_ignores_measurement_noise():
+    """زمان‌های پروب، سرعت، زمان دقیق سلامت و نوسان کوچک پینگ هش را عوض نمی‌کنند"""
+    base = update.hash_view(proxy())
+    noisy = update.hash_view(proxy(
+        name='5.1.2.3:8080 (95ms)', ping=95, probe={'connect_ms': 40}, udp_ping=30, speed_kbps=900,
+        health={'uptime': 0.84, 'latency': 99.0, 'checks': 8, 'updated': '2026-10-19 16:30:00'}))
+    assert noisy == base
+
+
+@pytest.mark.parametrize('fields', [
+    {'is_active': False},
+    {'ping': 480},
+    {'last_checked': '2026-10-20'},
+    {'health': {'uptime': 0.5, 'checks': 8, 'updated': '2026-10-19 16:30:00'}},
+    {'name': 'renamed'},
+])
+def test_hash_view_keeps_real_changes(fields):
+    """تغییر وضعیت، پینگ واقعا متفاوت، روز بررسی، دسترس‌پذیری و نام هش را عوض می‌کنند"""
+    assert update.hash_view(proxy(**fields)) != update.hash_view(proxy())
+
+
+def test_write_if_changed_skips_same_payload(tmp_path):
+    """فایل با payload یکسان دوباره نوشته نمی‌شود حتی اگر متادیتای رندر فرق کند"""
+    path = str(tmp_path / 'out.yaml')
+    assert write_if_changed(path, {'proxies': [1]}, lambda digest: "generated: 1\n")
+    assert not write_if_changed(path, {'proxies': [1]}, lambda digest: "generated: 2\n")
+    assert write_if_changed(path, {'proxies': [2]}, lambda digest: "generated: 3\n")
+    with open(path, encoding='utf-8') as f:
+        assert f.read().endswith("generated: 3\n")
+
+
+def source(name):
+    return {'name': name, 'url': f"https://example.invalid/{name}", 'type': 'http', 'timeout': 35, 'retries': 1,
+            'skip_after_failures': 3, 'sample_rate': 0.25, 'refresh_minutes': 120, 'emergency': False,
+            'enabled': True, 'mirrors': [], 'auto_mirrors': False}
+
+
+def run_once(monkeypatch, sources, ping_offset):
+    """یک اجرای کامل با شبکه stub شده (همه IPها ایرانی، سلامت قطعی بر اساس IP)"""
+    # کمتر از حداقل ۵۰ پروکسی تا حذف پروکسی‌های قدیمی مخزن را تغییر ندهد
+    body = "\n".join(f"5.1.{i // 200}.{i % 200 + 1}:{8000 + i}" for i in range(40))
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = update.IranProxyManager()
+    manager.SOURCES = sources
+    manager.checkpoint.max_age = 0
+    manager.udp_check = False
+    manager.download_source = lambda src, raw=False: body.encode('utf-8') if raw else body
+    manager.ip_is_ir = lambda ip: True
+    manager.alive_many = lambda items, timeout=15, max_age=None: \
+        [(port % 4 != 0, 150 + port % 7 + ping_offset) for _, port, _, _ in items]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert manager.run()
+    with open(manager.config_path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_second_identical_run_keeps_config(tmp_path, monkeypatch):
+    """اجرای دوم با نتایج یکسان (ترتیب منابع دیگر، پینگ کمی متفاوت) config.yaml را بازنویسی نمی‌کند"""
+    monkeypatch.chdir(tmp_path)
+    real_sleep = time.sleep
+    monkeypatch.setattr(update.time, 'sleep', lambda seconds: None)
+    
+    first = run_once(monkeypatch, [source('a'), source('b')], 0)
+    # بررسی بعدی باید زمان سلامت جدیدتری داشته باشد تا روی رکورد موجود اعمال شود
+    real_sleep(1.1)
+    second = run_once(monkeypatch, [source('b'), source('a')], 9)
+    assert second == first
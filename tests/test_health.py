@@ -0,0 +1,72 @@
+"""امتیاز سلامت بر اساس تاریخچه بررسی‌ها و انتخاب k بهترین/بدترین"""
+
+from datetime import datetime, timedelta
+
+from health import (DEAD_SCORE, UPTIME_PRIOR, bottom_k, health_score, rank_proxies, seed_health, stable_health,
+                    top_k, update_health)
+
+NOW = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def checked(name, results, ping=100, hours_ago=0, **fields):
+    """پروکسی با دنباله نتایج بررسی (True = فعال) که آخرینش hours_ago ساعت پیش بوده است"""
+    proxy = {'name': name, **fields}
+    start = NOW - timedelta(hours=hours_ago + len(results))
+    for i, alive in enumerate(results, 1):
+        update_health(proxy, alive, ping, start + timedelta(hours=i))
+    return proxy
+
+
+def test_update_health_ewma():
+    """دسترس‌پذیری و تاخیر با EWMA به‌روز می‌شوند و تاخیر بررسی ناموفق اثری ندارد"""
+    proxy = {}
+    update_health(proxy, True, 200, NOW)
+    update_health(proxy, False, 0, NOW)
+    health = update_health(proxy, True, 100, NOW)
+    assert health == {'uptime': 0.79, 'latency': 170.0, 'checks': 3, 'updated': '2026-10-19 12:00:00'}
+
+
+def test_seed_health_from_legacy_record():
+    """رکورد قدیمی بدون health یک بررسی بر اساس is_active حساب می‌شود"""
+    assert seed_health({'is_active': True, 'ping': 300, 'last_checked': '2026-10-18'}) == {
+        'uptime': 1.0, 'latency': 300.0, 'checks': 1, 'updated': '2026-10-18'}
+
+
+def test_score_prefers_long_reliable_history():
+    """تاریخچه طولانی سالم از تاریخچه کوتاه و پروکسی ناپایدار بهتر است"""
+    steady = checked('steady', [True] * 10)
+    new = checked('new', [True])
+    flaky = checked('flaky', [True, False] * 5)
+    dead = checked('dead', [False] * 6)
+    scores = [health_score(p, NOW) for p in [steady, new, flaky, dead]]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[-1] < DEAD_SCORE
+
+
+def test_old_history_decays_to_prior():
+    """تاریخچه خیلی قدیمی به امتیاز پیش‌فرض برمی‌گردد"""
+    stale = checked('stale', [True] * 10, ping=0, hours_ago=24 * 30)
+    assert abs(health_score(stale, NOW) - UPTIME_PRIOR) < 0.01
+
+
+def test_top_and_bottom_k_match_full_sort():
+    """top_k و bottom_k همان نتیجه مرتب‌سازی کامل را می‌دهند"""
+    proxies = [checked(f"p{i}", [i % 3 != 0, i % 2 == 0, True], ping=50 + 37 * i) for i in range(20)]
+    ranked = sorted(proxies, key=lambda p: health_score(p, NOW), reverse=True)
+    assert top_k(proxies, 5, NOW) == ranked[:5]
+    assert bottom_k(proxies, 5, NOW) == sorted(proxies, key=lambda p: health_score(p, NOW))[:5]
+    assert top_k(proxies, 50, NOW) == ranked
+
+
+def test_rank_proxies_uses_measured_speed():
+    """با سلامت یکسان پروکسی سریع‌تر جلوتر است"""
+    slow = checked('slow', [True] * 3, speed_kbps=50)
+    fast = checked('fast', [True] * 3, speed_kbps=2000)
+    unmeasured = checked('unmeasured', [True] * 3)
+    assert [p['name'] for p in rank_proxies([slow, unmeasured, fast], NOW)] == ['fast', 'unmeasured', 'slow']
+
+
+def test_stable_health_is_day_granular():
+    """نمای هش فقط دسترس‌پذیری گرد شده و روز را نگه می‌دارد"""
+    assert stable_health({'uptime': 0.8312, 'latency': 140.2, 'checks': 9, 'updated': '2026-10-19 08:15:00'}) == {
+        'uptime': 0.8, 'updated': '2026-10-19'}
@@ -0,0 +1,81 @@
+"""استنتاج کشور از پاسخ‌های هم‌پیشوند (PrefixCache) و استفاده از آن در check_ip_country"""
+
+import contextlib
+import io
+
+import update
+from update import PrefixCache, ipv4_to_int
+
+
+def ip(text):
+    return ipv4_to_int(text)
+
+
+def test_infers_after_min_agreeing_answers():
+    """پس از min_agree پاسخ یکسان، IP دیگر همان /24 با اطمینان استنتاج می‌شود"""
+    cache = PrefixCache(min_agree=3, spot_check_every=0)
+    for last in range(1, 3):
+        cache.observe(ip(f"5.1.2.{last}"), 'IR')
+    assert cache.lookup(ip("5.1.2.200")) is None
+    
+    cache.observe(ip("5.1.2.3"), 'IR')
+    assert cache.lookup(ip("5.1.2.200")) == ('IR', 0.75, False)
+    # پیشوند دیگر استنتاج نمی‌شود
+    assert cache.lookup(ip("5.1.3.1")) is None
+
+
+def test_disagreement_marks_prefix_mixed():
+    """پاسخ متفاوت پیشوند را مختلط و استنتاج را برای همیشه متوقف می‌کند"""
+    cache = PrefixCache(min_agree=2, spot_check_every=0)
+    cache.observe(ip("5.1.2.1"), 'IR')
+    cache.observe(ip("5.1.2.2"), 'IR')
+    assert cache.observe(ip("5.1.2.3"), 'DE') is True
+    assert cache.observe(ip("5.1.2.4"), 'IR') is False
+    assert cache.lookup(ip("5.1.2.9")) is None
+
+
+def test_spot_check_every_nth_inferred_answer():
+    """هر spot_check_every پاسخ استنتاجی یک بار به سرویس واقعی فرستاده می‌شود"""
+    cache = PrefixCache(min_agree=1, spot_check_every=4)
+    cache.observe(ip("5.1.2.1"), 'IR')
+    flags = [cache.lookup(ip(f"5.1.2.{10 + i}"))[2] for i in range(8)]
+    assert flags == [False, False, False, True, False, False, False, True]
+
+
+def test_export_load_round_trip():
+    """وضعیت snapshot فقط با طول پیشوند یکسان بارگذاری می‌شود"""
+    cache = PrefixCache(min_agree=1, spot_check_every=0)
+    cache.observe(ip("5.1.2.1"), 'IR')
+    cache.observe(ip("6.1.2.1"), 'IR')
+    cache.observe(ip("6.1.2.2"), 'US')
+    
+    restored = PrefixCache(min_agree=1, spot_check_every=0)
+    restored.load(cache.export())
+    assert restored.lookup(ip("5.1.2.50"))[0] == 'IR'
+    assert restored.lookup(ip("6.1.2.50")) is None
+    
+    other = PrefixCache(prefix_len=16, min_agree=1)
+    other.load(cache.export())
+    assert other.lookup(ip("5.1.2.50")) is None
+
+
+def test_check_ip_country_uses_prefix_inference(tmp_path, monkeypatch):
+    """check_ip_country پس از پاسخ‌های هم‌پیشوند بدون پرسش از سرویس جواب می‌دهد و اطمینان را ثبت می‌کند"""
+    monkeypatch.chdir(tmp_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = update.IranProxyManager()
+    manager.geo_hedge = False
+    manager.prefix_cache = PrefixCache(min_agree=3, spot_check_every=0)
+    asked = []
+    
+    def service(svc, address, *args, **kwargs):
+        asked.append(address)
+        return 'IR'
+    
+    manager.check_ip_service = service
+    with contextlib.redirect_stdout(io.StringIO()):
+        answers = [manager.check_ip_country(f"5.1.2.{last}") for last in range(1, 7)]
+    assert answers == ['IR'] * 6
+    assert asked == ["5.1.2.1", "5.1.2.2", "5.1.2.3"]
+    assert manager.geo_inferred["5.1.2.4"] == 0.75
+    assert manager.logger.stats['geo_prefix_hits'] == 3
@@ -0,0 +1,50 @@
+"""ترتیب بررسی کاندیدها بر اساس احتمال تخمینی فعال بودن"""
+
+import pytest
+
+from priority import BASE_RATE, AliveEstimator, logit, priority_order, smoothed
+
+
+def candidate(server, port=8080, ptype='http'):
+    return {'server': server, 'port': port, 'type': ptype}
+
+
+def test_smoothed_and_logit():
+    """نرخ بدون مشاهده همان prior است و logit در مرزها محدود می‌ماند"""
+    assert smoothed(0, 0) == BASE_RATE
+    assert smoothed(10, 10) > smoothed(1, 1) > BASE_RATE
+    assert logit(0.5) == 0
+    assert logit(0) == pytest.approx(-logit(1))
+
+
+def test_estimator_without_information_uses_base_rate():
+    """کاندید بدون هیچ ویژگی شناخته شده احتمال پایه را می‌گیرد"""
+    estimator = AliveEstimator([])
+    assert estimator.probability(candidate('example.com', port=12345, ptype='unknown')) == pytest.approx(BASE_RATE)
+
+
+def test_history_of_server_and_prefix_raise_probability():
+    """سرور و پیشوند /24 با تاریخچه سالم احتمال را بالا و تاریخچه مرده آن را پایین می‌برند"""
+    pool = [{'server': f"5.1.2.{i}", 'type': 'http', 'is_active': True, 'health': {'uptime': 0.9}} for i in range(5)]
+    pool += [{'server': f"6.1.2.{i}", 'type': 'http', 'is_active': False, 'health': {'uptime': 0.0}} for i in range(5)]
+    estimator = AliveEstimator(pool)
+    
+    known_good = estimator.probability(candidate('5.1.2.1', port=12345))
+    same_prefix = estimator.probability(candidate('5.1.2.99', port=12345))
+    unknown = estimator.probability(candidate('7.1.2.1', port=12345))
+    bad_prefix = estimator.probability(candidate('6.1.2.99', port=12345))
+    assert known_good > same_prefix > unknown > bad_prefix
+    
+    # نام دامنه با IP حل‌شده‌اش تخمین زده می‌شود
+    assert estimator.probability(candidate('host.example', port=12345), ip='5.1.2.99') == same_prefix
+
+
+def test_priority_order_is_descending_and_stable():
+    """صف اولویت احتمال نزولی می‌دهد و ترتیب منبع را برای احتمال‌های برابر حفظ می‌کند"""
+    estimator = AliveEstimator([])
+    candidates = [candidate('5.1.2.1', port=1), candidate('5.1.2.2', port=8080), candidate('5.1.2.3', port=2),
+                  candidate('5.1.2.4', port=3128), candidate('5.1.2.5', port=3)]
+    order = list(priority_order(candidates, estimator, source_rate=0.4))
+    probabilities = [p for p, _ in order]
+    assert probabilities == sorted(probabilities, reverse=True)
+    assert [c['server'] for _, c in order] == ['5.1.2.2', '5.1.2.4', '5.1.2.1', '5.1.2.3', '5.1.2.5']
@@ -0,0 +1,106 @@
+"""سرور محلی ساب‌اسکریپشن: مذاکره کدگذاری، Range، ETag و بارگذاری دوباره"""
+
+import gzip
+import http.client
+import threading
+
+import pytest
+
+import serve
+from serve import ContentEntry, ContentStore, choose_encoding, create_server, parse_range
+
+
+@pytest.mark.parametrize('header, length, expected', [
+    ('bytes=0-9', 100, (0, 9)),
+    ('bytes=90-', 100, (90, 99)),
+    ('bytes=-10', 100, (90, 99)),
+    ('bytes=-500', 100, (0, 99)),
+    ('bytes=50-500', 100, (50, 99)),
+    ('bytes=100-', 100, None),
+    ('bytes=9-3', 100, None),
+    ('bytes=-0', 100, None),
+    ('bytes=0-1,5-6', 100, None),
+    ('items=0-1', 100, None),
+    ('bytes=a-b', 100, None),
+])
+def test_parse_range(header, length, expected):
+    """فقط یک بازه bytes پشتیبانی می‌شود و انتهای بازه به طول محتوا محدود می‌شود"""
+    assert parse_range(header, length) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', 'identity'),
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0, identity', 'identity'),
+    ('*', 'br' if serve.HAS_BROTLI else 'gzip'),
+    ('br;q=0, *;q=0.5', 'gzip'),
+    ('deflate', 'identity'),
+])
+def test_choose_encoding(header, expected):
+    """br بر gzip ترجیح دارد و q=0 یعنی رد کدگذاری"""
+    entry = ContentEntry('clash_config.yaml', b'proxies: []\n' * 50, 0)
+    assert choose_encoding(entry, header) == expected
+
+
+def test_store_skips_excluded_dirs_and_reloads_on_change(tmp_path):
+    """logs و shards سرو نمی‌شوند و بارگذاری دوباره فقط با تغییر فایل‌ها انجام می‌شود"""
+    for rel in ['clash_config.yaml', 'variants/fast.txt', 'logs/run.jsonl', 'shards/shard_0_of_2.json', '.tmp_x.yaml']:
+        path = tmp_path / rel
+        path.parent.mkdir(exist_ok=True)
+        path.write_text('x')
+    
+    store = ContentStore(str(tmp_path))
+    assert store.reload_if_changed()
+    assert sorted(store.entries) == ['clash_config.yaml', 'variants/fast.txt']
+    assert not store.reload_if_changed()
+    
+    (tmp_path / 'variants' / 'fast.txt').unlink()
+    assert store.reload_if_changed()
+    assert sorted(store.entries) == ['clash_config.yaml']
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'clash_config.yaml').write_bytes(b'proxies: []\n' * 100)
+    store = ContentStore(str(tmp_path))
+    store.reload_if_changed()
+    httpd = create_server(store, host='127.0.0.1', port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(port, path='/', headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+def test_gzip_etag_and_not_modified(server):
+    """پاسخ gzip شده ETag خودش را دارد و If-None-Match با هر ETag فایل 304 می‌دهد"""
+    response, body = request(server, headers={'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(body) == b'proxies: []\n' * 100
+    
+    response, body = request(server, headers={'If-None-Match': response.getheader('ETag')})
+    assert response.status == 304
+    assert body == b''
+
+
+def test_range_uses_identity_representation(server):
+    """Range روی محتوای فشرده نشده اعمال می‌شود و بازه نامعتبر 416 می‌دهد"""
+    response, body = request(server, '/clash_config.yaml', {'Range': 'bytes=0-11', 'Accept-Encoding': 'gzip'})
+    assert response.status == 206
+    assert response.getheader('Content-Encoding') is None
+    assert response.getheader('Content-Range') == 'bytes 0-11/1200'
+    assert body == b'proxies: []\n'
+    
+    response, _ = request(server, '/clash_config.yaml', {'Range': 'bytes=5000-'})
+    assert response.status == 416
+    assert request(server, '/missing.yaml')[0].status == 404
@@ -0,0 +1,31 @@
+"""نسخه‌های فیلتر شده خروجی و فایل فهرست آن‌ها"""
+
+import json
+import os
+
+from render import VARIANTS_DIR, render_outputs, write_outputs
+
+
+def proxies(measured):
+    records = []
+    for i in range(8):
+        record = {'name': f"5.1.2.{i}:1080", 'type': 'socks5', 'server': f"5.1.2.{i}", 'port': 1080,
+                  'is_active': True, 'ping': 100 + i, 'udp_ping': 20}
+        if measured:
+            record['speed_kbps'] = 300 + 50 * i
+        records.append(record)
+    return records
+
+
+def test_dropped_variant_is_removed_from_disk(tmp_path):
+    """نسخه‌ای که از انتخاب خارج می‌شود (bandwidth بدون اندازه‌گیری) از فهرست و دیسک حذف می‌شود"""
+    write_outputs(render_outputs(proxies(measured=True)), str(tmp_path))
+    variants_dir = os.path.join(str(tmp_path), VARIANTS_DIR)
+    assert 'bandwidth.yaml' in os.listdir(variants_dir)
+    
+    write_outputs(render_outputs(proxies(measured=False)), str(tmp_path))
+    with open(os.path.join(variants_dir, 'index.json'), encoding='utf-8') as f:
+        index = json.load(f)['variants']
+    listed = {os.path.basename(entry[kind]) for entry in index.values() for kind in ['clash', 'subscription']}
+    assert 'bandwidth' not in index
+    assert set(os.listdir(variants_dir)) == listed | {'index.json'}